@@ -0,0 +1,54 @@
+import os
+
+# Storage backend: "memory" (default, also used by the tests) or "sqlite"
+STORAGE_BACKEND = os.getenv("RECIPE_STORAGE_BACKEND", "memory")
+SQLITE_PATH = os.getenv("RECIPE_SQLITE_PATH", "recipes.db")
+SQLITE_POOL_SIZE = int(os.getenv("RECIPE_SQLITE_POOL_SIZE", "8"))
+
+# Durability for the memory backend. Without a data directory the store is
+# purely in-memory and starts from the seed recipes.
+DATA_DIR = os.getenv("RECIPE_DATA_DIR") or None
+WAL_FSYNC_POLICY = os.getenv("RECIPE_WAL_FSYNC", "always")  # always, interval or off
+WAL_FSYNC_INTERVAL = float(os.getenv("RECIPE_WAL_FSYNC_INTERVAL", "0.05"))
+SNAPSHOT_INTERVAL = float(os.getenv("RECIPE_SNAPSHOT_INTERVAL", "60"))
+SNAPSHOT_MIN_WRITES = int(os.getenv("RECIPE_SNAPSHOT_MIN_WRITES", "1000"))
+
+# Worker processes validating large imports (more than one batch of 500
+# records); 0 or 1 validates in the request thread
+IMPORT_WORKERS = int(os.getenv("RECIPE_IMPORT_WORKERS", "0"))
+
+# Seconds deleted recipes stay in the change feed as tombstones; clients
+# that sync less often than this fall back to a full export
+CHANGE_RETENTION = float(os.getenv("RECIPE_CHANGE_RETENTION", str(7 * 24 * 3600)))
+
+# max-age sent with cacheable GET responses; clients and CDNs revalidate
+# with If-None-Match / If-Modified-Since once it expires
+CACHE_MAX_AGE = int(os.getenv("RECIPE_CACHE_MAX_AGE", "0"))
+
+# Admission control for expensive routes: how many run at once per lane,
+# how many more may queue, and how long one may wait for a slot before it
+# is shed. "heavy" is import, export and batch; "search" is unpaged search,
+# pantry matching, similar recipes and the change feed.
+HEAVY_CONCURRENCY = int(os.getenv("RECIPE_HEAVY_CONCURRENCY", "2"))
+HEAVY_QUEUE = int(os.getenv("RECIPE_HEAVY_QUEUE", "8"))
+HEAVY_MAX_WAIT = float(os.getenv("RECIPE_HEAVY_MAX_WAIT", "30"))
+SEARCH_CONCURRENCY = int(os.getenv("RECIPE_SEARCH_CONCURRENCY", "8"))
+SEARCH_QUEUE = int(os.getenv("RECIPE_SEARCH_QUEUE", "32"))
+SEARCH_MAX_WAIT = float(os.getenv("RECIPE_SEARCH_MAX_WAIT", "2"))
+# Worker threads kept for everything else; the pool gets the lanes'
+# concurrency on top, so admitted heavy work never takes these
+THREADPOOL_SIZE = int(os.getenv("RECIPE_THREADPOOL_SIZE", "40"))
+
+# Popular recipes: a view counts half as much after VIEW_HALF_LIFE seconds;
+# per-thread view counts are merged at most every VIEW_FLUSH_INTERVAL
+VIEW_HALF_LIFE = float(os.getenv("RECIPE_VIEW_HALF_LIFE", str(6 * 3600)))
+VIEW_FLUSH_INTERVAL = float(os.getenv("RECIPE_VIEW_FLUSH_INTERVAL", "5"))
+
+# Memory cap for the rendered HTML page cache
+PAGE_CACHE_MAX_BYTES = int(os.getenv("RECIPE_PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Application logging. Debug output is off unless the level is lowered;
+# LOG_SAMPLE_RATE keeps only that fraction of DEBUG/INFO records so it can
+# be left on under load.
+LOG_LEVEL = os.getenv("RECIPE_LOG_LEVEL", "WARNING").upper()
+LOG_SAMPLE_RATE = float(os.getenv("RECIPE_LOG_SAMPLE_RATE", "1.0"))
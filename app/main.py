@@ -1,7 +1,18 @@
+from contextlib import asynccontextmanager
+import time
+import anyio.to_thread
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from app.config import (
+    HEAVY_CONCURRENCY, HEAVY_MAX_WAIT, HEAVY_QUEUE, SEARCH_CONCURRENCY, SEARCH_MAX_WAIT,
+    SEARCH_QUEUE, THREADPOOL_SIZE,
+)
 from app.routes import api, pages
+from app.services import metrics
+from app.services.admission import SHED_STATUS, AdmissionControl, Lane
+from app.services.storage import recipe_storage
 import os
 
 # App configuration
@@ -9,8 +20,135 @@ APP_NAME = "Recipe Explorer"
 VERSION = "1.0.0"
 DEBUG = True
 
+# Expensive routes run in lanes with their own concurrency limits and
+# queues; everything else is admitted straight away
+admission = AdmissionControl(
+    lanes=[
+        Lane("heavy", HEAVY_CONCURRENCY, HEAVY_QUEUE, HEAVY_MAX_WAIT),
+        Lane("search", SEARCH_CONCURRENCY, SEARCH_QUEUE, SEARCH_MAX_WAIT),
+    ],
+    rules=[
+        ("POST", "/api/recipes/import", "heavy"),
+        ("GET", "/api/recipes/export", "heavy"),
+        ("POST", "/api/recipes/batch", "heavy"),
+        ("GET", "/api/recipes/search", "search"),
+        ("POST", "/api/recipes/match", "search"),
+        ("GET", "/api/recipes/{recipe_id}/similar", "search"),
+        ("GET", "/api/recipes/changes", "search"),
+    ],
+)
+metrics.register_collector(admission.metrics)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync handlers share one threadpool; size it so requests outside the
+    # lanes keep THREADPOOL_SIZE threads however busy the lanes are
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = THREADPOOL_SIZE + sum(lane.limit for lane in admission.lanes.values())
+    yield
+    # Flush the write-ahead log / close database connections
+    recipe_storage.close()
+
+
+class MetricsMiddleware:
+    """Records latency and request/response body sizes per route.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses are
+    measured to their last byte and nothing is buffered. Routes are labelled
+    by their path template, so /api/recipes/{recipe_id} is one series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def counting_receive():
+            message = await receive()
+            sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            # The router fills in the matched route as it dispatches
+            route = scope.get("route")
+            if route is not None:
+                path = route.path
+            else:
+                # Shed requests never reach the router and carry the path
+                # template of their admission rule instead. Raw paths of
+                # unmatched requests (404s, scanners) would make the number
+                # of label values unbounded.
+                path = scope.get("admission_route", "unmatched")
+            labels = {"method": scope["method"], "route": path}
+            metrics.REQUEST_LATENCY.observe(
+                time.perf_counter() - started, status=str(status["code"]), **labels)
+            metrics.REQUEST_SIZE.observe(sizes["request"], **labels)
+            metrics.RESPONSE_SIZE.observe(sizes["response"], **labels)
+
+
+class AdmissionMiddleware:
+    """Holds requests to laned routes until their lane has a free slot.
+
+    Runs on the event loop before the route, so queued and shed requests
+    never occupy a worker thread. The slot is held until the response has
+    been sent, which covers streamed exports. Shed requests get 429 (queue
+    full) or 503 (would wait too long) with a Retry-After estimated from
+    the lane's recent service times.
+    """
+
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        rule = None
+        if scope["type"] == "http":
+            rule = self.control.rule_for(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        template, lane = rule
+        shed = await lane.acquire()
+        if shed is not None:
+            # For MetricsMiddleware, as the router won't set scope["route"]
+            scope["admission_route"] = template
+            detail = ("Too many requests queued" if shed.reason == "queue_full"
+                      else "Server busy") + f" for {lane.name} operations; retry later"
+            response = JSONResponse({"detail": detail}, status_code=SHED_STATUS[shed.reason],
+                                    headers={"Retry-After": str(shed.retry_after)})
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.perf_counter() - started)
+
+
 # Create FastAPI app
-app = FastAPI(title=APP_NAME, version=VERSION)
+app = FastAPI(title=APP_NAME, version=VERSION, lifespan=lifespan)
+# Added first so it runs inside MetricsMiddleware, which then records shed
+# requests under the route their lane rule matched
+app.add_middleware(AdmissionMiddleware, control=admission)
+app.add_middleware(MetricsMiddleware)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -24,6 +162,11 @@ app.include_router(pages.router)
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition of request, storage and cache metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # @app.get("/status")
 # def status():
 #     return {"status": "ok", "version": "1.0.0"}
@@ -6,7 +6,10 @@ from typing import List, Optional
 # adding a temp comment to push commit in order to test checks
 
 class Recipe(BaseModel):
-    model_config = ConfigDict()
+    # Handed out of storage, not kept in it: the memory store holds compact
+    # RecipeRecords (app/services/records.py) and SQLite holds JSON. Still
+    # never modified in place; updates create a new instance with a new version
+    model_config = ConfigDict(frozen=True)
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -18,6 +21,7 @@ class Recipe(BaseModel):
     difficulty: str
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+    version: int = 1  # Bumped on every update, used for If-Match / ETags
 
 class RecipeCreate(BaseModel):
     title: str
@@ -36,3 +40,35 @@ class RecipeUpdate(BaseModel):
     cuisine: Optional[str] = None  # New field for cuisine/region
     tags: Optional[List[str]] = None
     difficulty: Optional[str] = None
+
+class ImportRejection(BaseModel):
+    index: int  # Position of the record in the uploaded file
+    reason: str
+
+class ImportReport(BaseModel):
+    mode: str
+    count: int
+    rejected_count: int = 0
+    rejected: List[ImportRejection] = []
+
+class BatchResult(BaseModel):
+    index: int  # Position of the operation in the request
+    op: Optional[str] = None
+    id: Optional[str] = None
+    # created, updated, deleted, not_found, conflict or invalid
+    status: str
+    version: Optional[int] = None  # Recipe version after the operation
+    error: Optional[str] = None
+
+class BatchReport(BaseModel):
+    count: int  # Operations applied
+    failed_count: int = 0
+    results: List[BatchResult] = []
+
+class PantryRequest(BaseModel):
+    # Free text like the recipe lines, e.g. "2 eggs" or "russet potatoes"
+    ingredients: List[str] = Field(..., min_length=1)
+    # Same bounds as pantry.DEFAULT_MATCHES and MAX_MATCHES
+    limit: int = Field(20, ge=1, le=100)
+    # Leave out recipes lacking more ingredients than this
+    max_missing: Optional[int] = Field(None, ge=0)
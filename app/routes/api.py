@@ -1,141 +1,382 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
-from typing import List, Optional
-import json
-from app.models import Recipe, RecipeCreate, RecipeUpdate
-from app.services.storage import recipe_storage
+from fastapi import APIRouter, Body, HTTPException, UploadFile, File, Form, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Any, Iterable, Iterator, List, Optional
+from app.models import BatchReport, PantryRequest, Recipe, RecipeCreate, RecipeUpdate
+from app.services.batch import MAX_BATCH_SIZE, batch_report, validate_operations
+from app.services.changes import DEFAULT_CHANGES, MAX_CHANGES, encode_change
+from app.services.encoding import RecipeListResponse, with_members
+from app.services.errors import ChangesExpired, VersionConflict
+from app.services.http_cache import (
+    cache_headers, collection_etag, etag_matches, is_not_modified, not_modified, recipe_etag,
+    similar_etag,
+)
+from app.services.importer import ImportParseError, iter_records
+from app.services.log import get_logger
+from app.services.metrics import time_storage
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from app.services.pantry import MAX_PANTRY_ITEMS
+from app.services.popularity import DEFAULT_POPULAR, MAX_POPULAR
+from app.services.projections import Projection, parse_projection
+from app.services.similarity import DEFAULT_SIMILAR, MAX_SIMILAR
+from app.services.storage import recipe_storage, recipe_views
+from app.services.suggest import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
 
 router = APIRouter(prefix="/api")
+logger = get_logger(__name__)
 
-# Debug on module load
-print(f"API module loaded. Storage instance ID: {id(recipe_storage)}")
-print(f"Storage has {len(recipe_storage.recipes)} recipes on load")
+
+def _projection(view: str, fields: Optional[str]) -> Projection:
+    try:
+        return parse_projection(view, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/recipes")
-def get_recipes(search: Optional[str] = None):
-    """Get all recipes or search by title, ingredients, and cuisine"""
-    # TODO: Add pagination when we have more than 100 recipes
-    print(f"DEBUG: get_recipes called with search='{search}'")
-    print(f"DEBUG: Storage instance ID: {id(recipe_storage)}")
-    print(f"DEBUG: Storage has {len(recipe_storage.recipes)} recipes in storage")
-    print(f"DEBUG: Storage keys: {list(recipe_storage.recipes.keys())}")
-    
-    recipes = recipe_storage.get_all_recipes()
-    print(f"DEBUG: get_all_recipes() returned {len(recipes)} recipes")
+def get_recipes(
+    request: Request,
+    search: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    cuisine: List[str] = Query([]),
+    difficulty: List[str] = Query([]),
+    tag: List[str] = Query([]),
+    match: str = Query("any", pattern="^(any|all)$"),
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
+):
+    """Get a page of recipes, optionally searching every recipe text field.
+
+    Search results are ranked by relevance, with tolerance for typos.
+
+    cuisine, difficulty and tag filters can be repeated; values of one facet
+    match "any" (default) or "all" of them, and different facets are ANDed.
+    The response carries facet counts for the whole filtered result set.
+
+    view=summary sends recipe cards (counts instead of ingredient and
+    instruction lists, a shortened description); fields=title,tags sends
+    just those fields and the id.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = _projection(view, fields)
     
-    if search:
-        print(f"DEBUG: Applying search filter for '{search}'")
-        # Use the same search logic as /recipes/search
-        terms = search.lower().strip().split()
-        filtered = []
-
-        for recipe in recipes:
-            # Include cuisine in search haystack
-            haystack = " ".join(
-                [recipe.title, recipe.cuisine] + recipe.ingredients
-            ).lower()
-
-            if all(term in haystack for term in terms):
-                filtered.append(recipe)
-
-        recipes = filtered
-        print(f"DEBUG: After search filter: {len(recipes)} recipes")
+    # Read the generation before the data so the ETag can only be older
+    # than the body, never newer
+    headers = cache_headers(collection_etag(recipe_storage.generation))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
     
-    # Log for debugging (remove in production)
-    print(f"DEBUG: Returning {len(recipes)} recipes")
+    # Same index-backed search as /recipes/search
+    filters = {"cuisine": cuisine, "difficulty": difficulty, "tag": tag}
+    try:
+        with time_storage("search" if search else "list"):
+            page = recipe_storage.get_page(limit, after=after, query=search, filters=filters,
+                                           match=match, facets=True, projection=projection)
+    except ValueError:
+        # A listing cursor sent with a search, or the other way round
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    logger.debug("get_recipes search=%r returned %d of %d recipes",
+                 search, len(page.recipes), page.total)
     
-    return {"recipes": recipes}
+    return RecipeListResponse(page.recipes, {
+        "next_cursor": encode_cursor(page.next_key) if page.next_key else None,
+        "total": page.total,
+        "facets": page.facets,
+    }, headers=headers)
 
 
 @router.get("/recipes/search")
-def search_recipes(query: Optional[str] = None):  # Changed from 'search' to 'query'
-    """Search recipes by query parameter"""
-    recipes = recipe_storage.get_all_recipes()
-
+def search_recipes(request: Request, query: Optional[str] = None,  # Changed from 'search' to 'query'
+                   view: str = Query("full", pattern="^(full|summary)$"), fields: Optional[str] = None):
+    """Search recipes by query parameter; view and fields work as for /recipes"""
+    projection = _projection(view, fields)
+    headers = cache_headers(collection_etag(recipe_storage.generation))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
     if query:  # Changed from 'search' to 'query'
-        terms = query.lower().strip().split()
-        filtered = []
+        with time_storage("search"):
+            recipes = recipe_storage.search_recipes(query, projection=projection)
+    else:
+        recipes = recipe_storage.get_all_recipes(projection=projection)
+
+    logger.debug("search_recipes query=%r returned %d recipes", query, len(recipes))
+    return RecipeListResponse(recipes, headers=headers)
+
+
+@router.get("/recipes/suggest")
+def suggest_recipes(request: Request, prefix: str = Query(..., min_length=1, max_length=100),
+                    limit: int = Query(DEFAULT_SUGGESTIONS, ge=1, le=MAX_SUGGESTIONS)):
+    """Typeahead: titles, ingredients, cuisines and tags starting with prefix, most common first"""
+    headers = cache_headers(collection_etag(recipe_storage.generation))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    suggestions = recipe_storage.suggest(prefix, limit)
+    return JSONResponse({
+        "prefix": prefix,
+        "suggestions": [suggestion._asdict() for suggestion in suggestions],
+    }, headers=headers)
+
+
+@router.get("/recipes/changes")
+def get_changes(request: Request, since: int = Query(0, ge=0),
+                limit: int = Query(DEFAULT_CHANGES, ge=1, le=MAX_CHANGES)):
+    """Delta sync: what changed after sequence number since, oldest first.
+
+    Each recipe appears once, with its latest change: an upsert carrying
+    the whole recipe, or a delete. Pass next_since back as since to
+    continue; has_more says whether to ask again right away. Start from
+    since=0, or from the X-Change-Seq header of an export. A since older
+    than the tombstone retention window gets 410, and the client has to
+    start over from an export.
+    """
+    headers = cache_headers(collection_etag(recipe_storage.generation))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    try:
+        with time_storage("changes"):
+            page = recipe_storage.get_changes(since, limit)
+    except ChangesExpired as e:
+        raise HTTPException(status_code=410, detail=f"{e}; start over from /api/recipes/export")
+    return RecipeListResponse(
+        (encode_change(change, recipe) for change, recipe in page.changes),
+        {"next_since": page.next_since, "has_more": page.has_more},
+        headers=headers, key="changes",
+    )
+
+
+@router.post("/recipes/match")
+def match_recipes(pantry: PantryRequest, view: str = Query("full", pattern="^(full|summary)$"),
+                  fields: Optional[str] = None):
+    """What can I cook: recipes ranked by how much of their ingredient list
+    the pantry covers, then by fewest missing ingredients.
+
+    Pantry items and recipe ingredients are compared after normalization
+    (no amounts, units or preparation, singular), and a one-word item like
+    "potatoes" also covers "russet potatoes". Each recipe comes back with
+    matched_count, missing_count, coverage and its missing ingredients;
+    view and fields work as for /recipes.
+    """
+    if len(pantry.ingredients) > MAX_PANTRY_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_PANTRY_ITEMS} pantry items")
+    projection = _projection(view, fields)
+    
+    with time_storage("match"):
+        results, total = recipe_storage.match_pantry(pantry.ingredients, pantry.limit,
+                                                     pantry.max_missing, projection=projection)
+    recipes = [
+        with_members(recipe, {
+            "matched_count": match.matched,
+            "missing_count": len(match.missing),
+            "coverage": round(match.coverage, 4),
+            "missing": list(match.missing),
+        })
+        for match, recipe in results
+    ]
+    return RecipeListResponse(recipes, {"total": total})
 
-        for recipe in recipes:
-            # Include cuisine in search haystack
-            haystack = " ".join(
-                [recipe.title, recipe.cuisine] + recipe.ingredients
-            ).lower()
 
-            if all(term in haystack for term in terms):
-                filtered.append(recipe)
+def _iter_json_array(recipes: Iterable[Recipe]) -> Iterator[str]:
+    """Yield a JSON array one recipe at a time"""
+    yield "["
+    for i, recipe in enumerate(recipes):
+        yield ("," if i else "") + recipe.model_dump_json()
+    yield "]"
 
-        recipes = filtered
 
-    print(f"Returning {len(recipes)} recipes")
-    return {"recipes": recipes}
+def _iter_ndjson(recipes: Iterable[Recipe]) -> Iterator[str]:
+    """Yield one JSON document per line"""
+    for recipe in recipes:
+        yield recipe.model_dump_json() + "\n"
+
+
+def _timed(chunks: Iterator[str], operation: str) -> Iterator[str]:
+    """Time a streamed response body from first to last chunk"""
+    with time_storage(operation):
+        yield from chunks
 
 
 @router.get("/recipes/export")
-def export_recipes():
-    """Export all recipes as JSON"""
-    recipes = recipe_storage.get_all_recipes()
-    # Convert to dict for JSON serialization
-    recipes_dict = [recipe.model_dump() for recipe in recipes]  # Changed from .dict() to .model_dump()
-    return JSONResponse(content=recipes_dict)
+def export_recipes(format: str = Query("json", pattern="^(json|ndjson)$")):
+    """Export all recipes as a streamed JSON array or NDJSON.
+
+    X-Change-Seq is where a change feed reader picks up after the export.
+    """
+    # Read before the snapshot: changes in between are sent twice, never missed
+    change_seq = str(recipe_storage.change_seq)
+    # Take the snapshot up front so writes during the download don't leak in
+    recipes = recipe_storage.snapshot()
+    # Runs however the response ends, even if the client leaves before the
+    # first chunk and the body is never iterated
+    release = BackgroundTask(recipes.close)
+    if format == "ndjson":
+        return StreamingResponse(
+            _timed(_iter_ndjson(recipes), "export"),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=recipes.ndjson",
+                     "X-Change-Seq": change_seq},
+            background=release,
+        )
+    return StreamingResponse(
+        _timed(_iter_json_array(recipes), "export"),
+        media_type="application/json",
+        headers={"Content-Disposition": "attachment; filename=recipes.json",
+                 "X-Change-Seq": change_seq},
+        background=release,
+    )
 
 
 @router.post("/recipes/import")
-async def import_recipes(file: UploadFile = File(...)):
-    """Import recipes from JSON file"""
+def import_recipes(
+    file: UploadFile = File(...),
+    mode: str = Form("replace", pattern="^(replace|merge)$"),
+):
+    """Import recipes from a JSON array or NDJSON file.
+
+    The upload is parsed incrementally; "replace" swaps the whole catalog,
+    "merge" upserts by id. Rejected rows are listed in the response.
+    """
     try:
-        content = await file.read()
-        recipes_data = json.loads(content)
-        
-        print(f"DEBUG: Import - Storage instance ID: {id(recipe_storage)}")
-        print(f"DEBUG: Importing {len(recipes_data)} recipes from {file.filename}")
-        
-        # Use the storage service's import method instead of direct assignment
-        count = recipe_storage.import_recipes(recipes_data)
+        with time_storage("import"):
+            report = recipe_storage.import_recipes(iter_records(file.file), mode=mode)
         
-        print(f"DEBUG: Successfully imported {count} recipes")
-        print(f"DEBUG: Total recipes in storage: {len(recipe_storage.recipes)}")
-        print(f"DEBUG: Storage keys after import: {list(recipe_storage.recipes.keys())}")
+        logger.info("Imported %d recipes from %s (mode=%s), rejected %d",
+                    report.count, file.filename, mode, report.rejected_count)
         
-        return {"message": f"Successfully imported {count} recipes", "count": count}
+        return {"message": f"Successfully imported {report.count} recipes", **report.model_dump()}
     
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON file")
+    except ImportParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON file: {e}")
     except Exception as e:
-        print(f"DEBUG: Import failed with error: {str(e)}")
+        logger.warning("Import of %s failed: %s", file.filename, e)
         raise HTTPException(status_code=400, detail=f"Import failed: {str(e)}")
 
 
+@router.post("/recipes/batch", response_model=BatchReport)
+def batch_recipes(operations: List[Any] = Body(...)):
+    """Apply a list of create, update and delete operations in one write.
+
+    Every operation is validated before any is applied; invalid ones are
+    reported and skipped. The rest apply independently, so a missing
+    recipe or stale version only fails its own operation. Results come
+    back in request order.
+    """
+    if len(operations) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} operations per batch")
+    
+    valid, rejected = validate_operations(operations)
+    with time_storage("batch"):
+        results = recipe_storage.apply_batch(valid)
+    report = batch_report(rejected + results)
+    logger.info("Applied %d of %d batch operations", report.count, len(operations))
+    return report
+
+
+@router.get("/recipes/popular")
+def popular_recipes(limit: int = Query(DEFAULT_POPULAR, ge=1, le=MAX_POPULAR),
+                    view: str = Query("full", pattern="^(full|summary)$"),
+                    fields: Optional[str] = None):
+    """Most viewed recipes, with recent views counting most, each with its
+    decayed view count as views; view and fields work as for /recipes"""
+    projection = _projection(view, fields)
+    # The whole ranking, not just limit: it may still hold deleted recipes
+    ranked = recipe_views.top(2 * MAX_POPULAR)
+    found = recipe_storage.get_many([recipe_id for recipe_id, _ in ranked], projection=projection)
+    popular = [(found[recipe_id], views) for recipe_id, views in ranked if recipe_id in found][:limit]
+    return RecipeListResponse([with_members(recipe, {"views": round(views, 2)})
+                               for recipe, views in popular])
+
+
 @router.get("/recipes/{recipe_id}")
-def get_recipe(recipe_id: str):
+def get_recipe(recipe_id: str, request: Request):
     """Get a specific recipe by ID"""
-    recipe = recipe_storage.get_recipe(recipe_id)
+    recipe = recipe_storage.get_encoded_recipe(recipe_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return recipe
+    # Revalidations count too: the client is looking at the recipe again
+    recipe_views.record(recipe_id)
+    
+    headers = cache_headers(recipe_etag(recipe), recipe.updated_at)
+    if is_not_modified(request, headers["ETag"], recipe.updated_at):
+        return not_modified(headers)
+    # Sent as stored: the body was encoded once for this version
+    return Response(recipe.body, media_type="application/json", headers=headers)
+
+
+@router.get("/recipes/{recipe_id}/similar")
+def similar_recipes(recipe_id: str, request: Request,
+                    limit: int = Query(DEFAULT_SIMILAR, ge=1, le=MAX_SIMILAR),
+                    view: str = Query("full", pattern="^(full|summary)$"),
+                    fields: Optional[str] = None):
+    """Recipes most like this one by ingredients, tags and cuisine, each with
+    its cosine similarity as score; view and fields work as for /recipes"""
+    projection = _projection(view, fields)
+    # Neighbours change with any write, so this validates like a list, and
+    # also with a rebuild of the similarity index
+    headers = cache_headers(similar_etag(recipe_storage.generation,
+                                         recipe_storage.similar_generation))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    with time_storage("similar"):
+        similar = recipe_storage.similar_recipes(recipe_id, limit, projection=projection)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    recipes = [with_members(recipe, {"score": round(score, 4)}) for recipe, score in similar]
+    return RecipeListResponse(recipes, headers=headers)
 
 
 @router.post("/recipes")
-def create_recipe(recipe: RecipeCreate):
+def create_recipe(recipe: RecipeCreate, response: Response):
     """Create a new recipe"""
     new_recipe = recipe_storage.create_recipe(recipe)
+    response.headers["ETag"] = recipe_etag(new_recipe)
     return new_recipe
 
 
+def _expected_version(recipe_id: str, if_match: Optional[str]) -> Optional[int]:
+    """Version an If-Match header pins the write to, or None without one"""
+    if if_match is None:
+        return None
+    current = recipe_storage.get_recipe(recipe_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    if not etag_matches(if_match, recipe_etag(current)):
+        raise HTTPException(status_code=412, detail="Recipe has been modified")
+    return current.version
+
+
 @router.put("/recipes/{recipe_id}")
-def update_recipe(recipe_id: str, recipe: RecipeUpdate):
-    """Update an existing recipe"""
-    updated_recipe = recipe_storage.update_recipe(recipe_id, recipe)
+def update_recipe(recipe_id: str, recipe: RecipeUpdate, response: Response,
+                  if_match: Optional[str] = Header(None)):
+    """Update an existing recipe, optionally only if it still matches If-Match"""
+    try:
+        updated_recipe = recipe_storage.update_recipe(
+            recipe_id, recipe, expected_version=_expected_version(recipe_id, if_match)
+        )
+    except VersionConflict:
+        raise HTTPException(status_code=412, detail="Recipe has been modified")
     if not updated_recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    response.headers["ETag"] = recipe_etag(updated_recipe)
     return updated_recipe
 
 
 @router.delete("/recipes/{recipe_id}")
-def delete_recipe(recipe_id: str):
+def delete_recipe(recipe_id: str, if_match: Optional[str] = Header(None)):
     """Delete a recipe"""
-    success = recipe_storage.delete_recipe(recipe_id)
+    try:
+        success = recipe_storage.delete_recipe(
+            recipe_id, expected_version=_expected_version(recipe_id, if_match)
+        )
+    except VersionConflict:
+        raise HTTPException(status_code=412, detail="Recipe has been modified")
     if not success:
         return {"error": "Recipe not found", "status": "failed"}
     return {"message": "Recipe deleted successfully", "status": "success"}  # Added status field inconsistently
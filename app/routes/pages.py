@@ -1,27 +1,96 @@
 from fastapi import APIRouter, Request, Form, HTTPException, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from typing import List, Optional
+from typing import Callable, List, Optional
+from app.config import PAGE_CACHE_MAX_BYTES
 from app.models import RecipeCreate, RecipeUpdate
-from app.services.storage import recipe_storage
+from app.services import metrics
+from app.services.http_cache import (
+    cache_headers, collection_etag, html_etag, is_not_modified, not_modified, recipe_etag,
+    related_etag,
+)
+from app.services.page_cache import PageCache
+from app.services.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from app.services.projections import CARD
+from app.services.similarity import RELATED_ON_PAGE
+from app.services.storage import recipe_storage, recipe_views
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
+# Rendered pages, evicted as soon as a write touches what they show
+page_cache = PageCache(max_bytes=PAGE_CACHE_MAX_BYTES)
+recipe_storage.subscribe(page_cache.invalidate)
+recipe_storage.subscribe_similar(lambda: page_cache.invalidate_pages("detail"))
+
+
+def _page_cache_metrics():
+    stats = page_cache.stats()
+    return [
+        ("page_cache_requests_total", "counter", "Page cache lookups by result",
+         {(("result", "hit"),): stats["hits"], (("result", "miss"),): stats["misses"]}),
+        ("page_cache_evictions_total", "counter", "Pages evicted to stay under the memory cap",
+         {(): stats["evictions"]}),
+        ("page_cache_entries", "gauge", "Cached pages", {(): stats["entries"]}),
+        ("page_cache_bytes", "gauge", "Bytes of cached pages", {(): stats["bytes"]}),
+    ]
+
+
+metrics.register_collector(_page_cache_metrics)
+
+
+def _render_cached(request: Request, key: tuple, name: str,
+                   build_context: Callable[[], dict], headers: dict) -> HTMLResponse:
+    """Serve a template from the page cache, rendering it on a miss.
+
+    The key must pin down everything the page shows (query, generation
+    or version); the base URL is added because url_for output depends on it.
+    """
+    key = key + (str(request.base_url),)
+    body = page_cache.get(key)
+    if body is None:
+        response = templates.TemplateResponse(request, name, build_context())
+        body = response.body
+        page_cache.put(key, body)
+    return HTMLResponse(body, headers=headers)
+
 
 @router.get("/", response_class=HTMLResponse)
-def home(request: Request, search: Optional[str] = None, message: Optional[str] = None):
-    """Home page with recipe list and search"""
-    if search:
-        recipes = recipe_storage.search_recipes(search)
-    else:
-        recipes = recipe_storage.get_all_recipes()
+def home(request: Request, search: Optional[str] = None, message: Optional[str] = None,
+         cursor: Optional[str] = None):
+    """Home page with recipe list and search, one page at a time"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        after = None
     
-    return templates.TemplateResponse(request, "index.html", {
-        "recipes": recipes,
-        "search_query": search or "",
-        "message": message
-    })
+    generation = recipe_storage.generation
+    headers = cache_headers(html_etag(collection_etag(generation)))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    def build_context():
+        with metrics.time_storage("search" if search else "list"):
+            try:
+                page = recipe_storage.get_page(DEFAULT_PAGE_SIZE, after=after, query=search,
+                                               projection=CARD)
+            except ValueError:
+                # A cursor left over from before the search changed
+                page = recipe_storage.get_page(DEFAULT_PAGE_SIZE, query=search, projection=CARD)
+        return {
+            "recipes": page.recipes,
+            "total": page.total,
+            "next_cursor": encode_cursor(page.next_key) if page.next_key else None,
+            "is_first_page": after is None,
+            "search_query": search or "",
+            "message": message
+        }
+    
+    if message:
+        # One-off flash pages aren't worth caching
+        return templates.TemplateResponse(request, "index.html", build_context(), headers=headers)
+    key = ("home", None, search or "", after, generation)
+    return _render_cached(request, key, "index.html", build_context, headers)
 
 
 @router.get("/recipes/new", response_class=HTMLResponse)
@@ -39,11 +108,32 @@ def recipe_detail(request: Request, recipe_id: str, message: Optional[str] = Non
     recipe = recipe_storage.get_recipe(recipe_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    recipe_views.record(recipe_id)
     
-    return templates.TemplateResponse(request, "recipe_detail.html", {
-        "recipe": recipe,
-        "message": message
-    })
+    # "You might also like" is part of the page. Any write or similarity
+    # index rebuild can change which recipes it shows, so the two
+    # generations stand in for them in the ETag and the cache key, and
+    # revalidations and cache hits never run the similarity query. Without
+    # the list there is no honest Last-Modified.
+    etag = related_etag(recipe_etag(recipe), recipe_storage.generation,
+                        recipe_storage.similar_generation)
+    headers = cache_headers(html_etag(etag))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    def build_context():
+        similar = recipe_storage.similar_recipes(recipe_id, RELATED_ON_PAGE) or []
+        return {
+            "recipe": recipe,
+            "related": [other for other, _ in similar],
+            "message": message
+        }
+    
+    if message:
+        return templates.TemplateResponse(request, "recipe_detail.html", build_context(), headers=headers)
+    # Filed under no single recipe: every write makes it stale
+    key = ("detail", None, recipe.id, etag)
+    return _render_cached(request, key, "recipe_detail.html", build_context, headers)
 
 
 @router.get("/recipes/{recipe_id}/edit", response_class=HTMLResponse)
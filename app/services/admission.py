@@ -0,0 +1,152 @@
+import asyncio
+import math
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from starlette.routing import compile_path
+
+# Why a request was turned away, and the status it gets
+SHED_STATUS = {"queue_full": 429, "deadline": 503}
+
+# Weight of the newest request in a lane's average service time
+_SMOOTHING = 0.2
+
+
+class Shed(NamedTuple):
+    reason: str  # a SHED_STATUS key
+    retry_after: int  # seconds
+
+
+class Lane:
+    """Concurrency limit plus a bounded FIFO queue for one class of requests.
+
+    At most `limit` requests of the lane run at once; the next `queue_size`
+    wait their turn and any more are shed straight away (429). A waiting
+    request is shed (503) once it has waited `max_wait` seconds, or up front
+    if the lane's average service time says it would. Shed requests never
+    reach a worker thread, so a backlog of heavy requests can't starve the
+    threadpool that serves everything else.
+
+    Lanes live on the event loop and are only touched from it, so they need
+    no locks; metrics read their counters from other threads.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = dict.fromkeys(SHED_STATUS, 0)
+        self.service_time = 0.0  # moving average, seconds
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the request at this queue position (1 = next) starts"""
+        return math.ceil(position / self.limit) * self.service_time
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait(self.queued + 1)))
+
+    async def acquire(self) -> Optional[Shed]:
+        """Wait for a slot; returns why the request was shed if it gets none"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return self._shed("queue_full")
+        if self.expected_wait(len(self._waiters) + 1) > self.max_wait:
+            return self._shed("deadline")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            return self._shed("deadline")
+        except BaseException:
+            # The client went away while queued
+            self._abandon(future)
+            raise
+        self.admitted += 1
+        return None
+
+    def release(self, elapsed: Optional[float] = None):
+        """Free a slot, handing it straight to the next waiter if there is one"""
+        if elapsed is not None:
+            self.service_time += _SMOOTHING * (elapsed - self.service_time)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _abandon(self, future: asyncio.Future):
+        if future.done() and not future.cancelled():
+            # Handed a slot just as it gave up; pass it on
+            self.release()
+            return
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _shed(self, reason: str) -> Shed:
+        self.shed[reason] += 1
+        return Shed(reason, self.retry_after())
+
+
+class AdmissionControl:
+    """Routes requests to lanes by method and path template.
+
+    Requests matching no rule are admitted without limits, so health
+    checks and point reads never queue behind expensive work.
+    """
+
+    def __init__(self, lanes: List[Lane], rules: List[Tuple[str, str, str]]):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self._rules: List[Tuple[str, Pattern, str, Lane]] = [
+            (method, compile_path(path)[0], path, self.lanes[lane]) for method, path, lane in rules
+        ]
+
+    def rule_for(self, method: str, path: str) -> Optional[Tuple[str, Lane]]:
+        """The path template and lane of the rule a request matches"""
+        for rule_method, pattern, template, lane in self._rules:
+            if rule_method == method and pattern.match(path):
+                return template, lane
+        return None
+
+    def lane_for(self, method: str, path: str) -> Optional[Lane]:
+        rule = self.rule_for(method, path)
+        return rule[1] if rule is not None else None
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"active": lane.active, "queued": lane.queued, "admitted": lane.admitted,
+                   "service_time": lane.service_time, **{f"shed_{reason}": count
+                                                         for reason, count in lane.shed.items()}}
+            for name, lane in self.lanes.items()
+        }
+
+    def metrics(self):
+        """Collector for metrics.register_collector"""
+        lanes = self.lanes.values()
+        return [
+            ("admission_active_requests", "gauge", "Requests running per lane",
+             {(("lane", lane.name),): lane.active for lane in lanes}),
+            ("admission_queue_depth", "gauge", "Requests waiting per lane",
+             {(("lane", lane.name),): lane.queued for lane in lanes}),
+            ("admission_admitted_total", "counter", "Requests admitted per lane",
+             {(("lane", lane.name),): lane.admitted for lane in lanes}),
+            ("admission_shed_total", "counter", "Requests shed per lane and reason",
+             {(("lane", lane.name), ("reason", reason)): count
+              for lane in lanes for reason, count in lane.shed.items()}),
+        ]
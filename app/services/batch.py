@@ -0,0 +1,82 @@
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from app.models import BatchReport, BatchResult, RecipeCreate, RecipeUpdate
+from app.services.importer import describe_error
+
+BATCH_OPS = ("create", "update", "delete")
+# Result statuses of operations that changed the store
+BATCH_APPLIED = ("created", "updated", "deleted")
+# Cap on operations per /api/recipes/batch request
+MAX_BATCH_SIZE = 1000
+
+
+class BatchOperation(NamedTuple):
+    index: int
+    op: str
+    recipe_id: Optional[str]  # None for creates
+    data: Union[RecipeCreate, RecipeUpdate, None]  # None for deletes
+    expected_version: Optional[int]
+
+
+def _invalid(index: int, op: Any, recipe_id: Any, error: str) -> BatchResult:
+    return BatchResult(
+        index=index,
+        op=op if isinstance(op, str) else None,
+        id=recipe_id if isinstance(recipe_id, str) else None,
+        status="invalid",
+        error=error,
+    )
+
+
+def validate_operations(raw: List[Any]) -> Tuple[List[BatchOperation], List[BatchResult]]:
+    """Validate every operation of a batch up front, before any is applied.
+
+    Each operation is {"op": "create", "recipe": {...}},
+    {"op": "update", "id": ..., "recipe": {...changed fields}, "version": n}
+    or {"op": "delete", "id": ..., "version": n}; version is optional and
+    works like If-Match. Returns the valid operations and a result for each
+    invalid one.
+    """
+    operations = []
+    rejected = []
+    for index, item in enumerate(raw):
+        if not isinstance(item, dict):
+            rejected.append(_invalid(index, None, None, "Expected a JSON object"))
+            continue
+        op, recipe_id, version = item.get("op"), item.get("id"), item.get("version")
+        if op not in BATCH_OPS:
+            rejected.append(_invalid(index, op, recipe_id, f"op must be one of {', '.join(BATCH_OPS)}"))
+            continue
+        if op == "create" and recipe_id is not None:
+            rejected.append(_invalid(index, op, recipe_id, "create assigns the id; leave it out"))
+            continue
+        if op != "create" and not (isinstance(recipe_id, str) and recipe_id):
+            rejected.append(_invalid(index, op, recipe_id, f"{op} needs the recipe id"))
+            continue
+        if version is not None and (op == "create" or type(version) is not int):
+            rejected.append(_invalid(index, op, recipe_id, "version must be an integer on update or delete"))
+            continue
+
+        data = None
+        if op != "delete":
+            payload = item.get("recipe")
+            if not isinstance(payload, dict):
+                rejected.append(_invalid(index, op, recipe_id, f"{op} needs a recipe object"))
+                continue
+            model = RecipeCreate if op == "create" else RecipeUpdate
+            try:
+                data = model(**payload)
+            except ValidationError as e:
+                rejected.append(_invalid(index, op, recipe_id, describe_error(e)))
+                continue
+        operations.append(BatchOperation(index, op, recipe_id, data, version))
+    return operations, rejected
+
+
+def batch_report(results: List[BatchResult]) -> BatchReport:
+    """Results of a whole batch in request order, with counts"""
+    results = sorted(results, key=lambda result: result.index)
+    applied = sum(result.status in BATCH_APPLIED for result in results)
+    return BatchReport(count=applied, failed_count=len(results) - applied, results=results)
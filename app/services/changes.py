@@ -0,0 +1,146 @@
+import time
+from bisect import bisect_right
+from itertools import islice
+from operator import attrgetter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.services.encoding import dumps
+from app.services.errors import ChangesExpired
+
+# Bounds for the limit parameter of /api/recipes/changes
+DEFAULT_CHANGES = 100
+MAX_CHANGES = 1000
+
+# Superseded entries allowed beyond one per recipe before the log is compacted
+_COMPACT_SLACK = 1024
+
+_seq = attrgetter("seq")
+
+
+class Change(NamedTuple):
+    seq: int
+    recipe_id: str
+    deleted: bool  # a tombstone; otherwise the recipe was created or updated
+    at: float  # time.time() of the change, for tombstone retention
+
+
+class ChangePage(NamedTuple):
+    # Changes in sequence order, each with the recipe's current JSON, or
+    # None for tombstones
+    changes: List[Tuple[Change, Optional[bytes]]]
+    next_since: int  # Pass back as since= to continue
+    has_more: bool
+
+
+class ChangeLog:
+    """Sequenced log of recipe writes, for delta sync.
+
+    Every create, update and delete gets the next sequence number, and a
+    reader asks for everything after the last number it saw. Only the
+    latest change per recipe matters to such a reader, so superseded
+    entries are skipped when reading and dropped when the log is compacted.
+    Tombstones are kept for `retention` seconds; once one has been dropped,
+    `floor` rises to its sequence number and readers that are further
+    behind get ChangesExpired and have to start over from a full export.
+
+    Writers must be serialized by the owner. Readers take no locks: a
+    change is visible in `_latest` before it is appended and `seq` only
+    moves past it after that, so entries up to a `seq` a reader has seen
+    are all in place.
+    """
+
+    def __init__(self, retention: float, seq: int = 0, floor: int = 0,
+                 entries: Iterable[Change] = ()):
+        self.retention = retention
+        self.seq = seq
+        self.floor = floor
+        self._entries: List[Change] = list(entries)
+        # Recipe id -> sequence number of its latest change
+        self._latest: Dict[str, int] = {change.recipe_id: change.seq for change in self._entries}
+        self._expires_at = self._next_expiry()
+
+    @classmethod
+    def from_state(cls, state: Tuple[int, int, List[tuple]], retention: float) -> "ChangeLog":
+        seq, floor, entries = state
+        return cls(retention, seq, floor, (Change(*entry) for entry in entries))
+
+    def state(self) -> Tuple[int, int, List[tuple]]:
+        """Plain-tuple form of the log, as stored in snapshots"""
+        return self.seq, self.floor, [tuple(change) for change in self._entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record(self, recipe_id: str, deleted: bool = False, at: Optional[float] = None) -> int:
+        """Log a write to one recipe and return its sequence number"""
+        now = time.time()
+        at = now if at is None else at
+        seq = self.seq + 1
+        self._latest[recipe_id] = seq
+        self._entries.append(Change(seq, recipe_id, deleted, at))
+        self.seq = seq
+        if deleted:
+            self._expires_at = min(self._expires_at, at + self.retention)
+        if len(self._entries) > 2 * len(self._latest) + _COMPACT_SLACK or now >= self._expires_at:
+            self.compact(now)
+        return seq
+
+    def compact(self, now: Optional[float] = None):
+        """Drop superseded entries and tombstones past the retention window"""
+        now = time.time() if now is None else now
+        cutoff = now - self.retention
+        latest = self._latest
+        floor = self.floor
+        kept = []
+        for change in self._entries:
+            if latest.get(change.recipe_id) != change.seq:
+                continue
+            if change.deleted and change.at < cutoff:
+                floor = change.seq
+                del latest[change.recipe_id]
+                continue
+            kept.append(change)
+        self._entries = kept
+        self.floor = floor
+        self._expires_at = self._next_expiry()
+
+    def _next_expiry(self) -> float:
+        oldest = next((change.at for change in self._entries if change.deleted), None)
+        return float("inf") if oldest is None else oldest + self.retention
+
+    def since(self, seq: int, limit: int) -> Tuple[List[Change], int, bool]:
+        """Up to limit latest changes numbered after seq, the since= to
+        continue from and whether there are more.
+
+        since=0 starts from scratch and is always valid; any other seq below
+        the floor raises ChangesExpired.
+        """
+        head = self.seq
+        entries = self._entries
+        latest = self._latest
+        start = bisect_right(entries, seq, key=_seq)
+        changes = []
+        has_more = False
+        for change in islice(entries, start, None):
+            if change.seq > head:
+                break
+            if latest.get(change.recipe_id) != change.seq:
+                continue
+            if len(changes) == limit:
+                has_more = True
+                break
+            changes.append(change)
+        # Checked last: a compaction during the scan may have dropped
+        # tombstones this reader still needed
+        if 0 < seq < self.floor:
+            raise ChangesExpired(seq, self.floor)
+        next_since = changes[-1].seq if has_more else max(seq, head)
+        return changes, next_since, has_more
+
+
+def encode_change(change: Change, recipe: Optional[bytes]) -> bytes:
+    """A change as sent by the feed: an upsert with the recipe's current
+    JSON, or a delete with just the id"""
+    if recipe is None:
+        return dumps({"seq": change.seq, "op": "delete", "id": change.recipe_id})
+    return dumps({"seq": change.seq, "op": "upsert", "id": change.recipe_id})[:-1] + b',"recipe":' + recipe + b"}"
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime
+from typing import AbstractSet, Any, Dict, Iterable, Mapping, NamedTuple, Optional
+
+from fastapi import Response
+
+from app.models import Recipe
+
+_serializer = Recipe.__pydantic_serializer__
+
+# Characters of the description kept in a summary, as the home page shows it
+SUMMARY_DESCRIPTION_LENGTH = 100
+
+
+class EncodedRecipe(NamedTuple):
+    """A recipe's JSON body plus the fields its cache headers are built from"""
+    id: str
+    version: int
+    updated_at: datetime
+    body: bytes
+
+
+def encode_recipe(recipe: Recipe, include: Optional[AbstractSet[str]] = None) -> bytes:
+    """The recipe (or just the included fields) as JSON bytes, the same as
+    FastAPI would send for the model"""
+    return _serializer.to_json(recipe, include=include)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes with the same settings as JSONResponse"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def snippet(description: str) -> str:
+    """The description cut to SUMMARY_DESCRIPTION_LENGTH characters"""
+    if len(description) > SUMMARY_DESCRIPTION_LENGTH:
+        return description[:SUMMARY_DESCRIPTION_LENGTH] + "..."
+    return description
+
+
+def summarize(recipe: Any) -> Dict[str, Any]:
+    """What a recipe card needs: a Recipe or RecipeRecord without its
+    ingredient and instruction lists, which are reduced to counts, and with
+    the description cut to a snippet (a RecipeRecord keeps its own)"""
+    description = getattr(recipe, "snippet", None)
+    if description is None:
+        description = snippet(recipe.description)
+    return {
+        "id": recipe.id,
+        "title": recipe.title,
+        "description": description,
+        "cuisine": recipe.cuisine,
+        "difficulty": recipe.difficulty,
+        "tags": list(recipe.tags),
+        "ingredient_count": len(recipe.ingredients),
+        "step_count": len(recipe.instructions),
+    }
+
+
+def with_members(encoded: bytes, members: Dict[str, Any]) -> bytes:
+    """Add members to an already encoded JSON object"""
+    return encoded[:-1] + b"," + dumps(members)[1:]
+
+
+class RecipeListResponse(Response):
+    """JSON object whose "recipes" array (or the array named by key) is
+    spliced together from recipes that are already encoded, followed by any
+    other (small) members.
+
+    Saves building a model, a jsonable dict and a json.dumps pass for
+    every recipe in the list.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, recipes: Iterable[bytes], extra: Optional[Dict[str, Any]] = None,
+                 status_code: int = 200, headers: Optional[Mapping[str, str]] = None,
+                 key: str = "recipes"):
+        body = b"{" + dumps(key) + b":[" + b",".join(recipes) + b"]"
+        if extra:
+            body += b"," + dumps(extra)[1:]
+        else:
+            body += b"}"
+        super().__init__(body, status_code=status_code, headers=headers)
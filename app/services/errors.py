@@ -0,0 +1,16 @@
+class VersionConflict(Exception):
+    """A conditional write expected a different version of the recipe"""
+
+    def __init__(self, recipe_id: str, current_version: int):
+        super().__init__(f"Recipe {recipe_id} is at version {current_version}")
+        self.recipe_id = recipe_id
+        self.current_version = current_version
+
+
+class ChangesExpired(Exception):
+    """A change feed reader is behind tombstones that have been compacted away"""
+
+    def __init__(self, since: int, floor: int):
+        super().__init__(f"Changes after {since} are no longer kept; the oldest valid since is {floor}")
+        self.since = since
+        self.floor = floor
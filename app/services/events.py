@@ -0,0 +1,30 @@
+from typing import Callable, List, Optional, Set
+
+# Called with the ids of the recipes a write touched, or None when the
+# whole store changed (import, clear)
+ChangeListener = Callable[[Optional[Set[str]]], None]
+# Called when similar recipes may rank differently with no recipe changed
+# (the similarity index was rebuilt)
+SimilarListener = Callable[[], None]
+
+
+class ChangeNotifier:
+    """Lets caches and derived views subscribe to storage writes"""
+
+    def __init__(self):
+        self._listeners: List[ChangeListener] = []
+        self._similar_listeners: List[SimilarListener] = []
+
+    def subscribe(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def subscribe_similar(self, listener: SimilarListener):
+        self._similar_listeners.append(listener)
+
+    def _notify(self, recipe_ids: Optional[Set[str]]):
+        for listener in self._listeners:
+            listener(recipe_ids)
+
+    def _notify_similar(self):
+        for listener in self._similar_listeners:
+            listener()
@@ -0,0 +1,159 @@
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from app.services.records import RecipeRecord
+
+# Facet names as used in query parameters; "tag" is filed from Recipe.tags
+FACETS = ("cuisine", "difficulty", "tag")
+# How several values of one facet combine; different facets always AND
+FACET_MATCHES = ("any", "all")
+
+FacetCounts = Dict[str, Dict[str, int]]
+
+# Byte-per-bit flags -> ASCII binary digits, so a bitmap is built with a
+# C-level translate and int() instead of shifting a big int per bit
+_FLAGS_TO_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def record_facets(record: RecipeRecord) -> Iterator[Tuple[str, str]]:
+    """(facet, value) pairs a recipe is filed under"""
+    yield "cuisine", record.cuisine
+    yield "difficulty", record.difficulty
+    for tag in set(record.tags):
+        yield "tag", tag
+
+
+def _sorted_counts(counts: Dict[str, int]) -> Dict[str, int]:
+    # Most common first, then alphabetical, dropping values with no matches
+    return dict(sorted(((value, n) for value, n in counts.items() if n),
+                       key=lambda item: (-item[1], item[0])))
+
+
+def _from_slots(slots: Iterable[int], size: int) -> int:
+    flags = bytearray(size)
+    for slot in slots:
+        flags[slot] = 1
+    if not size:
+        return 0
+    return int(flags[::-1].translate(_FLAGS_TO_DIGITS), 2)
+
+
+def _combine(groups: List[list], match: str, union, intersect):
+    """Values of a facet combine by match, facets always intersect"""
+    result = None
+    for postings in groups:
+        group = postings[0]
+        for other in postings[1:]:
+            group = union(group, other) if match == "any" else intersect(group, other)
+        result = group if result is None else intersect(result, group)
+    return result
+
+
+class FacetIndex:
+    """Per-value indexes of recipes for cuisine, difficulty and tags.
+
+    Each value has a set of recipe ids, for filtering and for combining with
+    text search results, and a bitmap over recipe slots (a Python int with
+    one bit per recipe) for counting: a value's count within a result set is
+    one AND and a popcount, so facet counts never visit individual recipes.
+    The bitmaps cost a bit per recipe per value, far less than the sets.
+
+    Slots are never reused for a different id, so a reader holding an old
+    bitmap can't mistake one recipe for another; a deleted id keeps its
+    (cleared) slot until the index is rebuilt.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, Set[str]]] = {facet: {} for facet in FACETS}
+        self.bitmaps: Dict[str, Dict[str, int]] = {facet: {} for facet in FACETS}
+        self._slots: Dict[str, int] = {}
+
+    @classmethod
+    def build(cls, records: Iterable[RecipeRecord]) -> "FacetIndex":
+        """Index many records at once, building each bitmap a single time"""
+        index = cls()
+        members: Dict[Tuple[str, str], List[int]] = {}
+        for slot, record in enumerate(records):
+            index._slots[record.id] = slot
+            for facet, value in record_facets(record):
+                ids = index.postings[facet].get(value)
+                if ids is None:
+                    index.postings[facet][value] = {record.id}
+                    members[facet, value] = [slot]
+                else:
+                    ids.add(record.id)
+                    members[facet, value].append(slot)
+        size = len(index._slots)
+        for (facet, value), slots in members.items():
+            index.bitmaps[facet][value] = _from_slots(slots, size)
+        return index
+
+    def add(self, record: RecipeRecord):
+        slot = self._slots.get(record.id)
+        if slot is None:
+            slot = self._slots[record.id] = len(self._slots)
+        bit = 1 << slot
+        for facet, value in record_facets(record):
+            ids = self.postings[facet].get(value)
+            if ids is None:
+                self.postings[facet][value] = {record.id}
+            else:
+                ids.add(record.id)
+            bitmaps = self.bitmaps[facet]
+            bitmaps[value] = bitmaps.get(value, 0) | bit
+
+    def remove(self, record: RecipeRecord):
+        mask = ~(1 << self._slots[record.id])
+        for facet, value in record_facets(record):
+            ids = self.postings[facet].get(value)
+            if ids is None:
+                continue
+            ids.discard(record.id)
+            if not ids:
+                del self.postings[facet][value]
+                self.bitmaps[facet].pop(value, None)
+            else:
+                self.bitmaps[facet][value] &= mask
+
+    def _groups(self, index: Dict[str, Dict[str, Any]], filters: Mapping[str, Sequence[str]],
+                match: str, empty) -> List[list]:
+        if match not in FACET_MATCHES:
+            raise ValueError(f"Unknown facet match: {match}")
+        groups = []
+        for facet, values in filters.items():
+            if facet not in index:
+                raise ValueError(f"Unknown facet: {facet}")
+            if values:
+                groups.append([index[facet].get(value, empty) for value in set(values)])
+        return groups
+
+    def filter(self, filters: Mapping[str, Sequence[str]], match: str = "any") -> Optional[Set[str]]:
+        """Ids matching the filters, or None if there are no filters.
+
+        Values of one facet are ORed ("any") or ANDed ("all"); facets are
+        always ANDed with each other. Raises ValueError for unknown facets.
+        """
+        groups = self._groups(self.postings, filters, match, set())
+        # Never hand back a live posting set
+        result = _combine(groups, match, set.union, set.intersection)
+        return set(result) if result is not None else None
+
+    def filter_bits(self, filters: Mapping[str, Sequence[str]], match: str = "any") -> Optional[int]:
+        """Same as filter() but as a bitmap, for counts"""
+        groups = self._groups(self.bitmaps, filters, match, 0)
+        return _combine(groups, match, int.__or__, int.__and__)
+
+    def to_bits(self, ids: Iterable[str]) -> int:
+        """Bitmap of the given recipe ids (ids never indexed are skipped)"""
+        slots = self._slots
+        return _from_slots([slots[i] for i in ids if i in slots], len(slots))
+
+    def counts(self, bits: Optional[int] = None) -> FacetCounts:
+        """Value counts per facet within a bitmap, or over everything if None"""
+        result = {}
+        for facet, values in self.bitmaps.items():
+            if bits is None:
+                counts = {value: members.bit_count() for value, members in values.items()}
+            else:
+                counts = {value: (members & bits).bit_count() for value, members in values.items()}
+            result[facet] = _sorted_counts(counts)
+        return result
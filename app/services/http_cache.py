@@ -0,0 +1,101 @@
+import hashlib
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Optional, Union
+
+from fastapi import Request, Response
+
+from app.config import CACHE_MAX_AGE
+from app.models import Recipe
+from app.services.encoding import EncodedRecipe
+
+CACHE_CONTROL = f"public, max-age={CACHE_MAX_AGE}, must-revalidate"
+
+# Generations restart with the process, so they are qualified by a random
+# per-process token to keep list ETags from repeating across restarts
+_EPOCH = secrets.token_hex(4)
+
+
+def recipe_etag(recipe: Union[Recipe, EncodedRecipe]) -> str:
+    """Strong ETag for one stored version of a recipe.
+
+    The version alone can repeat after a delete and re-import, so the id
+    and update timestamp are folded in as well.
+    """
+    digest = hashlib.blake2b(
+        f"{recipe.id}|{recipe.updated_at.isoformat()}".encode(), digest_size=6
+    ).hexdigest()
+    return f'"{recipe.version}-{digest}"'
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = False) -> bool:
+    """Whether an If-Match / If-None-Match header lists the given ETag.
+
+    If-None-Match uses weak comparison (a W/ prefix is ignored); If-Match
+    must compare strongly.
+    """
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if weak:
+        candidates = [candidate.removeprefix("W/") for candidate in candidates]
+    return "*" in candidates or etag in candidates
+
+
+def collection_etag(generation: int) -> str:
+    """Strong ETag for list and search responses at a store generation"""
+    return f'"g{_EPOCH}-{generation}"'
+
+
+def html_etag(etag: str) -> str:
+    """Variant of a data ETag for the rendered HTML page of the same data"""
+    return etag[:-1] + '-html"'
+
+
+def similar_etag(generation: int, similar_generation: int) -> str:
+    """Strong ETag for similar recipes, which also change when the
+    similarity index is rebuilt"""
+    return f'"g{_EPOCH}-{generation}-s{similar_generation}"'
+
+
+def related_etag(etag: str, generation: int, similar_generation: int) -> str:
+    """Variant of a recipe's ETag for a page that also shows similar recipes
+    picked from the whole store, as of a store and similarity generation"""
+    return etag[:-1] + f'-g{generation}-s{similar_generation}"'
+
+
+def _http_date(value: datetime) -> str:
+    # Naive timestamps are local time, which is what astimezone assumes
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag, weak=True)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+    return modified <= since
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
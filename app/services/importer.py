@@ -0,0 +1,304 @@
+import codecs
+import json
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Any, BinaryIO, Deque, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.models import ImportRejection, ImportReport, Recipe
+from app.services.records import RecipeRecord
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+IMPORT_MODES = ("replace", "merge")
+# Cap on rejected rows listed in an import report; the count is always exact
+MAX_REPORTED_REJECTIONS = 100
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# Values a truncated buffer may end in the middle of
+_LITERALS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+_recipes = TypeAdapter(List[Recipe])
+
+
+class ImportParseError(ValueError):
+    """The upload is not a JSON array or NDJSON stream"""
+
+
+def iter_records(fileobj: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Yield JSON values from an upload without reading it all into memory.
+
+    A file starting with "[" is parsed as a JSON array, anything else as
+    newline-delimited JSON (one document per line).
+    """
+    chunks = _iter_text(fileobj, chunk_size)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.lstrip(_WHITESPACE):
+            break
+    buffer = buffer.lstrip(_WHITESPACE)
+    if not buffer:
+        # Importing nothing would empty the store in replace mode
+        raise ImportParseError("The upload is empty")
+    if buffer.startswith("["):
+        yield from _iter_array(buffer[1:], chunks)
+    else:
+        yield from _iter_lines(buffer, chunks)
+
+
+def _iter_text(fileobj: BinaryIO, chunk_size: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_array(buffer: str, chunks: Iterator[str]) -> Iterator[Any]:
+    eof = False
+    expect_value = True
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ImportParseError("Unexpected end of JSON array")
+            buffer = buffer[pos:]
+            pos = 0
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer += chunk
+            continue
+
+        char = buffer[pos]
+        if char == "]":
+            _expect_end(buffer[pos + 1:], chunks)
+            return
+        if not expect_value:
+            if char != ",":
+                raise ImportParseError(f"Expected ',' or ']' but found {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # Only an error the next chunk could fix is worth reading on
+            # for; anything else would pull the rest of the upload into
+            # the buffer just to fail at the end
+            if eof or not _truncated(buffer, e):
+                raise ImportParseError(f"Invalid JSON: {e.msg}") from e
+            end = None
+        # A number running up to the end of the buffer may continue in the
+        # next chunk (as may "1." or "1e"), so only trust it once more data is in
+        if end is None or (not eof and _may_continue(value, buffer, end)):
+            buffer = buffer[pos:]
+            pos = 0
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer += chunk
+            continue
+
+        yield value
+        pos = end
+        expect_value = False
+
+
+def _expect_end(buffer: str, chunks: Iterator[str]):
+    """Only whitespace may follow the closing bracket"""
+    for text in chain((buffer,), chunks):
+        if text.strip(_WHITESPACE):
+            raise ImportParseError("Unexpected data after the JSON array")
+
+
+def _truncated(buffer: str, error: json.JSONDecodeError) -> bool:
+    """Whether a decoding error is just the buffer ending mid-value"""
+    if error.pos >= len(buffer) or error.msg.startswith("Unterminated string"):
+        return True
+    if error.msg.startswith("Invalid \\uXXXX escape"):
+        return error.pos + 6 > len(buffer)
+    tail = buffer[error.pos:]
+    return any(literal.startswith(tail) for literal in _LITERALS)
+
+
+def _may_continue(value: Any, buffer: str, end: int) -> bool:
+    if end == len(buffer):
+        return True
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and all(char in _NUMBER_CHARS for char in buffer[end:]))
+
+
+def _iter_lines(buffer: str, chunks: Iterator[str]) -> Iterator[Any]:
+    # A bad line doesn't stop us finding the next one, so it is yielded as
+    # an ImportParseError and reported as a rejected row
+    line_number = 0
+    pending = buffer
+    while True:
+        chunk = next(chunks, None)
+        if chunk is not None:
+            pending += chunk
+        lines = pending.split("\n")
+        pending = lines.pop() if chunk is not None else ""
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield ImportParseError(f"Invalid JSON on line {line_number}: {e.msg}")
+        if chunk is None:
+            return
+
+
+def describe_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'record'}: {err['msg']}"
+        for err in error.errors()
+    )
+
+
+def validate_batch(batch: List[Any], start_index: int) -> Tuple[List[Recipe], List[ImportRejection]]:
+    """Validate a batch of parsed records into Recipes and rejections"""
+    if all(type(record) is dict for record in batch):
+        # Most batches are clean and validate in one call; one that isn't
+        # is gone through record by record to tell which ones failed
+        try:
+            return _recipes.validate_python(batch), []
+        except ValidationError:
+            pass
+    recipes = []
+    rejections = []
+    for index, record in enumerate(batch, start_index):
+        if isinstance(record, ImportParseError):
+            rejections.append(ImportRejection(index=index, reason=str(record)))
+        elif not isinstance(record, dict):
+            rejections.append(ImportRejection(index=index, reason="Expected a JSON object"))
+        else:
+            try:
+                recipes.append(Recipe(**record))
+            except ValidationError as e:
+                rejections.append(ImportRejection(index=index, reason=describe_error(e)))
+    return recipes, rejections
+
+
+def iter_batches(records: Iterable[Any], batch_size: int = BATCH_SIZE) -> Iterator[Tuple[int, List[Any]]]:
+    """Group records into (start_index, batch) pairs"""
+    batch = []
+    start = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield start, batch
+            start += len(batch)
+            batch = []
+    if batch:
+        yield start, batch
+
+
+def _validate_rows(batch: List[Any], start_index: int,
+                   ) -> Tuple[List[Tuple[tuple, FrozenSet[str]]], List[ImportRejection]]:
+    # Runs in a pool worker. Rows pickle far cheaper than models, and the
+    # parent rebuilds them into records anyway to share their strings; the
+    # ingredient names, the costliest part of a record, come along.
+    recipes, rejections = validate_batch(batch, start_index)
+    records = map(RecipeRecord.from_recipe, recipes)
+    return [(record.to_row(), record.ingredient_names) for record in records], rejections
+
+
+class ValidationPool:
+    """Worker processes that validate import batches in parallel.
+
+    Validating a Recipe is pure Python and holds the GIL, so threads can't
+    share the work. Batches are handed out as the upload is parsed, with a
+    few per worker in flight so memory stays bounded, and results come back
+    in upload order. Workers are spawned on first use and kept for later
+    imports; spawned rather than forked so they don't inherit the store's
+    locks and background threads.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _started(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def validate(self, batches: Iterable[Tuple[int, List[Any]]],
+                 ) -> Iterator[Tuple[List[RecipeRecord], List[ImportRejection]]]:
+        """Records and rejections of each (start_index, batch), in order"""
+        executor = self._started()
+        pending: Deque[Future] = deque()
+        try:
+            for start, batch in batches:
+                pending.append(executor.submit(_validate_rows, batch, start))
+                if len(pending) >= 2 * self.workers:
+                    yield self._collect(pending.popleft())
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            # Parsing failed or the caller stopped early
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _collect(future: Future) -> Tuple[List[RecipeRecord], List[ImportRejection]]:
+        rows, rejections = future.result()
+        return [RecipeRecord.from_row(row, names) for row, names in rows], rejections
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def _validate_inline(batches: Iterable[Tuple[int, List[Any]]],
+                     ) -> Iterator[Tuple[List[RecipeRecord], List[ImportRejection]]]:
+    for start, batch in batches:
+        recipes, rejections = validate_batch(batch, start)
+        yield [RecipeRecord.from_recipe(recipe) for recipe in recipes], rejections
+
+
+def validated_batches(records: Iterable[Any], report: ImportReport,
+                      pool: Optional[ValidationPool] = None) -> Iterator[List[RecipeRecord]]:
+    """Yield batches of valid recipes as records, tallying counts and
+    rejections in report.
+
+    With a pool, uploads of more than one batch are validated in its worker
+    processes; smaller ones aren't worth the round trip.
+    """
+    batches = iter_batches(records)
+    head = list(islice(batches, 2))
+    if pool is not None and len(head) > 1:
+        results = pool.validate(chain(head, batches))
+    else:
+        results = _validate_inline(chain(head, batches))
+    for valid, rejections in results:
+        report.count += len(valid)
+        report.rejected_count += len(rejections)
+        room = MAX_REPORTED_REJECTIONS - len(report.rejected)
+        report.rejected.extend(rejections[:max(room, 0)])
+        yield valid
@@ -0,0 +1,55 @@
+import re
+from functools import lru_cache
+from typing import List
+
+# Measures and counts that precede the ingredient itself
+UNITS = {
+    "cup", "cups", "tablespoon", "tablespoons", "tbsp", "teaspoon", "teaspoons", "tsp",
+    "g", "gram", "grams", "kg", "mg", "ml", "l", "liter", "liters", "litre", "litres",
+    "oz", "ounce", "ounces", "lb", "lbs", "pound", "pounds", "pinch", "pinches", "dash",
+    "dashes", "clove", "cloves", "piece", "pieces", "can", "cans", "jar", "jars",
+    "package", "packages", "slice", "slices", "stick", "sticks", "sprig", "sprigs",
+    "bunch", "bunches", "handful", "handfuls", "head", "heads", "inch",
+}
+# Size, state and preparation words that don't change what the ingredient is
+DESCRIPTORS = {
+    "large", "medium", "small", "fresh", "freshly", "ripe", "finely", "roughly",
+    "thinly", "chopped", "diced", "minced", "sliced", "grated", "peeled", "crushed",
+    "boiled", "hard-boiled", "cooked", "melted", "softened", "beaten",
+    "shredded", "halved", "quartered", "whole", "optional",
+}
+# Notes, alternatives and anything after them aren't part of the name
+_NOTE_RE = re.compile(
+    r"\(.*?\)|,.*$|\bor\b.*$|\bto taste\b.*$|\bfor (?:\w+ )?(?:frying|serving|garnish)\b.*$")
+_WORD_RE = re.compile(r"[^\W\d_][\w'-]*")
+# Plural endings of the last word, longest first
+_PLURALS = (("oes", "o"), ("ies", "y"), ("ches", "ch"), ("shes", "sh"), ("s", ""))
+
+
+def singular(word: str) -> str:
+    """Naive English singular, good enough to match "tomatoes" with "tomato" """
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    for ending, replacement in _PLURALS:
+        if word.endswith(ending):
+            return word[: -len(ending)] + replacement
+    return word
+
+
+# Lines like "1 teaspoon salt" repeat across many recipes
+@lru_cache(maxsize=65536)
+def normalize_ingredient(line: str) -> str:
+    """The ingredient named in a recipe line, without amounts, units or preparation.
+
+    "4 large russet potatoes, cut into fries" -> "russet potato". Returns ""
+    when nothing is left.
+    """
+    words: List[str] = _WORD_RE.findall(_NOTE_RE.sub("", line.lower()))
+    # A unit is only dropped while words follow it: "2 cloves garlic" is
+    # garlic, but "1 tsp cloves" is cloves
+    while len(words) > 1 and words[0] in UNITS:
+        words.pop(0)
+    kept = [word for word in words if word not in DESCRIPTORS] or words[-1:]
+    if kept:
+        kept[-1] = singular(kept[-1])
+    return " ".join(kept)
@@ -0,0 +1,40 @@
+import logging
+import random
+
+from app.config import LOG_LEVEL, LOG_SAMPLE_RATE
+
+_ROOT = "app"
+
+
+class SampleFilter(logging.Filter):
+    """Pass a random fraction of records below WARNING; always pass the rest"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def _configure() -> logging.Logger:
+    root = logging.getLogger(_ROOT)
+    root.setLevel(LOG_LEVEL)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    # On the handler, so records from every app.* logger are sampled
+    handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+    root.addHandler(handler)
+    return root
+
+
+_root = _configure()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app hierarchy; pass the module's __name__"""
+    if name != _ROOT and not name.startswith(_ROOT + "."):
+        name = f"{_ROOT}.{name}"
+    return logging.getLogger(name)
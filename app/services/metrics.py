@@ -0,0 +1,103 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    """A label value as the text exposition format quotes it"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style, one per label set"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(key, list(counts), total, count)
+                      for key, (counts, total, count) in sorted(self._series.items())]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {total}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route", LATENCY_BUCKETS)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes", "Request body size by route", SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size by route", SIZE_BUCKETS)
+STORAGE_LATENCY = Histogram(
+    "storage_operation_duration_seconds", "Storage operation latency", LATENCY_BUCKETS)
+
+_HISTOGRAMS = [REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, STORAGE_LATENCY]
+# Callables returning (metric name, type, help, {labels: value}) for values
+# that live elsewhere, like cache counters
+_collectors: List[Callable[[], List[Tuple[str, str, str, Dict[Labels, float]]]]] = []
+
+
+def register_collector(collector: Callable[[], List[Tuple[str, str, str, Dict[Labels, float]]]]):
+    _collectors.append(collector)
+
+
+@contextmanager
+def time_storage(operation: str) -> Iterator[None]:
+    """Record how long a storage operation (search, import, export...) takes"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STORAGE_LATENCY.observe(time.perf_counter() - started, operation=operation)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for histogram in _HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        for name, kind, help_text, values in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
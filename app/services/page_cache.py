@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+
+class PageCache:
+    """LRU cache of rendered HTML pages with a cap on total body size.
+
+    Keys include the store generation or recipe version the page was
+    rendered from, so a stale page can never be served. Storage writes also
+    evict the affected entries right away so they don't sit in memory
+    until LRU pushes them out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # Recipe id (None for list pages, which show them all) -> keys of
+        # the cached pages that show it, so a write finds its pages without
+        # scanning the cache
+        self._pages: Dict[Optional[str], Set[tuple]] = {}
+        # Recipes each cached page is filed under in _pages
+        self._shows: Dict[tuple, FrozenSet[Optional[str]]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: tuple, body: bytes, shows: Iterable[str] = ()):
+        """Cache a page; shows lists other recipes on it whose writes should evict it"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = body
+            self._size += len(body)
+            shown = self._shows[key] = frozenset(shows).union((key[1],))
+            for recipe_id in shown:
+                self._pages.setdefault(recipe_id, set()).add(key)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple):
+        self._size -= len(self._entries.pop(key))
+        for recipe_id in self._shows.pop(key):
+            keys = self._pages[recipe_id]
+            keys.discard(key)
+            if not keys:
+                del self._pages[recipe_id]
+
+    def invalidate(self, recipe_ids: Optional[Set[str]]):
+        """Drop pages affected by a write to the given recipes (None: all).
+
+        Keys are (page, recipe id or None, ...): list pages (id None)
+        depend on every recipe, detail pages on their own and on the
+        recipes they were put with as shown.
+        """
+        with self._lock:
+            if recipe_ids is None:
+                self._entries.clear()
+                self._pages.clear()
+                self._shows.clear()
+                self._size = 0
+                return
+            stale = set(self._pages.get(None, ()))
+            for recipe_id in recipe_ids:
+                stale.update(self._pages.get(recipe_id, ()))
+            for key in stale:
+                self._remove(key)
+
+    def invalidate_pages(self, page: str):
+        """Drop every cached page of one kind (the first part of its key).
+
+        Walks the whole cache, which is fine for what calls it: rare events
+        such as a similarity index rebuild.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == page]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from app.models import Recipe
+
+# Page size bounds shared by the API and the HTML pages
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+SortKey = Tuple[datetime, str]
+# Search results are ranked instead: (relevance score, id), best first
+RankKey = Tuple[float, str]
+PageKey = Union[SortKey, RankKey]
+
+
+class RecipePage(NamedTuple):
+    recipes: List[Any]  # Recipes, or what the projection makes of them
+    next_key: Optional[PageKey]  # Key to resume after, None on the last page
+    total: int
+    # Facet value counts over the whole result set, when asked for
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
+
+def recipe_sort_key(recipe: Recipe) -> SortKey:
+    """Stable listing order: oldest first, ties broken by id"""
+    created_at = recipe.created_at
+    if created_at.tzinfo is not None:
+        # Imported data may carry offsets; compare everything as naive UTC
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at, recipe.id
+
+
+def encode_cursor(key: PageKey) -> str:
+    """Turn a (created_at, id) or (score, id) key into an opaque URL-safe cursor"""
+    position = key[0].isoformat() if isinstance(key[0], datetime) else key[0]
+    raw = json.dumps([position, key[1]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> PageKey:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, recipe_id = json.loads(raw)
+        if isinstance(created_at, (int, float)) and not isinstance(created_at, bool):
+            return float(created_at), str(recipe_id)
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at, str(recipe_id)
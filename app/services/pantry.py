@@ -0,0 +1,134 @@
+import heapq
+import operator
+from collections import Counter
+from itertools import compress, repeat
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from app.services.ingredients import normalize_ingredient
+from app.services.records import RecipeRecord
+
+# Bounds for POST /api/recipes/match
+DEFAULT_MATCHES = 20
+MAX_MATCHES = 100
+MAX_PANTRY_ITEMS = 200
+
+
+class PantryMatch(NamedTuple):
+    recipe_id: str
+    matched: int  # distinct recipe ingredients the pantry covers
+    missing: Tuple[str, ...]  # normalized names of the others
+
+    @property
+    def coverage(self) -> float:
+        total = self.matched + len(self.missing)
+        return self.matched / total if total else 0.0
+
+
+def _head(name: str) -> str:
+    return name.rpartition(" ")[2]
+
+
+class IngredientIndex:
+    """Inverted index from normalized ingredient names to recipe ids.
+
+    A pantry item covers the recipe ingredient of the same name and, when
+    it is a single word, every ingredient ending in that word ("potato"
+    covers "russet potato"). Matching counts each recipe's hits across the
+    posting lists of the covered names, so only recipes sharing at least
+    one ingredient with the pantry are ever looked at.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        # Last word -> names ending in it
+        self._heads: Dict[str, Set[str]] = {}
+        self._names: Dict[str, FrozenSet[str]] = {}
+        # Number of names per recipe, for C-level lookups while matching
+        self._sizes: Dict[str, int] = {}
+
+    @classmethod
+    def build(cls, records: Iterable[RecipeRecord]) -> "IngredientIndex":
+        index = cls()
+        for record in records:
+            index.add(record)
+        return index
+
+    def add(self, record: RecipeRecord):
+        names = record.ingredient_names
+        self._names[record.id] = names
+        self._sizes[record.id] = len(names)
+        for name in names:
+            ids = self._postings.get(name)
+            if ids is None:
+                self._postings[name] = {record.id}
+                self._heads.setdefault(_head(name), set()).add(name)
+            else:
+                ids.add(record.id)
+
+    def remove(self, record: RecipeRecord):
+        self.discard(record.id)
+
+    def discard(self, recipe_id: str):
+        """Remove a recipe by id; the index keeps its names"""
+        names = self._names.pop(recipe_id, None)
+        self._sizes.pop(recipe_id, None)
+        for name in names or ():
+            ids = self._postings.get(name)
+            if ids is None:
+                continue
+            ids.discard(recipe_id)
+            if not ids:
+                del self._postings[name]
+                head = self._heads.get(_head(name))
+                if head is not None:
+                    head.discard(name)
+                    if not head:
+                        del self._heads[_head(name)]
+
+    def covered(self, pantry: Iterable[str]) -> Set[str]:
+        """Indexed ingredient names the pantry items cover"""
+        names = set()
+        for item in pantry:
+            name = normalize_ingredient(item)
+            if not name:
+                continue
+            if name in self._postings:
+                names.add(name)
+            if " " not in name:
+                names.update(self._heads.get(name, ()))
+        return names
+
+    def match(self, pantry: Iterable[str], limit: int = DEFAULT_MATCHES,
+              max_missing: Optional[int] = None) -> Tuple[List[PantryMatch], int]:
+        """Best recipes for a pantry and how many recipes it matches at all.
+
+        Recipes are ranked by the share of their ingredients the pantry
+        covers, then by fewest missing, then by id; max_missing drops
+        recipes lacking more than that many ingredients.
+        """
+        covered = self.covered(pantry)
+        hits: Counter = Counter()
+        for name in covered:
+            hits.update(self._postings.get(name, ()))
+
+        # Thousands of recipes can share a common pantry item, so the sort
+        # keys are computed with map() and zip() rather than a Python loop
+        ids = list(hits)
+        matched = list(hits.values())
+        # max(): a concurrent update can leave a count briefly above the size
+        sizes = list(map(max, map(self._sizes.get, ids, repeat(0)), matched))
+        missing = list(map(operator.sub, sizes, matched))
+        keys = zip(map(operator.neg, map(operator.truediv, matched, sizes)), missing, ids)
+        if max_missing is None:
+            total = len(ids)
+        else:
+            within = list(map(operator.le, missing, repeat(max_missing)))
+            keys = compress(keys, within)
+            total = sum(within)
+        best = heapq.nsmallest(limit, keys)
+
+        matches = []
+        for _, _, recipe_id in best:
+            names = self._names.get(recipe_id, frozenset())
+            matches.append(PantryMatch(recipe_id, hits[recipe_id], tuple(sorted(names - covered))))
+        return matches, total
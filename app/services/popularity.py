@@ -0,0 +1,121 @@
+import heapq
+import math
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Tuple
+
+# Bounds for the limit parameter of /api/recipes/popular
+DEFAULT_POPULAR = 10
+MAX_POPULAR = 50
+
+# Recipes kept ranked between flushes, more than any read asks for so
+# deleted recipes can be skipped
+_RANKED = 2 * MAX_POPULAR
+# Decay factor past which scores are rescaled to the current time
+_RESCALE_AT = 1e6
+# Decayed views below which a recipe is forgotten when scores are rescaled
+_MIN_SCORE = 0.01
+
+
+class _Shard:
+    """One thread's views since the last flush"""
+
+    __slots__ = ("lock", "counts", "owner")
+
+    def __init__(self, owner: threading.Thread):
+        # Only ever contended by a flush
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        # Worker threads come and go; a dead owner's shard is dropped once drained
+        self.owner = weakref.ref(owner)
+
+
+class ViewCounter:
+    """Recipe views with exponentially decaying popularity scores.
+
+    Each thread counts into its own shard, so recording a view takes only
+    a lock no other request thread uses. Shards are drained into the
+    scores at most every `flush_interval` seconds, by whichever reader
+    finds them stale, and the best recipes are ranked then; reads just
+    slice that ranking.
+
+    A view counts for half as much every `half_life` seconds. Instead of
+    decaying every score, new views are weighted by how far the clock has
+    moved past an epoch, and all scores are divided down to a new epoch
+    once the weights grow large.
+    """
+
+    def __init__(self, half_life: float = 6 * 3600, flush_interval: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.half_life = half_life
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._rate = math.log(2) / half_life
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._epoch = clock()
+        self._scores: Dict[str, float] = {}
+        # (decayed views at the last flush, recipe id), most viewed first
+        self._ranked: List[Tuple[float, str]] = []
+        self._flushed_at = -math.inf
+
+    def record(self, recipe_id: str):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._shards_lock:
+                self._shards.append(shard)
+        with shard.lock:
+            counts = shard.counts
+            counts[recipe_id] = counts.get(recipe_id, 0) + 1
+
+    def flush(self):
+        """Drain every shard into the scores and rank the best recipes"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        now = self._clock()
+        weight = math.exp(self._rate * (now - self._epoch))
+        scores = self._scores
+        with self._shards_lock:
+            shards = list(self._shards)
+        finished = set()
+        for shard in shards:
+            # Checked before draining: a thread seen dead records no more views
+            owner = shard.owner()
+            if owner is None or not owner.is_alive():
+                finished.add(shard)
+            with shard.lock:
+                counts, shard.counts = shard.counts, {}
+            for recipe_id, count in counts.items():
+                scores[recipe_id] = scores.get(recipe_id, 0.0) + count * weight
+        if finished:
+            with self._shards_lock:
+                self._shards = [shard for shard in self._shards if shard not in finished]
+
+        if weight > _RESCALE_AT:
+            scores = self._scores = {recipe_id: score / weight for recipe_id, score in scores.items()
+                                     if score / weight >= _MIN_SCORE}
+            self._epoch = now
+            weight = 1.0
+        best = heapq.nlargest(_RANKED, scores.items(), key=lambda item: item[1])
+        self._ranked = [(score / weight, recipe_id) for recipe_id, score in best]
+        self._flushed_at = now
+
+    def top(self, limit: int = DEFAULT_POPULAR) -> List[Tuple[str, float]]:
+        """(recipe id, decayed views) of the most viewed recipes, best first.
+
+        May include deleted recipes; callers skip the ones they can't find.
+        """
+        if self._clock() - self._flushed_at >= self.flush_interval:
+            # One reader flushes; the others use the previous ranking
+            if self._flush_lock.acquire(blocking=False):
+                try:
+                    self._flush()
+                finally:
+                    self._flush_lock.release()
+        return [(recipe_id, score) for score, recipe_id in self._ranked[:limit]]
@@ -0,0 +1,118 @@
+import json
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from app.models import Recipe
+from app.services.encoding import dumps, encode_recipe
+from app.services.records import RecipeRecord
+
+VIEWS = ("full", "summary")
+RECIPE_FIELDS = tuple(Recipe.model_fields)
+
+
+class Projection(ABC):
+    """The shape of each recipe in a list response, encoded as JSON
+    (except for CARD, which pages render).
+
+    Storage backends take one and return every recipe already in that
+    shape: the memory store from a RecipeRecord, SQLite from the JSON it
+    keeps in `column`.
+    """
+
+    column = "data"
+
+    @abstractmethod
+    def from_record(self, record: RecipeRecord) -> bytes:
+        ...
+
+    def from_column(self, text: str) -> bytes:
+        return text.encode()
+
+
+class _Full(Projection):
+    """Every field, as the detail endpoint sends it"""
+
+    def from_record(self, record: RecipeRecord) -> bytes:
+        return record.to_json()
+
+
+class _Summary(Projection):
+    """encoding.summarize(), stored alongside the recipe"""
+
+    column = "summary"
+
+    def from_record(self, record: RecipeRecord) -> bytes:
+        return record.to_summary_json()
+
+
+class RecipeCard(NamedTuple):
+    """A recipe as the home page lists it; the fields of encoding.summarize()"""
+    id: str
+    title: str
+    description: str  # cut to a snippet
+    cuisine: str
+    difficulty: str
+    tags: Tuple[str, ...]
+    ingredient_count: int
+    step_count: int
+
+
+class _Card(Projection):
+    """RecipeCards built from what was derived when the recipe was written,
+    so rendering a list does no per-recipe string work"""
+
+    column = "summary"
+
+    def from_record(self, record: RecipeRecord) -> RecipeCard:
+        return RecipeCard(record.id, record.title, record.snippet, record.cuisine,
+                          record.difficulty, record.tags, record.ingredient_count,
+                          record.step_count)
+
+    def from_column(self, text: str) -> RecipeCard:
+        data = json.loads(text)
+        data["tags"] = tuple(data["tags"])
+        return RecipeCard(**data)
+
+
+class FieldsProjection(Projection):
+    """Only the requested fields, plus the id; fields keep the Recipe order"""
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(name for name in RECIPE_FIELDS if name == "id" or name in fields)
+        self._include = set(self.fields)
+
+    def from_record(self, record: RecipeRecord) -> bytes:
+        return encode_recipe(record.to_recipe(), include=self._include)
+
+    def from_column(self, text: str) -> bytes:
+        data = json.loads(text)
+        return dumps({name: data[name] for name in self.fields})
+
+
+FULL = _Full()
+SUMMARY = _Summary()
+# Not an API view: for templates
+CARD = _Card()
+
+
+def parse_projection(view: str = "full", fields: Optional[str] = None) -> Projection:
+    """Projection for the view and fields= query parameters.
+
+    fields is a comma separated list of Recipe fields. Raises ValueError
+    for unknown views or fields, or both a fields list and a view other
+    than full.
+    """
+    if view not in VIEWS:
+        raise ValueError(f"view must be one of {', '.join(VIEWS)}")
+    if fields is None:
+        return SUMMARY if view == "summary" else FULL
+    if view != "full":
+        raise ValueError("fields cannot be combined with view=summary")
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        raise ValueError("fields must name at least one field")
+    unknown = sorted(set(names) - set(RECIPE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; "
+                         f"choose from {', '.join(RECIPE_FIELDS)}")
+    return FieldsProjection(names)
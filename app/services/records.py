@@ -0,0 +1,204 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, FrozenSet, Iterable, Optional, Tuple
+
+from app.models import Recipe
+from app.services.encoding import dumps, encode_recipe, snippet, summarize
+from app.services.ingredients import normalize_ingredient
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_RECIPE_FIELDS = tuple(Recipe.model_fields)
+
+RecordKey = Tuple[int, str]
+
+# Record fields in Recipe order, plus the UTC offsets of aware timestamps;
+# this is also the layout of log and snapshot rows
+_ROW_FIELDS = ("id", "title", "description", "ingredients", "instructions", "cuisine",
+               "tags", "difficulty", "created_at", "updated_at", "version", "offsets")
+
+
+def to_micros(value: datetime) -> int:
+    """Microseconds since 1970; aware datetimes are converted to naive UTC first"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_micros(micros: int, offset: Optional[int] = None) -> datetime:
+    """Inverse of to_micros, restoring the UTC offset (in seconds) if there was one"""
+    value = _EPOCH + timedelta(microseconds=micros)
+    if offset is None:
+        return value
+    shift = timedelta(seconds=offset)
+    return (value + shift).replace(tzinfo=timezone(shift))
+
+
+def _offset(value: datetime) -> Optional[int]:
+    utcoffset = value.utcoffset()
+    return None if utcoffset is None else int(utcoffset.total_seconds())
+
+
+def _shared(values: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sys.intern(value) for value in values)
+
+
+def normalized_names(lines: Iterable[str]) -> FrozenSet[str]:
+    """Normalized names of a recipe's ingredients"""
+    return frozenset(normalize_ingredient(line) for line in lines) - {""}
+
+
+class RecipeRecord:
+    """Compact stored form of a Recipe.
+
+    A pydantic model carries a __dict__, a fields-set and two datetimes per
+    instance. This keeps the same data in slots, with timestamps as integer
+    microseconds and the strings that repeat across a catalog (cuisine,
+    difficulty, tags, ingredient lines) interned so every recipe shares one
+    copy. Records are immutable by convention, like the Recipes they replace;
+    call to_recipe() to hand one out of the storage layer, or to_json() to
+    send it.
+
+    What list pages, cards and the ingredient indexes derive from a recipe
+    (the description snippet, normalized ingredient names, line counts) is
+    worked out once when the record is built, on every create, update,
+    import and recovery, so reads never redo it. Derived fields aren't part
+    of the row.
+    """
+
+    # Plus the derived fields and the encodings handed out so far, see to_json()
+    __slots__ = _ROW_FIELDS + ("snippet", "ingredient_names", "_json", "_summary_json")
+
+    def __init__(self, id: str, title: str, description: str, ingredients: Tuple[str, ...],
+                 instructions: Tuple[str, ...], cuisine: str, tags: Tuple[str, ...],
+                 difficulty: str, created_at: int, updated_at: int, version: int,
+                 offsets: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                 ingredient_names: Optional[FrozenSet[str]] = None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.ingredients = ingredients
+        self.instructions = instructions
+        self.cuisine = cuisine
+        self.tags = tags
+        self.difficulty = difficulty
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.version = version
+        self.offsets = offsets
+        self.snippet = snippet(description)
+        if ingredient_names is None:
+            ingredient_names = normalized_names(ingredients)
+        self.ingredient_names = ingredient_names
+        self._json: Optional[bytes] = None
+        self._summary_json: Optional[bytes] = None
+
+    @classmethod
+    def from_recipe(cls, recipe: Recipe) -> "RecipeRecord":
+        offsets = (_offset(recipe.created_at), _offset(recipe.updated_at))
+        return cls(
+            recipe.id, recipe.title, recipe.description,
+            _shared(recipe.ingredients), tuple(recipe.instructions),
+            sys.intern(recipe.cuisine), _shared(recipe.tags), sys.intern(recipe.difficulty),
+            to_micros(recipe.created_at), to_micros(recipe.updated_at), recipe.version,
+            None if offsets == (None, None) else offsets,
+        )
+
+    def to_recipe(self) -> Recipe:
+        created_offset, updated_offset = self.offsets or (None, None)
+        # Stored records were validated on the way in, so skip validation
+        return Recipe.model_construct(
+            id=self.id,
+            title=self.title,
+            description=self.description,
+            ingredients=list(self.ingredients),
+            instructions=list(self.instructions),
+            cuisine=self.cuisine,
+            tags=list(self.tags),
+            difficulty=self.difficulty,
+            created_at=from_micros(self.created_at, created_offset),
+            updated_at=from_micros(self.updated_at, updated_offset),
+            version=self.version,
+        )
+
+    def to_json(self) -> bytes:
+        """The recipe as JSON, encoded on first use and then kept.
+
+        An update stores a new record with the new version, so the cached
+        bytes can never describe anything but this one.
+        """
+        encoded = self._json
+        if encoded is None:
+            # Racing readers encode the same bytes; either copy may win
+            encoded = self._json = encode_recipe(self.to_recipe())
+        return encoded
+
+    def to_summary_json(self) -> bytes:
+        """encoding.summarize() of the recipe as JSON, kept like to_json()"""
+        encoded = self._summary_json
+        if encoded is None:
+            encoded = self._summary_json = dumps(summarize(self))
+        return encoded
+
+    @property
+    def ingredient_count(self) -> int:
+        return len(self.ingredients)
+
+    @property
+    def step_count(self) -> int:
+        return len(self.instructions)
+
+    @property
+    def sort_key(self) -> RecordKey:
+        """Listing order key, the integer form of pagination.recipe_sort_key"""
+        return self.created_at, self.id
+
+    def to_row(self) -> tuple:
+        """Plain tuple for the write-ahead log and snapshots"""
+        return tuple(getattr(self, name) for name in _ROW_FIELDS)
+
+    @classmethod
+    def from_row(cls, row: tuple, ingredient_names: Optional[FrozenSet[str]] = None) -> "RecipeRecord":
+        """Record for a row, taking the ingredient names when the process
+        that built the row passes them along"""
+        if len(row) == len(_RECIPE_FIELDS):
+            # Rows logged before records existed hold Recipe field values
+            return cls.from_recipe(Recipe.model_construct(**dict(zip(_RECIPE_FIELDS, row))))
+        if ingredient_names is not None:
+            ingredient_names = frozenset(_shared(ingredient_names))
+        record = cls(*row, ingredient_names=ingredient_names)
+        # Unpickled strings are fresh copies; share them again
+        record.ingredients = _shared(record.ingredients)
+        record.cuisine = sys.intern(record.cuisine)
+        record.tags = _shared(record.tags)
+        record.difficulty = sys.intern(record.difficulty)
+        return record
+
+
+def deep_sizeof(objects: Iterable[Any]) -> int:
+    """Bytes used by objects and everything they reference, counting shared
+    objects (interned strings, common tuples) once"""
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, bool, datetime)) or obj is None:
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for klass in type(obj).__mro__:
+                for name in getattr(klass, "__slots__", ()):
+                    if name != "__dict__" and hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+    return total
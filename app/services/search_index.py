@@ -0,0 +1,384 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import compress, repeat
+from operator import eq, ge, gt, mul, neg
+from typing import Collection, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from app.services.records import RecipeRecord
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# How much one occurrence of a word counts in each field
+FIELD_BOOSTS = {
+    "title": 3.0,
+    "tags": 2.0,
+    "cuisine": 2.0,
+    "ingredients": 1.5,
+    "description": 1.0,
+    "instructions": 0.5,
+}
+# BM25 term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+# Per-recipe term impacts are stored as ints in 1/IMPACT_SCALE units; they
+# stay below 256, so CPython shares one object per value
+IMPACT_SCALE = 100
+# A word the query term is only a prefix of scores a bit below an exact match
+PREFIX_WEIGHT = 0.8
+# Typo tolerance for terms that match nothing: trigram Jaccard similarity
+FUZZY_MIN_LENGTH = 4
+FUZZY_MIN_SIMILARITY = 0.3
+FUZZY_MAX_EXPANSIONS = 5
+# Lock-free reads retried before a query falls back to copying postings
+OPTIMISTIC_READS = 2
+
+RankKey = Tuple[float, str]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def field_texts(recipe: RecipeRecord) -> Iterator[Tuple[str, str]]:
+    """(field, text) pairs that are searched, one per field"""
+    yield "title", recipe.title
+    yield "tags", "\n".join(recipe.tags)
+    yield "cuisine", recipe.cuisine
+    yield "ingredients", "\n".join(recipe.ingredients)
+    yield "description", recipe.description
+    yield "instructions", "\n".join(recipe.instructions)
+
+
+def term_frequencies(recipe: RecipeRecord) -> Tuple[Dict[str, float], int]:
+    """Boost-weighted frequency of each token in a recipe, and its length in tokens"""
+    frequencies: Dict[str, float] = {}
+    length = 0
+    for field, text in field_texts(recipe):
+        boost = FIELD_BOOSTS[field]
+        tokens = tokenize(text)
+        length += len(tokens)
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0.0) + boost
+    return frequencies, length
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _impact(frequency: float, length: int, average_length: float) -> int:
+    norm = K1 * (1 - B + B * length / average_length)
+    return max(1, round(frequency * (K1 + 1) / (frequency + norm) * IMPACT_SCALE))
+
+
+def _idf(document_frequency: int, documents: int) -> float:
+    return math.log(1 + (documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def _below(scores: List[float], ids: List[str], after: RankKey, exact: bool = True):
+    """The (scores, ids) ranked after a previous hit: a lower score, or the
+    same score and a later id. With exact=False there is no hit scoring
+    exactly after's score, only ones below or above it."""
+    after_score, after_id = after
+    below = list(map(gt, repeat(after_score), scores))
+    tied = [] if not exact else [
+        recipe_id for recipe_id in compress(ids, map(eq, scores, repeat(after_score)))
+        if recipe_id > after_id
+    ]
+    return (list(compress(scores, below)) + [after_score] * len(tied),
+            list(compress(ids, below)) + tied)
+
+
+def _top(scores: List[float], ids: List[str], limit: Optional[int],
+         factor: float = 1.0) -> List[RankKey]:
+    """The limit best (score * factor, id) pairs, best first and ties by id"""
+    if limit is not None and len(scores) > limit:
+        if limit == 0:
+            return []
+        # Compare bare numbers to find the cut-off, then order only the few
+        # pairs at or above it
+        cutoff = heapq.nlargest(limit, scores)[-1]
+        keep = list(map(ge, scores, repeat(cutoff)))
+        scores = list(compress(scores, keep))
+        ids = list(compress(ids, keep))
+    ranked = sorted(zip(map(neg, scores), ids))[:limit]
+    return [(mul(-key, factor), recipe_id) for key, recipe_id in ranked]
+
+
+class RankedMatches(NamedTuple):
+    hits: List[RankKey]  # (score, recipe id), best first
+    matches: Collection[str]  # every recipe matching the query, each once
+
+
+class SearchIndex:
+    """BM25F-style ranked index over every text field of a recipe.
+
+    Each token maps to {recipe id: impact}, the BM25 term-frequency part of
+    the score with the field boosts folded in, computed when the recipe is
+    indexed (against the average length at that time; rebuilds make it
+    exact). A query ranks by the sum of idf * impact over its terms.
+
+    Every query term has to match, but a term matches any word it is a
+    prefix of, so "pot" still finds "potatoes". A term that matches no word
+    at all falls back to the closest words by trigram similarity, so
+    "herings" finds "herring". Only the requested top hits are ordered.
+
+    Writers (serialized by the owner) update postings in place. Readers use
+    them without copying and check a write counter, like a seqlock: it is
+    odd while a write is under way, and a query that overlapped one, or
+    tripped over a dict changing under it, is run again, ending with a run
+    on private copies of the vocabulary and postings.
+    """
+
+    def __init__(self):
+        self._writes = 0
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # Sorted vocabulary so prefix lookups are a bisect instead of a scan
+        self._vocabulary: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    @classmethod
+    def build(cls, recipes: Iterable[RecipeRecord]) -> "SearchIndex":
+        """Index many recipes at once with exact length normalization"""
+        index = cls()
+        postings = index.postings
+        # The average length is only known once every recipe is tokenized
+        analyzed = []
+        for recipe in recipes:
+            frequencies, length = term_frequencies(recipe)
+            analyzed.append((recipe.id, frequencies, length))
+            index._lengths[recipe.id] = length
+            index._total_length += length
+        average_length = index._average_length()
+        # Impacts by length and frequency: most pairs repeat across recipes
+        impacts: Dict[int, Dict[float, int]] = {}
+        for recipe_id, frequencies, length in analyzed:
+            by_frequency = impacts.get(length)
+            if by_frequency is None:
+                by_frequency = impacts[length] = {}
+            for token, frequency in frequencies.items():
+                impact = by_frequency.get(frequency)
+                if impact is None:
+                    impact = by_frequency[frequency] = _impact(frequency, length, average_length)
+                docs = postings.get(token)
+                if docs is None:
+                    postings[token] = {recipe_id: impact}
+                else:
+                    docs[recipe_id] = impact
+        index._vocabulary = sorted(postings)
+        for token in index._vocabulary:
+            index._add_trigrams(token)
+        return index
+
+    def _average_length(self) -> float:
+        return self._total_length / len(self._lengths) if self._lengths else 1.0
+
+    def _add_trigrams(self, token: str):
+        for gram in trigrams(token):
+            tokens = self._trigrams.get(gram)
+            if tokens is None:
+                self._trigrams[gram] = {token}
+            else:
+                tokens.add(token)
+
+    def _remove_trigrams(self, token: str):
+        for gram in trigrams(token):
+            tokens = self._trigrams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigrams[gram]
+
+    def clear(self):
+        self._writes += 1
+        self.postings.clear()
+        self._vocabulary.clear()
+        self._trigrams.clear()
+        self._lengths.clear()
+        self._total_length = 0
+        self._writes += 1
+
+    def add(self, recipe: RecipeRecord):
+        frequencies, length = term_frequencies(recipe)
+        self._writes += 1
+        try:
+            self._add(recipe, frequencies, length)
+        finally:
+            self._writes += 1
+
+    def _add(self, recipe: RecipeRecord, frequencies: Dict[str, float], length: int):
+        self._lengths[recipe.id] = length
+        self._total_length += length
+        average_length = self._average_length()
+        for token, frequency in frequencies.items():
+            impact = _impact(frequency, length, average_length)
+            docs = self.postings.get(token)
+            if docs is None:
+                self.postings[token] = {recipe.id: impact}
+                insort(self._vocabulary, token)
+                self._add_trigrams(token)
+            else:
+                docs[recipe.id] = impact
+
+    def remove(self, recipe: RecipeRecord):
+        frequencies, length = term_frequencies(recipe)
+        self._writes += 1
+        try:
+            self._remove(recipe, frequencies, length)
+        finally:
+            self._writes += 1
+
+    def _remove(self, recipe: RecipeRecord, frequencies: Dict[str, float], length: int):
+        if self._lengths.pop(recipe.id, None) is not None:
+            self._total_length -= length
+        for token in frequencies:
+            docs = self.postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(recipe.id, None)
+            if not docs:
+                del self.postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                self._remove_trigrams(token)
+
+    def _fuzzy(self, term: str) -> List[Tuple[str, float]]:
+        """Indexed words closest to a term that matched nothing, weighted by similarity"""
+        if len(term) < FUZZY_MIN_LENGTH:
+            return []
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            # tuple(): a writer may change the set while we count
+            shared.update(tuple(self._trigrams.get(gram, ())))
+        candidates = []
+        for token, common in shared.items():
+            if abs(len(token) - len(term)) > 2:
+                continue
+            # A word of n letters has n padded trigrams
+            similarity = common / (len(grams) + len(token) - common)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                candidates.append((similarity, token))
+        best = heapq.nlargest(FUZZY_MAX_EXPANSIONS, candidates)
+        return [(token, similarity) for similarity, token in best]
+
+    def _expand(self, term: str, vocabulary: List[str]) -> List[Tuple[str, float]]:
+        """Indexed words a query term stands for, with the weight of each"""
+        expansions = []
+        i = bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            token = vocabulary[i]
+            expansions.append((token, 1.0 if token == term else PREFIX_WEIGHT))
+            i += 1
+        return expansions or self._fuzzy(term)
+
+    def rank(self, query: str, limit: Optional[int] = None, after: Optional[RankKey] = None,
+             within: Optional[Set[str]] = None) -> RankedMatches:
+        """The best `limit` matches for a query (all of them if None), best first.
+
+        after resumes below a previous (score, id) hit; within restricts the
+        matches to a set of ids, e.g. from facet filters.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return RankedMatches([], set())
+        for _ in range(OPTIMISTIC_READS):
+            started = self._writes
+            if started % 2:
+                continue
+            try:
+                ranked = self._rank(terms, limit, after, within, private=False)
+            except (RuntimeError, KeyError, IndexError):
+                # A dict changed size mid-iteration or lost a recipe
+                continue
+            if self._writes == started:
+                return ranked
+        return self._rank(terms, limit, after, within, private=True)
+
+    def _rank(self, terms: List[str], limit: Optional[int], after: Optional[RankKey],
+              within: Optional[Set[str]], private: bool) -> RankedMatches:
+        documents = len(self._lengths) or 1
+        # An insert or delete could shift the live list between bisecting
+        # and reading it; list() copies it in one step
+        vocabulary = list(self._vocabulary) if private else self._vocabulary
+        groups = []
+        for term in terms:
+            group = []
+            for token, weight in self._expand(term, vocabulary):
+                docs = self.postings.get(token)
+                if docs:
+                    if private:
+                        docs = dict(docs)
+                    group.append((docs, weight * _idf(len(docs), documents) / IMPACT_SCALE))
+            if not group:
+                return RankedMatches([], set())
+            groups.append(group)
+
+        if len(groups) == 1 and len(groups[0]) == 1 and within is None:
+            # A single word: every recipe it occurs in matches, and its
+            # small int impacts rank the same as the scores without
+            # allocating a float per match
+            docs, factor = groups[0][0]
+            matches = ids = list(docs)
+            impacts = list(map(docs.__getitem__, ids))
+            if after is not None:
+                impacts, ids = _below(impacts, ids, *self._impact_after(after, factor))
+            return RankedMatches(_top(impacts, ids, limit, factor), matches)
+
+        matches = self._matches(groups, within)
+        ids = list(matches)
+        term_scores = [self._term_scores(group, ids) for group in groups]
+        scores = list(map(sum, zip(*term_scores))) if len(groups) > 1 else list(term_scores[0])
+        if after is not None:
+            scores, ids = _below(scores, ids, after)
+        return RankedMatches(_top(scores, ids, limit), matches)
+
+    @staticmethod
+    def _impact_after(after: RankKey, factor: float) -> Tuple[RankKey, bool]:
+        """A (score, id) cursor as an (impact, id) cursor for one term, and
+        whether some impact scores exactly the cursor's score"""
+        score, recipe_id = after
+        # The smallest impact scoring at least the cursor's score
+        impact = max(0, math.ceil(score / factor) - 1)
+        while impact * factor < score:
+            impact += 1
+        return (impact, recipe_id), impact * factor == score
+
+    @staticmethod
+    def _matches(groups: List[list], within: Optional[Set[str]]) -> Set[str]:
+        """Recipes matching every term, through any of the words it stands for"""
+        term_matches = [
+            group[0][0].keys() if len(group) == 1 else set().union(*(docs for docs, _ in group))
+            for group in groups
+        ]
+        # Intersect starting from the rarest term
+        term_matches.sort(key=len)
+        matches = set(term_matches[0])
+        if within is not None:
+            matches &= within
+        for ids in term_matches[1:]:
+            if not matches:
+                break
+            matches.intersection_update(ids)
+        return matches
+
+    @staticmethod
+    def _term_scores(group: List[tuple], ids: List[str]) -> Iterable[float]:
+        """One term's score for each of ids, which all match it"""
+        if len(group) == 1:
+            docs, factor = group[0]
+            return map(mul, map(docs.__getitem__, ids), repeat(factor))
+        # A recipe scores a term through its best-matching word only
+        best: Dict[str, float] = {}
+        for docs, factor in group:
+            for recipe_id, impact in docs.items():
+                score = impact * factor
+                if score > best.get(recipe_id, 0.0):
+                    best[recipe_id] = score
+        return map(best.__getitem__, ids)
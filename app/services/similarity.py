@@ -0,0 +1,225 @@
+import math
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.services.records import RecipeRecord
+
+# Bounds for the limit parameter of /api/recipes/{id}/similar
+DEFAULT_SIMILAR = 6
+MAX_SIMILAR = 50
+# Shown in the "You might also like" block of the detail page
+RELATED_ON_PAGE = 4
+
+# Weight of each kind of feature before IDF; a shared cuisine says less
+# about two recipes than a shared ingredient
+FEATURE_WEIGHTS = {"ingredient": 1.0, "tag": 0.8, "cuisine": 0.5}
+# Dead rows (deleted or replaced recipes) allowed per live one before the
+# index should be rebuilt
+MAX_DEAD_RATIO = 1.0
+
+_INITIAL_CAPACITY = 4
+
+
+def record_features(record: RecipeRecord) -> Dict[str, float]:
+    """Feature -> weight for a recipe: its normalized ingredients, tags and cuisine"""
+    features = {"c:" + record.cuisine.lower(): FEATURE_WEIGHTS["cuisine"]}
+    for tag in record.tags:
+        features["t:" + tag.lower()] = FEATURE_WEIGHTS["tag"]
+    for name in record.ingredient_names:
+        features["i:" + name] = FEATURE_WEIGHTS["ingredient"]
+    return features
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SimilarityIndex:
+    """TF-IDF vectors of recipe features, for "similar recipes".
+
+    The recipe x feature matrix is kept by column, as in a CSC sparse
+    matrix: each feature has a NumPy array of the rows (recipe slots) that
+    have it. Features are binary, so a row's value for a feature is the
+    feature's weight times its IDF, divided by the row's norm. The cosine
+    similarity of one recipe to all others is then a sparse dot product:
+    the query's features add their squared weights into a score vector
+    along their row arrays, the vector is scaled by the inverse row norms,
+    and argpartition picks the top k.
+
+    Writes append rows and posting entries in place. A deleted or replaced
+    recipe keeps its row with a zero norm until the index is rebuilt, which
+    its owner should do once `stale` says dead rows dominate. Row norms use
+    the IDFs of the time the row was added, so they drift slowly as the
+    catalog changes; a rebuild also brings them up to date.
+
+    Readers take no locks. Every array is either appended to past the
+    length readers have seen or replaced by a larger copy, so a reader
+    that reads a length before its array always sees valid entries.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, int] = {}
+        self._postings: List[np.ndarray] = []
+        self._lengths: List[int] = []
+        self._df: List[int] = []
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._inv_norms = np.zeros(_INITIAL_CAPACITY, dtype=np.float32)
+        # Indexed record per id: what remove() needs, and what sync() compares
+        self._records: Dict[str, RecipeRecord] = {}
+
+    @classmethod
+    def build(cls, records: Iterable[RecipeRecord]) -> "SimilarityIndex":
+        """Index many records at once, with one array per feature and
+        all row norms computed in a single vectorized pass"""
+        index = cls()
+        members: List[List[int]] = []
+        rows: List[int] = []
+        cols: List[int] = []
+        weights: List[float] = []
+        for slot, record in enumerate(records):
+            index._slots[record.id] = slot
+            index._ids.append(record.id)
+            index._records[record.id] = record
+            for feature, weight in record_features(record).items():
+                col = index._columns.get(feature)
+                if col is None:
+                    col = index._columns[feature] = len(members)
+                    members.append([])
+                members[col].append(slot)
+                rows.append(slot)
+                cols.append(col)
+                weights.append(weight)
+
+        index._postings = [np.array(slots, dtype=np.int32) for slots in members]
+        index._lengths = [len(slots) for slots in members]
+        index._df = list(index._lengths)
+        count = len(index._ids)
+        idf = index._idf_array()
+        values = np.array(weights, dtype=np.float64) * idf[np.array(cols, dtype=np.int64)]
+        squares = np.bincount(np.array(rows, dtype=np.int64), weights=values ** 2, minlength=count)
+        inv_norms = np.zeros(max(count, _INITIAL_CAPACITY), dtype=np.float32)
+        with np.errstate(divide="ignore"):
+            inv_norms[:count] = np.where(squares > 0, 1 / np.sqrt(squares), 0)
+        index._inv_norms = inv_norms
+        return index
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in NumPy arrays (postings and norms)"""
+        return self._inv_norms.nbytes + sum(postings.nbytes for postings in self._postings)
+
+    @property
+    def stale(self) -> bool:
+        """Whether dead rows outnumber live ones enough to rebuild"""
+        dead = len(self._ids) - len(self._slots)
+        return dead > 64 and dead > MAX_DEAD_RATIO * len(self._slots)
+
+    def _idf(self, col: int) -> float:
+        return math.log((1 + len(self._slots)) / (1 + self._df[col])) + 1
+
+    def _idf_array(self) -> np.ndarray:
+        df = np.array(self._df, dtype=np.float64)
+        return np.log((1 + len(self._slots)) / (1 + df)) + 1
+
+    def add(self, record: RecipeRecord):
+        if record.id in self._slots:
+            self.remove(record.id)
+        slot = len(self._ids)
+        features = record_features(record)
+        cols = []
+        for feature in features:
+            col = self._columns.get(feature)
+            if col is None:
+                col = len(self._postings)
+                self._postings.append(np.zeros(_INITIAL_CAPACITY, dtype=np.int32))
+                self._lengths.append(0)
+                self._df.append(0)
+                self._columns[feature] = col
+            self._df[col] += 1
+            cols.append(col)
+        self._ids.append(record.id)
+        self._slots[record.id] = slot
+        self._records[record.id] = record
+
+        # The norm slot must exist before any posting mentions the row
+        if slot >= len(self._inv_norms):
+            self._inv_norms = _grow(self._inv_norms, slot + 1)
+        square = sum((weight * self._idf(col)) ** 2 for weight, col in zip(features.values(), cols))
+        self._inv_norms[slot] = 1 / math.sqrt(square) if square else 0.0
+        for col in cols:
+            length = self._lengths[col]
+            if length == len(self._postings[col]):
+                self._postings[col] = _grow(self._postings[col], length + 1)
+            self._postings[col][length] = slot
+            self._lengths[col] = length + 1
+
+    def remove(self, recipe_id: str):
+        slot = self._slots.pop(recipe_id, None)
+        if slot is None:
+            return
+        record = self._records.pop(recipe_id)
+        self._inv_norms[slot] = 0.0
+        self._ids[slot] = None
+        for feature in record_features(record):
+            self._df[self._columns[feature]] -= 1
+
+    def sync(self, records: Mapping[str, RecipeRecord]):
+        """Catch up with writes made since the index was built from records"""
+        for recipe_id in [i for i in self._records if i not in records]:
+            self.remove(recipe_id)
+        for recipe_id, record in records.items():
+            if self._records.get(recipe_id) is not record:
+                self.add(record)
+
+    def compacted(self) -> "SimilarityIndex":
+        """A fresh index of the live records, without dead rows"""
+        return SimilarityIndex.build(list(self._records.values()))
+
+    def similar(self, record: RecipeRecord, limit: int = DEFAULT_SIMILAR) -> List[Tuple[str, float]]:
+        """(id, cosine similarity) of the recipes most like record, best first.
+
+        The record itself need not be indexed; it is left out if it is.
+        """
+        query = []
+        for feature, weight in record_features(record).items():
+            col = self._columns.get(feature)
+            if col is None:
+                continue
+            length = self._lengths[col]
+            value = weight * self._idf(col)
+            query.append((self._postings[col][:length], value))
+        if not query:
+            return []
+        # After the postings, so it covers every row they mention
+        inv_norms = self._inv_norms
+        query_norm = math.sqrt(sum(value ** 2 for _, value in query))
+
+        scores = np.zeros(len(inv_norms), dtype=np.float32)
+        for rows, value in query:
+            # Rows are unique within a column, so fancy += adds each once
+            scores[rows] += value ** 2
+        scores *= inv_norms
+        own = self._slots.get(record.id)
+        if own is not None:
+            scores[own] = 0.0
+
+        k = min(limit, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+        # Best first, ties by slot so results are stable
+        top = top[np.lexsort((top, -scores[top]))]
+        ids = self._ids
+        results = []
+        for slot in top.tolist():
+            recipe_id = ids[slot] if slot < len(ids) else None
+            if recipe_id is not None:
+                results.append((recipe_id, min(float(scores[slot]) / query_norm, 1.0)))
+        return results
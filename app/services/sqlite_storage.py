@@ -0,0 +1,891 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from app.models import BatchResult, ImportReport, Recipe, RecipeCreate, RecipeUpdate
+from app.services.batch import BATCH_APPLIED, BatchOperation
+from app.services.changes import Change, ChangePage, DEFAULT_CHANGES
+from app.services.encoding import EncodedRecipe, dumps, summarize
+from app.services.errors import ChangesExpired, VersionConflict
+from app.services.events import ChangeNotifier
+from app.services.facets import FACET_MATCHES, FACETS
+from app.services.importer import IMPORT_MODES, ValidationPool, validated_batches
+from app.services.pagination import PageKey, RecipePage, recipe_sort_key
+from app.services.pantry import DEFAULT_MATCHES, IngredientIndex, PantryMatch
+from app.services.projections import Projection
+from app.services.records import RecipeRecord
+from app.services.search_index import FIELD_BOOSTS, tokenize
+from app.services.seed import SEED_RECIPES
+from app.services.similarity import DEFAULT_SIMILAR, SimilarityIndex
+from app.services.suggest import DEFAULT_SUGGESTIONS, Suggestion, SuggestIndex, record_terms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,           -- the full recipe as JSON
+    summary TEXT NOT NULL,        -- encoding.summarize() of it as JSON
+    cuisine TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    created_key TEXT NOT NULL,    -- created_at as naive UTC, sortable as text
+    updated_at TEXT NOT NULL,
+    seq INTEGER NOT NULL          -- change feed number of the latest write
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_order ON recipes (created_key, id);
+CREATE INDEX IF NOT EXISTS idx_recipes_cuisine ON recipes (cuisine);
+CREATE INDEX IF NOT EXISTS idx_recipes_difficulty ON recipes (difficulty);
+CREATE INDEX IF NOT EXISTS idx_recipes_updated_at ON recipes (updated_at);
+CREATE TABLE IF NOT EXISTS tombstones (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    deleted_at REAL NOT NULL      -- time.time() of the delete, for retention
+);
+CREATE INDEX IF NOT EXISTS idx_tombstones_seq ON tombstones (seq);
+CREATE INDEX IF NOT EXISTS idx_tombstones_deleted_at ON tombstones (deleted_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+-- Last change feed number handed out, and the highest dropped tombstone's
+INSERT OR IGNORE INTO meta (key, value) VALUES ('change_seq', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('change_floor', 0);
+"""
+# Created by _migrate_changes, after the column exists in older databases
+CREATE_SEQ_INDEX = "CREATE INDEX IF NOT EXISTS idx_recipes_seq ON recipes (seq)"
+
+# Recipes per facet value and in total, kept by triggers in the same
+# transaction as every write, so unfiltered listings read their counts
+# instead of grouping the whole table. Created by _migrate_facet_counts,
+# which also fills them in for databases that predate them.
+FACET_COUNTS_SCHEMA = """
+CREATE TABLE facet_counts (
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL,
+    recipes INTEGER NOT NULL,
+    PRIMARY KEY (facet, value)
+);
+INSERT OR REPLACE INTO meta (key, value) SELECT 'recipe_count', COUNT(*) FROM recipes;
+INSERT INTO facet_counts (facet, value, recipes)
+SELECT 'cuisine', cuisine, COUNT(*) FROM recipes GROUP BY cuisine;
+INSERT INTO facet_counts (facet, value, recipes)
+SELECT 'difficulty', difficulty, COUNT(*) FROM recipes GROUP BY difficulty;
+-- DISTINCT: a recipe listing a tag twice still counts once
+INSERT INTO facet_counts (facet, value, recipes)
+SELECT 'tag', t.value, COUNT(DISTINCT r.id) FROM recipes r, json_each(r.data, '$.tags') t
+GROUP BY t.value;
+
+CREATE TRIGGER recipes_counted AFTER INSERT ON recipes BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'recipe_count';
+    INSERT INTO facet_counts (facet, value, recipes)
+    VALUES ('cuisine', NEW.cuisine, 1), ('difficulty', NEW.difficulty, 1)
+    ON CONFLICT (facet, value) DO UPDATE SET recipes = recipes + 1;
+    INSERT INTO facet_counts (facet, value, recipes)
+    SELECT DISTINCT 'tag', value, 1 FROM json_each(NEW.data, '$.tags') WHERE true
+    ON CONFLICT (facet, value) DO UPDATE SET recipes = recipes + 1;
+END;
+CREATE TRIGGER recipes_uncounted AFTER DELETE ON recipes BEGIN
+    UPDATE meta SET value = value - 1 WHERE key = 'recipe_count';
+    UPDATE facet_counts SET recipes = recipes - 1
+    WHERE (facet, value) IN (VALUES ('cuisine', OLD.cuisine), ('difficulty', OLD.difficulty))
+       OR (facet = 'tag' AND value IN (SELECT value FROM json_each(OLD.data, '$.tags')));
+    DELETE FROM facet_counts
+    WHERE recipes = 0 AND ((facet, value) IN (VALUES ('cuisine', OLD.cuisine), ('difficulty', OLD.difficulty))
+       OR (facet = 'tag' AND value IN (SELECT value FROM json_each(OLD.data, '$.tags'))));
+END;
+CREATE TRIGGER recipes_recounted AFTER UPDATE OF data, cuisine, difficulty ON recipes BEGIN
+    UPDATE facet_counts SET recipes = recipes - 1
+    WHERE (facet, value) IN (VALUES ('cuisine', OLD.cuisine), ('difficulty', OLD.difficulty))
+       OR (facet = 'tag' AND value IN (SELECT value FROM json_each(OLD.data, '$.tags')));
+    INSERT INTO facet_counts (facet, value, recipes)
+    VALUES ('cuisine', NEW.cuisine, 1), ('difficulty', NEW.difficulty, 1)
+    ON CONFLICT (facet, value) DO UPDATE SET recipes = recipes + 1;
+    INSERT INTO facet_counts (facet, value, recipes)
+    SELECT DISTINCT 'tag', value, 1 FROM json_each(NEW.data, '$.tags') WHERE true
+    ON CONFLICT (facet, value) DO UPDATE SET recipes = recipes + 1;
+    DELETE FROM facet_counts
+    WHERE recipes = 0 AND ((facet, value) IN (VALUES ('cuisine', OLD.cuisine), ('difficulty', OLD.difficulty))
+       OR (facet = 'tag' AND value IN (SELECT value FROM json_each(OLD.data, '$.tags'))));
+END;
+"""
+
+# Searched columns in FIELD_BOOSTS order, so bm25() can take the boosts as
+# its column weights
+FTS_COLUMNS = tuple(FIELD_BOOSTS)
+CREATE_FTS = f"CREATE VIRTUAL TABLE recipes_fts USING fts5 ({', '.join(FTS_COLUMNS)})"
+# bm25() is lower for better matches; scores are negated so higher is better
+# like the memory backend's
+RANK_SCORE = f"-bm25(recipes_fts, {', '.join(str(boost) for boost in FIELD_BOOSTS.values())})"
+
+# Fixed SQL strings so sqlite3's per-connection statement cache reuses the
+# prepared statements
+SELECT_ONE = "SELECT data FROM recipes WHERE id = ?"
+SELECT_ENCODED = "SELECT data, json_extract(data, '$.version'), updated_at FROM recipes WHERE id = ?"
+SELECT_ALL = "SELECT data FROM recipes ORDER BY created_key, id"
+SELECT_ALL_COLUMN = "SELECT {column} FROM recipes ORDER BY created_key, id"
+SELECT_ROWID = "SELECT rowid FROM recipes WHERE id = ?"
+UPSERT = """
+INSERT INTO recipes (id, data, summary, cuisine, difficulty, created_key, updated_at, seq)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    data = excluded.data,
+    summary = excluded.summary,
+    cuisine = excluded.cuisine,
+    difficulty = excluded.difficulty,
+    created_key = excluded.created_key,
+    updated_at = excluded.updated_at,
+    seq = excluded.seq
+"""
+INSERT_FTS = (f"INSERT INTO recipes_fts (rowid, {', '.join(FTS_COLUMNS)}) "
+              f"VALUES (?{', ?' * len(FTS_COLUMNS)})")
+DELETE_FTS = "DELETE FROM recipes_fts WHERE rowid = ?"
+DELETE_ONE = "DELETE FROM recipes WHERE id = ?"
+RECIPE_COUNT = "SELECT value FROM meta WHERE key = 'recipe_count'"
+FACET_COUNTS = "SELECT facet, value, recipes FROM facet_counts ORDER BY recipes DESC, value"
+SEARCH = f"""
+SELECT r.{{column}} FROM recipes_fts f JOIN recipes r ON r.rowid = f.rowid
+WHERE recipes_fts MATCH ? ORDER BY {RANK_SCORE} DESC, r.id
+"""
+# get_page assembles its SQL from these; each combination of search and
+# filters gives the same string, so it still hits the statement cache
+FROM_RECIPES = "recipes r"
+FROM_SEARCH = "recipes_fts f JOIN recipes r ON r.rowid = f.rowid"
+TAG_VALUES = "json_each(r.data, '$.tags')"
+GENERATION = "SELECT value FROM meta WHERE key = 'generation'"
+BUMP_GENERATION = "UPDATE meta SET value = value + 1 WHERE key = 'generation'"
+CHANGE_SEQ = "SELECT value FROM meta WHERE key = 'change_seq'"
+CHANGE_FLOOR = "SELECT value FROM meta WHERE key = 'change_floor'"
+NEXT_SEQ = "UPDATE meta SET value = value + 1 WHERE key = 'change_seq' RETURNING value"
+# Tombstones for every recipe before a replace import or clear, numbered in id order
+TOMBSTONE_ALL = """
+INSERT OR REPLACE INTO tombstones (id, seq, deleted_at)
+SELECT id, ? + ROW_NUMBER() OVER (ORDER BY id), ? FROM recipes
+"""
+ADVANCE_SEQ = "UPDATE meta SET value = value + ? WHERE key = 'change_seq'"
+INSERT_TOMBSTONE = "INSERT OR REPLACE INTO tombstones (id, seq, deleted_at) VALUES (?, ?, ?)"
+DELETE_TOMBSTONE = "DELETE FROM tombstones WHERE id = ?"
+EXPIRED_TOMBSTONES = "SELECT MAX(seq) FROM tombstones WHERE deleted_at < ?"
+DROP_TOMBSTONES = "DELETE FROM tombstones WHERE deleted_at < ?"
+RAISE_FLOOR = "UPDATE meta SET value = MAX(value, ?) WHERE key = 'change_floor'"
+# Each side walks its seq index; get_changes merges the two
+CHANGED_RECIPES = "SELECT seq, id, data FROM recipes WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?"
+CHANGED_TOMBSTONES = ("SELECT seq, id, deleted_at FROM tombstones WHERE seq > ? AND seq <= ? "
+                      "ORDER BY seq LIMIT ?")
+
+FETCH_SIZE = 500
+
+
+def _key_text(created_at: datetime) -> str:
+    return created_at.isoformat(timespec="microseconds")
+
+
+def _fts_values(recipe: Recipe) -> Tuple[str, ...]:
+    """Text of each FTS column for a recipe"""
+    fields = {
+        "title": recipe.title,
+        "tags": "\n".join(recipe.tags),
+        "cuisine": recipe.cuisine,
+        "ingredients": "\n".join(recipe.ingredients),
+        "description": recipe.description,
+        "instructions": "\n".join(recipe.instructions),
+    }
+    return tuple(fields[column] for column in FTS_COLUMNS)
+
+
+def _prepared(recipe: Recipe) -> Tuple[tuple, Tuple[str, ...]]:
+    """A recipe's UPSERT parameters (all but its seq) and FTS values,
+    worked out before any write lock is taken"""
+    created_key, _ = recipe_sort_key(recipe)
+    row = (recipe.id, recipe.model_dump_json(), dumps(summarize(recipe)).decode(),
+           recipe.cuisine, recipe.difficulty,
+           _key_text(created_key), recipe.updated_at.isoformat())
+    return row, _fts_values(recipe)
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """Every query token as a quoted prefix term, ANDed together"""
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _facet_conditions(filters: Dict[str, List[str]], match: str) -> Tuple[List[str], List[Any]]:
+    """WHERE conditions and parameters for facet filters, mirroring FacetIndex.filter"""
+    if match not in FACET_MATCHES:
+        raise ValueError(f"Unknown facet match: {match}")
+    conditions: List[str] = []
+    params: List[Any] = []
+    for facet, values in filters.items():
+        if facet not in FACETS:
+            raise ValueError(f"Unknown facet: {facet}")
+        values = sorted(set(values))
+        if not values:
+            continue
+        # "all" is one condition per value, "any" one IN over all of them
+        groups = [values] if match == "any" else [[value] for value in values]
+        for group in groups:
+            placeholders = ", ".join("?" * len(group))
+            if facet == "tag":
+                conditions.append(f"EXISTS (SELECT 1 FROM {TAG_VALUES} WHERE value IN ({placeholders}))")
+            else:
+                conditions.append(f"r.{facet} IN ({placeholders})")
+            params.extend(group)
+    return conditions, params
+
+
+def _statements(script: str) -> Iterator[str]:
+    """The complete statements of a SQL script, in order"""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        if not statement and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+def _load(row) -> Recipe:
+    return Recipe.model_validate_json(row[0])
+
+
+def _encoded(row) -> bytes:
+    # The data column already holds the recipe as model_dump_json wrote it
+    return row[0].encode()
+
+
+def _converter(projection: Optional[Projection]) -> Callable[[tuple], Union[Recipe, bytes]]:
+    """Turns a row starting with the projection's column into what callers get back"""
+    if projection is None:
+        return _load
+    from_column = projection.from_column
+    return lambda row: from_column(row[0])
+
+
+class _RecipeStream:
+    """Recipes from an open read transaction, fetched a batch at a time.
+
+    Ends the transaction and returns the connection to the pool when
+    exhausted or on close(), whichever comes first. close() may come from
+    another thread than the one iterating (a response's background task
+    after the client went away), so the two take turns on the connection.
+    """
+
+    def __init__(self, pool: "queue.Queue[sqlite3.Connection]", conn: sqlite3.Connection,
+                 cursor: sqlite3.Cursor):
+        self._pool = pool
+        self._conn: Optional[sqlite3.Connection] = conn
+        self._cursor = cursor
+        self._rows: Iterator[tuple] = iter(())
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> "_RecipeStream":
+        return self
+
+    def __next__(self) -> Recipe:
+        row = next(self._rows, None)
+        if row is None:
+            with self._lock:
+                rows = self._cursor.fetchmany(FETCH_SIZE) if self._conn is not None else []
+            if not rows:
+                self.close()
+                raise StopIteration
+            self._rows = iter(rows)
+            row = next(self._rows)
+        return _load(row)
+
+    def close(self):
+        self._rows = iter(())
+        with self._lock:
+            conn, self._conn = self._conn, None
+            if conn is not None:
+                conn.execute("COMMIT")
+                self._pool.put(conn)
+
+
+class SQLiteRecipeStorage(ChangeNotifier):
+    """RecipeStorage backed by a SQLite database in WAL mode.
+
+    Implements the same interface as the in-memory RecipeStorage, so it can
+    be swapped in with RECIPE_STORAGE_BACKEND=sqlite. Search uses an FTS5
+    table kept in step with the recipes table inside each write transaction,
+    ranked by bm25 with the same field boosts as the memory index; unlike
+    it, there is no typo tolerance. Typeahead suggestions, pantry matching
+    and similar recipes come from an in-process SuggestIndex,
+    IngredientIndex and SimilarityIndex. They follow the change feed rather
+    than the writes themselves: each records the change seq it is built
+    at, and after every commit, and before every read, replays the writes
+    past it from the seq columns, so rolled-back writes never reach them
+    and writes from other processes on the same file do. A large backlog,
+    such as a replace import, rebuilds them instead.
+
+    Triggers keep the number of recipes per facet value, and in total, in
+    the same transaction as each write, so unfiltered listings don't count
+    the table.
+
+    The change feed numbers each write from a counter in the meta table:
+    a recipe row carries the number of its latest write and a deleted
+    recipe leaves a row in the tombstones table, both indexed by it.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, load_seed_data: bool = True,
+                 change_retention: float = 7 * 24 * 3600, import_workers: int = 0):
+        super().__init__()
+        self.path = path
+        self.change_retention = change_retention
+        self._import_pool = ValidationPool(import_workers) if import_workers > 1 else None
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        # Its similarity index only changes with writes, which bump the
+        # generation, so this stays put
+        self.similar_generation = 0
+        # Change seq the in-process indexes reflect; None until first built
+        self._indexed_seq: Optional[int] = None
+        self._index_lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate_fts(conn)
+            self._migrate_summary(conn)
+            self._migrate_changes(conn)
+            self._migrate_facet_counts(conn)
+            empty = conn.execute(RECIPE_COUNT).fetchone()[0] == 0
+        if empty and load_seed_data:
+            self.import_recipes(SEED_RECIPES, mode="merge")
+        else:
+            self._sync_indexes()
+
+    def _build_indexes(self, recipes: Iterable[Recipe]):
+        records = list(map(RecipeRecord.from_recipe, recipes))
+        self._suggestions = SuggestIndex.build(records)
+        self._ingredients = IngredientIndex.build(records)
+        self._similar = SimilarityIndex.build(records)
+        # What each recipe added to the suggestions, to take it out again
+        # once its row holds a newer write
+        self._terms = {record.id: tuple(record_terms(record)) for record in records}
+
+    def _index(self, recipe: Recipe):
+        record = RecipeRecord.from_recipe(recipe)
+        terms = tuple(record_terms(record))
+        self._terms[record.id] = terms
+        self._suggestions.add_terms(terms)
+        self._ingredients.add(record)
+        self._similar.add(record)
+
+    def _unindex(self, recipe_id: str):
+        terms = self._terms.pop(recipe_id, None)
+        if terms is None:
+            return
+        self._suggestions.remove_terms(terms)
+        self._ingredients.discard(recipe_id)
+        self._similar.remove(recipe_id)
+        if self._similar.stale:
+            # Rebuilt from its own records; readers keep the old one meanwhile
+            self._similar = self._similar.compacted()
+
+    def _sync_indexes(self):
+        """Bring the in-process indexes up to the latest committed write.
+
+        Replays the recipes and tombstones written since the seq they were
+        built at; rebuilds when tombstones for that range have expired or
+        the backlog is as large as the index.
+        """
+        with self._connection() as conn:
+            if conn.execute(CHANGE_SEQ).fetchone()[0] == self._indexed_seq:
+                return
+        with self._index_lock:
+            with self._connection() as conn:
+                # One read transaction, so the head and both sides agree
+                conn.execute("BEGIN")
+                try:
+                    head = conn.execute(CHANGE_SEQ).fetchone()[0]
+                    since = self._indexed_seq
+                    if head == since:
+                        return
+                    floor = conn.execute(CHANGE_FLOOR).fetchone()[0]
+                    if since is None or since < floor or head - since >= len(self._terms):
+                        self._build_indexes(map(_load, conn.execute(SELECT_ALL)))
+                    else:
+                        # A recipe has either a row or a tombstone, never both
+                        for _, recipe_id, _ in conn.execute(CHANGED_TOMBSTONES, (since, head, -1)):
+                            self._unindex(recipe_id)
+                        for _, recipe_id, data in conn.execute(CHANGED_RECIPES, (since, head, -1)):
+                            self._unindex(recipe_id)
+                            self._index(Recipe.model_validate_json(data))
+                finally:
+                    conn.execute("COMMIT")
+            self._indexed_seq = head
+
+    def _migrate_fts(self, conn: sqlite3.Connection):
+        """Create the FTS table, rebuilding it if it indexes other columns"""
+        columns = tuple(row[1] for row in conn.execute("PRAGMA table_info(recipes_fts)"))
+        if columns == FTS_COLUMNS:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DROP TABLE IF EXISTS recipes_fts")
+            conn.execute(CREATE_FTS)
+            for rowid, data in conn.execute("SELECT rowid, data FROM recipes").fetchall():
+                conn.execute(INSERT_FTS, (rowid, *_fts_values(_load((data,)))))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate_summary(self, conn: sqlite3.Connection):
+        """Add and fill the summary column in databases created without it"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(recipes)")}
+        if "summary" in columns:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("ALTER TABLE recipes ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+            for rowid, data in conn.execute("SELECT rowid, data FROM recipes").fetchall():
+                conn.execute("UPDATE recipes SET summary = ? WHERE rowid = ?",
+                             (dumps(summarize(_load((data,)))).decode(), rowid))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate_changes(self, conn: sqlite3.Connection):
+        """Add and number the seq column in databases created without it,
+        oldest write first"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(recipes)")}
+        if "seq" not in columns:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("ALTER TABLE recipes ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                start = conn.execute(CHANGE_SEQ).fetchone()[0]
+                rowids = conn.execute("SELECT rowid FROM recipes ORDER BY updated_at, id").fetchall()
+                conn.executemany("UPDATE recipes SET seq = ? WHERE rowid = ?",
+                                 [(seq, rowid) for seq, (rowid,) in enumerate(rowids, start + 1)])
+                conn.execute(ADVANCE_SEQ, (len(rowids),))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        conn.execute(CREATE_SEQ_INDEX)
+
+    def _migrate_facet_counts(self, conn: sqlite3.Connection):
+        """Create the count tables and their triggers, counting the recipes
+        already stored"""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                              "AND name = 'facet_counts'").fetchone()
+        if exists:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # executescript() would commit first; run the statements one by one
+            for statement in _statements(FACET_COUNTS_SCHEMA):
+                conn.execute(statement)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are opened explicitly below
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; BEGIN IMMEDIATE serializes writers up front.
+
+        Every committed write bumps the store generation, and reaches the
+        in-process indexes once committed.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute(BUMP_GENERATION)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        self._sync_indexes()
+
+    @property
+    def generation(self) -> int:
+        with self._connection() as conn:
+            return conn.execute(GENERATION).fetchone()[0]
+
+    def close(self):
+        if self._import_pool is not None:
+            self._import_pool.close()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+    def _write(self, conn: sqlite3.Connection, recipe: Recipe):
+        self._write_prepared(conn, *_prepared(recipe))
+
+    def _write_prepared(self, conn: sqlite3.Connection, row: tuple, fts_values: Tuple[str, ...]):
+        recipe_id = row[0]
+        conn.execute(UPSERT, (*row, self._next_seq(conn)))
+        conn.execute(DELETE_TOMBSTONE, (recipe_id,))
+        rowid = conn.execute(SELECT_ROWID, (recipe_id,)).fetchone()[0]
+        conn.execute(DELETE_FTS, (rowid,))
+        conn.execute(INSERT_FTS, (rowid, *fts_values))
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection) -> int:
+        return conn.execute(NEXT_SEQ).fetchone()[0]
+
+    def _tombstone(self, conn: sqlite3.Connection, recipe_id: str):
+        now = time.time()
+        conn.execute(INSERT_TOMBSTONE, (recipe_id, self._next_seq(conn), now))
+        self._expire_tombstones(conn, now)
+
+    def _tombstone_all(self, conn: sqlite3.Connection):
+        """Tombstones for every recipe, before they are all deleted"""
+        now = time.time()
+        count = conn.execute(RECIPE_COUNT).fetchone()[0]
+        conn.execute(TOMBSTONE_ALL, (conn.execute(CHANGE_SEQ).fetchone()[0], now))
+        conn.execute(ADVANCE_SEQ, (count,))
+        self._expire_tombstones(conn, now)
+
+    def _expire_tombstones(self, conn: sqlite3.Connection, now: float):
+        # Both statements use the deleted_at index, so this is cheap when
+        # nothing has expired
+        cutoff = now - self.change_retention
+        expired = conn.execute(EXPIRED_TOMBSTONES, (cutoff,)).fetchone()[0]
+        if expired is not None:
+            conn.execute(DROP_TOMBSTONES, (cutoff,))
+            conn.execute(RAISE_FLOOR, (expired,))
+
+    def clear(self):
+        with self._transaction() as conn:
+            self._tombstone_all(conn)
+            conn.execute("DELETE FROM recipes")
+            conn.execute("DELETE FROM recipes_fts")
+        self._notify(None)
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute(RECIPE_COUNT).fetchone()[0]
+
+    def get_all_recipes(self, projection: Optional[Projection] = None) -> List[Union[Recipe, bytes]]:
+        column = projection.column if projection else "data"
+        convert = _converter(projection)
+        with self._connection() as conn:
+            return [convert(row) for row in conn.execute(SELECT_ALL_COLUMN.format(column=column))]
+
+    def snapshot(self) -> "_RecipeStream":
+        """Stream every recipe from a single read transaction.
+
+        The query runs before this returns, so under WAL the stream reflects
+        the database as of this call no matter what is written meanwhile.
+        The stream holds a pooled connection until it is exhausted or
+        closed; callers that may stop early must close it.
+        """
+        conn = self._pool.get()
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute(SELECT_ALL)
+        except BaseException:
+            self._pool.put(conn)
+            raise
+        return _RecipeStream(self._pool, conn, cursor)
+
+    def get_recipe(self, recipe_id: str) -> Optional[Recipe]:
+        with self._connection() as conn:
+            row = conn.execute(SELECT_ONE, (recipe_id,)).fetchone()
+        return _load(row) if row else None
+
+    def get_many(self, recipe_ids: Iterable[str],
+                 projection: Optional[Projection] = None) -> Dict[str, Union[Recipe, bytes]]:
+        return self._fetch(list(recipe_ids), projection)
+
+    def get_encoded_recipe(self, recipe_id: str) -> Optional[EncodedRecipe]:
+        with self._connection() as conn:
+            row = conn.execute(SELECT_ENCODED, (recipe_id,)).fetchone()
+        if row is None:
+            return None
+        return EncodedRecipe(recipe_id, row[1], datetime.fromisoformat(row[2]), _encoded(row))
+
+    def search_recipes(self, query: str,
+                       projection: Optional[Projection] = None) -> List[Union[Recipe, bytes]]:
+        match = _fts_query(query or "")
+        if match is None:
+            return self.get_all_recipes(projection)
+        column = projection.column if projection else "data"
+        convert = _converter(projection)
+        with self._connection() as conn:
+            return [convert(row) for row in conn.execute(SEARCH.format(column=column), (match,))]
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Suggestion]:
+        self._sync_indexes()
+        return self._suggestions.suggest(prefix, limit)
+
+    def match_pantry(self, pantry: List[str], limit: int = DEFAULT_MATCHES,
+                     max_missing: Optional[int] = None, projection: Optional[Projection] = None,
+                     ) -> Tuple[List[Tuple[PantryMatch, Union[Recipe, bytes]]], int]:
+        self._sync_indexes()
+        matches, total = self._ingredients.match(pantry, limit, max_missing)
+        found = self._fetch([match.recipe_id for match in matches], projection)
+        return [(match, found[match.recipe_id]) for match in matches
+                if match.recipe_id in found], total
+
+    def similar_recipes(self, recipe_id: str, limit: int = DEFAULT_SIMILAR,
+                        projection: Optional[Projection] = None,
+                        ) -> Optional[List[Tuple[Union[Recipe, bytes], float]]]:
+        recipe = self.get_recipe(recipe_id)
+        if recipe is None:
+            return None
+        self._sync_indexes()
+        similar = self._similar.similar(RecipeRecord.from_recipe(recipe), limit)
+        found = self._fetch([similar_id for similar_id, _ in similar], projection)
+        return [(found[similar_id], score) for similar_id, score in similar if similar_id in found]
+
+    def _fetch(self, recipe_ids: List[str],
+               projection: Optional[Projection]) -> Dict[str, Union[Recipe, bytes]]:
+        """Recipes by id, for ids that came from an in-process index"""
+        if not recipe_ids:
+            return {}
+        column = projection.column if projection else "data"
+        convert = _converter(projection)
+        placeholders = ", ".join("?" * len(recipe_ids))
+        with self._connection() as conn:
+            rows = conn.execute(f"SELECT {column}, id FROM recipes WHERE id IN ({placeholders})",
+                                recipe_ids).fetchall()
+        return {row[1]: convert(row) for row in rows}
+
+    @property
+    def change_seq(self) -> int:
+        with self._connection() as conn:
+            return conn.execute(CHANGE_SEQ).fetchone()[0]
+
+    def get_changes(self, since: int = 0, limit: int = DEFAULT_CHANGES) -> ChangePage:
+        with self._connection() as conn:
+            # One read transaction, so the head and both sides agree
+            conn.execute("BEGIN")
+            try:
+                head = conn.execute(CHANGE_SEQ).fetchone()[0]
+                floor = conn.execute(CHANGE_FLOOR).fetchone()[0]
+                if 0 < since < floor:
+                    raise ChangesExpired(since, floor)
+                # Fetch one extra row to learn whether there are more changes
+                upserts = conn.execute(CHANGED_RECIPES, (since, head, limit + 1)).fetchall()
+                deletes = conn.execute(CHANGED_TOMBSTONES, (since, head, limit + 1)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        rows = sorted(upserts + deletes)
+        changes = []
+        for seq, recipe_id, value in rows[:limit]:
+            if isinstance(value, str):
+                changes.append((Change(seq, recipe_id, False, 0.0), value.encode()))
+            else:
+                changes.append((Change(seq, recipe_id, True, value), None))
+        has_more = len(rows) > limit
+        next_since = rows[limit - 1][0] if has_more else max(since, head)
+        return ChangePage(changes, next_since, has_more)
+
+    def get_page(self, limit: int, after: Optional[PageKey] = None,
+                 query: Optional[str] = None, filters: Optional[Dict[str, List[str]]] = None,
+                 match: str = "any", facets: bool = False,
+                 projection: Optional[Projection] = None) -> RecipePage:
+        fts_match = _fts_query(query or "")
+        searched = fts_match is not None
+        if after is not None and isinstance(after[0], datetime) == searched:
+            raise ValueError("Cursor does not belong to this listing")
+        source = FROM_SEARCH if searched else FROM_RECIPES
+        conditions, params = _facet_conditions(filters or {}, match)
+        if searched:
+            conditions.insert(0, "recipes_fts MATCH ?")
+            params.insert(0, fts_match)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        column = projection.column if projection else "data"
+
+        if searched:
+            # Rank in a subquery so the keyset condition can use the score
+            page_sql = (f"SELECT {column}, score, id FROM (SELECT r.{column}, r.id, {RANK_SCORE} AS score "
+                        f"FROM {source}{where})")
+            page_params = list(params)
+            if after is not None:
+                page_sql += " WHERE score < ? OR (score = ? AND id > ?)"
+                page_params.extend((after[0], after[0], after[1]))
+            page_sql += " ORDER BY score DESC, id LIMIT ?"
+        else:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if after is not None:
+                page_conditions.append("(r.created_key, r.id) > (?, ?)")
+                page_params.extend((_key_text(after[0]), after[1]))
+            page_where = " WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+            page_sql = (f"SELECT r.{column}, r.created_key, r.id FROM {source}{page_where} "
+                        f"ORDER BY r.created_key, r.id LIMIT ?")
+
+        with self._connection() as conn:
+            # One read transaction so the count, page and facets agree
+            conn.execute("BEGIN")
+            try:
+                if conditions:
+                    total = conn.execute(f"SELECT COUNT(*) FROM {source}{where}", params).fetchone()[0]
+                else:
+                    total = conn.execute(RECIPE_COUNT).fetchone()[0]
+                # Fetch one extra row to learn whether there is a next page
+                rows = conn.execute(page_sql, (*page_params, limit + 1)).fetchall()
+                counts = None
+                if facets:
+                    counts = self._facet_counts(conn, source, where, params, bool(conditions))
+            finally:
+                conn.execute("COMMIT")
+
+        recipes = [_converter(projection)(row) for row in rows[:limit]]
+        next_key = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            # created_key is the naive UTC text form of the sort key
+            next_key = (last[1] if searched else datetime.fromisoformat(last[1]), last[2])
+        return RecipePage(recipes=recipes, next_key=next_key, total=total, facets=counts)
+
+    def _facet_counts(self, conn: sqlite3.Connection, source: str, where: str,
+                      params: List[Any], narrowed: bool) -> Dict[str, Dict[str, int]]:
+        """Value counts per facet over the listing; a lookup unless a search
+        or filters narrow it down"""
+        if not narrowed:
+            counts: Dict[str, Dict[str, int]] = {facet: {} for facet in FACETS}
+            for facet, value, recipes in conn.execute(FACET_COUNTS):
+                counts[facet][value] = recipes
+            return counts
+        queries = {
+            "cuisine": f"SELECT r.cuisine, COUNT(*) FROM {source}{where} GROUP BY r.cuisine",
+            "difficulty": f"SELECT r.difficulty, COUNT(*) FROM {source}{where} GROUP BY r.difficulty",
+            # DISTINCT: a recipe listing a tag twice still counts once
+            "tag": f"SELECT t.value, COUNT(DISTINCT r.id) FROM {source}, {TAG_VALUES} t{where} GROUP BY t.value",
+        }
+        counts = {}
+        for facet in FACETS:
+            rows = conn.execute(queries[facet], params).fetchall()
+            counts[facet] = dict(sorted(rows, key=lambda row: (-row[1], row[0])))
+        return counts
+
+    def _create(self, conn: sqlite3.Connection, recipe_data: RecipeCreate) -> Recipe:
+        recipe = Recipe(**recipe_data.model_dump())
+        self._write(conn, recipe)
+        return recipe
+
+    def _update(self, conn: sqlite3.Connection, recipe_id: str, recipe_data: RecipeUpdate,
+                expected_version: Optional[int]) -> Optional[Recipe]:
+        row = conn.execute(SELECT_ONE, (recipe_id,)).fetchone()
+        if row is None:
+            return None
+        old_recipe = _load(row)
+        if expected_version is not None and old_recipe.version != expected_version:
+            raise VersionConflict(recipe_id, old_recipe.version)
+        updated_data = recipe_data.model_dump(exclude_none=True)
+        updated_data["updated_at"] = datetime.now()
+        updated_data["version"] = old_recipe.version + 1
+        recipe = old_recipe.model_copy(update=updated_data)
+        self._write(conn, recipe)
+        return recipe
+
+    def _delete(self, conn: sqlite3.Connection, recipe_id: str,
+                expected_version: Optional[int]) -> bool:
+        row = conn.execute(SELECT_ONE, (recipe_id,)).fetchone()
+        if row is None:
+            return False
+        old_recipe = _load(row)
+        if expected_version is not None and old_recipe.version != expected_version:
+            raise VersionConflict(recipe_id, old_recipe.version)
+        rowid = conn.execute(SELECT_ROWID, (recipe_id,)).fetchone()[0]
+        conn.execute(DELETE_FTS, (rowid,))
+        conn.execute(DELETE_ONE, (recipe_id,))
+        self._tombstone(conn, recipe_id)
+        return True
+
+    def create_recipe(self, recipe_data: RecipeCreate) -> Recipe:
+        with self._transaction() as conn:
+            recipe = self._create(conn, recipe_data)
+        self._notify({recipe.id})
+        return recipe
+
+    def update_recipe(self, recipe_id: str, recipe_data: RecipeUpdate,
+                      expected_version: Optional[int] = None) -> Optional[Recipe]:
+        with self._transaction() as conn:
+            recipe = self._update(conn, recipe_id, recipe_data, expected_version)
+        if recipe is not None:
+            self._notify({recipe_id})
+        return recipe
+
+    def delete_recipe(self, recipe_id: str, expected_version: Optional[int] = None) -> bool:
+        with self._transaction() as conn:
+            deleted = self._delete(conn, recipe_id, expected_version)
+        if deleted:
+            self._notify({recipe_id})
+        return deleted
+
+    def apply_batch(self, operations: List[BatchOperation]) -> List[BatchResult]:
+        """Apply validated batch operations in one write transaction.
+
+        As in the memory backend, operations are independent: a missing
+        recipe or version conflict is reported and the rest still apply.
+        """
+        results = []
+        with self._transaction() as conn:
+            for operation in operations:
+                results.append(self._apply(conn, operation))
+        touched = {result.id for result in results if result.status in BATCH_APPLIED}
+        if touched:
+            self._notify(touched)
+        return results
+
+    def _apply(self, conn: sqlite3.Connection, operation: BatchOperation) -> BatchResult:
+        index, op, recipe_id = operation.index, operation.op, operation.recipe_id
+        try:
+            if op == "create":
+                recipe = self._create(conn, operation.data)
+                return BatchResult(index=index, op=op, id=recipe.id, status="created",
+                                   version=recipe.version)
+            if op == "update":
+                recipe = self._update(conn, recipe_id, operation.data, operation.expected_version)
+                if recipe is not None:
+                    return BatchResult(index=index, op=op, id=recipe_id, status="updated",
+                                       version=recipe.version)
+            elif self._delete(conn, recipe_id, operation.expected_version):
+                return BatchResult(index=index, op=op, id=recipe_id, status="deleted")
+        except VersionConflict as e:
+            return BatchResult(index=index, op=op, id=recipe_id, status="conflict",
+                               version=e.current_version, error="Recipe has been modified")
+        return BatchResult(index=index, op=op, id=recipe_id, status="not_found",
+                           error="Recipe not found")
+
+    def import_recipes(self, records: Iterable[Any], mode: str = "replace") -> ImportReport:
+        """Import in one write transaction; WAL readers keep the old data until commit.
+
+        The upload is read, validated and turned into rows first, so the
+        write lock is only held while they are applied.
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+
+        report = ImportReport(mode=mode, count=0)
+        prepared = [_prepared(record.to_recipe())
+                    for batch in validated_batches(records, report, self._import_pool)
+                    for record in batch]
+        with self._transaction() as conn:
+            if mode == "replace":
+                # Re-imported recipes lose their tombstone again in _write
+                self._tombstone_all(conn)
+                conn.execute("DELETE FROM recipes")
+                conn.execute("DELETE FROM recipes_fts")
+            for row, fts_values in prepared:
+                self._write_prepared(conn, row, fts_values)
+        self._notify(None)
+        return report
@@ -1,197 +1,772 @@
-from typing import Dict, List, Optional
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import sys
 from datetime import datetime
-import json  # TODO: Remove this - not used anymore
-from app.models import Recipe, RecipeCreate, RecipeUpdate
+import gc
+import threading
+import time
+from app.config import (
+    CHANGE_RETENTION, DATA_DIR, IMPORT_WORKERS, SNAPSHOT_INTERVAL, SNAPSHOT_MIN_WRITES,
+    SQLITE_PATH, SQLITE_POOL_SIZE, STORAGE_BACKEND, VIEW_FLUSH_INTERVAL, VIEW_HALF_LIFE,
+    WAL_FSYNC_INTERVAL, WAL_FSYNC_POLICY,
+)
+from app.models import BatchResult, ImportReport, Recipe, RecipeCreate, RecipeUpdate
+from app.services.batch import BATCH_APPLIED, BatchOperation
+from app.services.changes import ChangeLog, ChangePage, DEFAULT_CHANGES
+from app.services.encoding import EncodedRecipe
+from app.services.errors import VersionConflict
+from app.services.events import ChangeNotifier
+from app.services.facets import FacetIndex
+from app.services.importer import IMPORT_MODES, ValidationPool, validated_batches
+from app.services.log import get_logger
+from app.services.pagination import PageKey, RecipePage
+from app.services.pantry import DEFAULT_MATCHES, IngredientIndex, PantryMatch
+from app.services.popularity import ViewCounter
+from app.services.projections import Projection
+from app.services.records import RecipeRecord, RecordKey, deep_sizeof, from_micros, to_micros
+from app.services.search_index import SearchIndex
+from app.services.similarity import DEFAULT_SIMILAR, SimilarityIndex
+from app.services.seed import SEED_RECIPES
+from app.services.suggest import DEFAULT_SUGGESTIONS, Suggestion, SuggestIndex
+from app.services import wal
 
-# Global counter for analytics (can be used for analytics)
-recipe_view_count = {}
+logger = get_logger(__name__)
+
+
+class _StoreState:
+    """Recipe records plus the indexes derived from them.
+
+    Bulk writes build a fresh state off to the side and swap it in with a
+    single assignment, so readers see the old dataset or the new one but
+    never a half-built mix. Single-recipe writes update it in place under
+    the storage write lock; records themselves are never modified and are
+    replaced whole, so a reader sees either the old or the new version of one.
+    """
 
-class RecipeStorage:
     def __init__(self):
-        self.recipes: Dict[str, Recipe] = {}
-        # Load seed data on startup
-        self._load_seed_data()
+        self.records: Dict[str, RecipeRecord] = {}
+        self.search_index = SearchIndex()
+        self.facets = FacetIndex()
+        self.suggestions = SuggestIndex()
+        self.ingredients = IngredientIndex()
+        # Not part of build(): the owning storage rebuilds it in the background
+        self.similar = SimilarityIndex()
+        # Sort keys of every stored recipe, kept ordered for keyset pagination
+        self.order: List[RecordKey] = []
+
+    @classmethod
+    def build(cls, records: Dict[str, RecipeRecord]) -> "_StoreState":
+        state = cls()
+        state.records = records
+        state.search_index = SearchIndex.build(records.values())
+        state.facets = FacetIndex.build(records.values())
+        state.suggestions = SuggestIndex.build(records.values())
+        state.ingredients = IngredientIndex.build(records.values())
+        # One sort instead of an insort per recipe
+        state.order = sorted(record.sort_key for record in records.values())
+        return state
+
+    def index(self, record: RecipeRecord):
+        self.search_index.add(record)
+        self.facets.add(record)
+        self.suggestions.add(record)
+        self.ingredients.add(record)
+        self.similar.add(record)
+        insort(self.order, record.sort_key)
+
+    def unindex(self, record: RecipeRecord):
+        self.search_index.remove(record)
+        self.facets.remove(record)
+        self.suggestions.remove(record)
+        self.ingredients.remove(record)
+        self.similar.remove(record.id)
+        key = record.sort_key
+        i = bisect_left(self.order, key)
+        if i < len(self.order) and self.order[i] == key:
+            del self.order[i]
+
+    def put(self, record: RecipeRecord):
+        """Store a record and index it, replacing any record with the same id"""
+        existing = self.records.get(record.id)
+        if existing is not None:
+            self.unindex(existing)
+        self.records[record.id] = record
+        self.index(record)
+
+    def remove(self, recipe_id: str) -> Optional[RecipeRecord]:
+        record = self.records.pop(recipe_id, None)
+        if record is not None:
+            self.unindex(record)
+        return record
+
+
+class RecipeStorage(ChangeNotifier):
+    """In-memory recipe store.
+
+    Recipes are kept as compact RecipeRecords and only materialized as
+    Recipe models when they leave the store. Readers take no locks: they
+    grab the current state once and look records up in it. Writers are serialized by a single lock and stamp
+    each new recipe version, so conditional writes can detect lost updates.
+
+    With a data_dir, every mutation is also appended to a write-ahead log
+    and the whole store is snapshotted in the background, so a restart
+    loads the latest snapshot and replays only the log written after it.
+
+    Every write is also numbered in a ChangeLog for the change feed. The
+    log is saved with each snapshot, and replaying the write-ahead log
+    renumbers the writes after it exactly as they were numbered live.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, fsync_policy: str = "always",
+                 fsync_interval: float = 0.05, snapshot_interval: float = 60.0,
+                 snapshot_min_writes: int = 1000, change_retention: float = 7 * 24 * 3600,
+                 import_workers: int = 0):
+        super().__init__()
+        self._state = _StoreState()
+        # Large imports are validated in worker processes when there are
+        # more than one
+        self._import_pool = ValidationPool(import_workers) if import_workers > 1 else None
+        self._changes = ChangeLog(change_retention)
+        self._wal: Optional[wal.WriteAheadLog] = None
+        self._data_dir = data_dir
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._writes_since_snapshot = 0
+        self._similar_lock = threading.Lock()
+        self._similar_requested = False
+        self._similar_builder: Optional[threading.Thread] = None
+        self.recovery_seconds: Optional[float] = None
+        # Bumped by every write; lets list responses be validated with ETags
+        self.generation = 0
+        # Bumped by every similarity index rebuild, which can rank similar
+        # recipes differently without any write
+        self.similar_generation = 0
+        
+        if data_dir is None:
+            # Load seed data on startup
+            self._load_seed_data()
+            return
+        
+        recovered = self._recover(data_dir)
+        if recovered:
+            self._rebuild_similar()
+        self._wal = wal.WriteAheadLog(data_dir, self._next_segment, fsync_policy, fsync_interval)
+        if not recovered:
+            self._load_seed_data()
+            self.checkpoint()
+        
+        self._snapshot_min_writes = snapshot_min_writes
+        self._stopped = threading.Event()
+        self._snapshotter = threading.Thread(
+            target=self._snapshot_periodically, args=(snapshot_interval,),
+            name="recipe-snapshots", daemon=True,
+        )
+        self._snapshotter.start()
     
     def _load_seed_data(self):
         """Load initial seed data for testing"""
-        seed_recipes = [
-            {
-                "id": "poutine-canada-001",
-                "title": "Classic Quebec Poutine",
-                "description": "The original comfort food from Quebec - crispy fries topped with fresh cheese curds and rich brown gravy. A perfect combination of textures and flavors that has become Canada's national dish.",
-                "ingredients": [
-                    "4 large russet potatoes, cut into fries",
-                    "2 cups fresh cheese curds, at room temperature",
-                    "3 tablespoons butter",
-                    "3 tablespoons all-purpose flour",
-                    "2 cups beef stock",
-                    "1 tablespoon Worcestershire sauce",
-                    "Salt and pepper to taste",
-                    "Vegetable oil for frying"
-                ],
-                "instructions": [
-                    "Cut potatoes into thick fries, about 1/2 inch thick. Soak in cold water for 30 minutes to remove excess starch.",
-                    "Heat oil to 325°F (165°C) for the first fry. Fry potatoes for 3-4 minutes. Remove and drain on paper towels.",
-                    "Increase oil temperature to 375°F (190°C). Fry potatoes again for 2-3 minutes until golden brown and crispy.",
-                    "For the gravy: melt butter in a saucepan over medium heat. Whisk in flour and cook for 2 minutes to make a roux.",
-                    "Gradually add beef stock while whisking constantly to prevent lumps. Add Worcestershire sauce.",
-                    "Simmer for 5-10 minutes until thickened. Season with salt and pepper.",
-                    "Place hot fries in serving dish, top with cheese curds, then pour hot gravy over top.",
-                    "Serve immediately while the cheese is melting and everything is hot."
-                ],
-                "cuisine": "Canadian",
-                "tags": ["comfort food", "Canadian", "vegetarian-friendly"],
-                "difficulty": "Easy",
-                "created_at": "2024-01-15T10:30:00",
-                "updated_at": "2024-01-15T10:30:00"
-            },
-            {
-                "id": "shuba-russia-002",
-                "title": "Shuba (Herring Under a Fur Coat)",
-                "description": "A beloved Russian layered salad that's essential at New Year celebrations. This colorful dish combines salted herring with layers of vegetables and mayonnaise, creating a rich and festive treat.",
-                "ingredients": [
-                    "4 salted herring fillets, finely chopped",
-                    "3 medium potatoes, boiled and grated",
-                    "3 large carrots, boiled and grated",
-                    "4 hard-boiled eggs, whites and yolks separated and grated",
-                    "3 medium beets, boiled and grated",
-                    "1 large onion, finely chopped",
-                    "1 1/2 cups mayonnaise",
-                    "Salt to taste",
-                    "Fresh dill for garnish"
-                ],
-                "instructions": [
-                    "Boil potatoes, carrots, and beets separately until tender. Beets take the longest (45-60 minutes). Let cool completely.",
-                    "Hard-boil eggs for 10 minutes, then cool in ice water. Separate whites from yolks and grate separately.",
-                    "Peel and grate all vegetables using a coarse grader. Keep each ingredient in separate bowls.",
-                    "In a clear glass dish, start layering: first spread chopped herring evenly on the bottom.",
-                    "Layer chopped onion over herring, then spread a thin layer of mayonnaise.",
-                    "Add layer of grated potatoes, then mayonnaise. Season lightly with salt.",
-                    "Continue with grated carrots and mayonnaise, then grated egg whites and mayonnaise.",
-                    "Finally, top with grated beets and a final layer of mayonnaise to cover completely.",
-                    "Garnish with grated egg yolks and fresh dill. Refrigerate for at least 4 hours or overnight.",
-                    "Cut into squares to serve, showing off the beautiful layers."
-                ],
-                "cuisine": "Russian",
-                "tags": ["Russian", "layered salad", "New Year", "festive", "make-ahead"],
-                "difficulty": "Medium",
-                "created_at": "2024-01-20T14:45:00",
-                "updated_at": "2024-01-20T14:45:00"
-            },
-            {
-                "id": "guo-bao-rou-china-003",
-                "title": "Guo Bao Rou (Sweet and Sour Crispy Pork)",
-                "description": "A signature dish from Northeast China with perfectly crispy pork pieces coated in a glossy sweet and sour sauce. The key is achieving the right balance of crispy texture and tangy-sweet flavor.",
-                "ingredients": [
-                    "1 lb pork tenderloin, cut into 2-inch strips",
-                    "1/2 cup cornstarch",
-                    "1/4 cup all-purpose flour",
-                    "1 egg white",
-                    "1 teaspoon salt",
-                    "2 tablespoons Shaoxing wine or dry sherry",
-                    "4 tablespoons sugar",
-                    "3 tablespoons rice vinegar",
-                    "2 tablespoons light soy sauce",
-                    "1 tablespoon tomato paste",
-                    "2 cloves garlic, minced",
-                    "1 tablespoon fresh ginger, minced",
-                    "2 green onions, chopped",
-                    "Vegetable oil for deep frying"
-                ],
-                "instructions": [
-                    "Cut pork tenderloin into strips about 2 inches long and 1/2 inch thick. Season with salt and Shaoxing wine.",
-                    "Make batter by mixing cornstarch, flour, egg white, and 2-3 tablespoons water until smooth. Coat pork pieces.",
-                    "Heat oil to 350°F (175°C). Deep fry pork pieces until golden and crispy, about 4-5 minutes. Remove and drain.",
-                    "Let oil temperature rise to 375°F (190°C) and fry pork again for 1-2 minutes for extra crispiness.",
-                    "For sauce: mix sugar, rice vinegar, soy sauce, and tomato paste in a small bowl until sugar dissolves.",
-                    "Heat 2 tablespoons oil in a wok over high heat. Add garlic and ginger, stir-fry for 30 seconds.",
-                    "Pour in sauce mixture and bring to a boil. The sauce should be glossy and slightly thickened.",
-                    "Add crispy pork pieces to the wok and quickly toss to coat with sauce.",
-                    "Garnish with chopped green onions and serve immediately while the pork is still crispy.",
-                    "Serve with steamed rice and enjoy the contrast of crispy pork and tangy sauce."
-                ],
-                "cuisine": "Chinese",
-                "tags": ["Chinese", "sweet and sour", "crispy", "Northeast Chinese", "stir-fry"],
-                "difficulty": "Hard",
-                "created_at": "2024-01-25T09:15:00",
-                "updated_at": "2024-01-25T09:15:00"
-            }
-        ]
-        
-        for recipe_dict in seed_recipes:
+        for recipe_dict in SEED_RECIPES:
             try:
                 recipe = Recipe(**recipe_dict)
-                self.recipes[recipe.id] = recipe
+                self._state.put(RecipeRecord.from_recipe(recipe))
+                self._changes.record(recipe.id)
             except Exception as e:
-                print(f"Failed to load seed recipe: {e}")
+                logger.warning("Failed to load seed recipe: %s", e)
+    
+    def _recover(self, data_dir: str) -> bool:
+        """Rebuild the store from the latest snapshot plus the log tail"""
+        started = time.perf_counter()
+        # Recovery allocates millions of long-lived objects; pausing the
+        # cyclic GC avoids repeated full collections over them
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            snapshot, records, self._next_segment, changes = wal.recover(data_dir)
+            if snapshot is None and not records:
+                return False
+            
+            recipes = {}
+            for row in snapshot or []:
+                record = RecipeRecord.from_row(row)
+                recipes[record.id] = record
+            if changes is not None:
+                self._changes = ChangeLog.from_state(changes, self._changes.retention)
+            else:
+                # A snapshot from before the change feed: start it with
+                # every recipe, oldest write first
+                for record in sorted(recipes.values(), key=lambda record: record.updated_at):
+                    self._changes.record(record.id)
+            for op, payload, *stamp in records:
+                # Replayed changes keep the time they were made, so restarts
+                # don't extend tombstone retention; logs from before the
+                # stamp was added replay as of now
+                at = stamp[0] if stamp else None
+                # A batch is logged as one record holding its puts and deletes
+                for op, payload in payload if op == "batch" else [(op, payload)]:
+                    if op == "put":
+                        record = RecipeRecord.from_row(payload)
+                        recipes[record.id] = record
+                        self._changes.record(record.id, at=at)
+                    elif op == "delete":
+                        recipes.pop(payload, None)
+                        self._changes.record(payload, deleted=True, at=at)
+            self._state = _StoreState.build(recipes)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        
+        self.recovery_seconds = time.perf_counter() - started
+        logger.info("Recovered %d recipes (%d log records) in %.3fs",
+                    len(recipes), len(records), self.recovery_seconds)
+        return True
+    
+    def _log(self, op: str, payload: Any, at: float) -> Optional[int]:
+        """Append a mutation to the log with the time its changes were
+        recorded at; call with the write lock held"""
+        if self._wal is None:
+            return None
+        self._writes_since_snapshot += 1
+        return self._wal.append((op, payload, at))
+    
+    def _commit(self, position: Optional[int]):
+        """Wait for a logged write to be durable, outside the write lock so
+        concurrent writers can share one fsync"""
+        if position is not None and self._wal is not None:
+            self._wal.commit(position)
+    
+    def _capture(self):
+        """Rotate the log and capture the records it now covers.
+
+        Call with the write lock held. The log is rotated first, so any
+        write missing from the capture is in a segment that is still replayed.
+        """
+        segment = self._wal.rotate()
+        self._writes_since_snapshot = 0
+        return segment, list(self._state.records.values()), self._changes.state()
+    
+    def _write_snapshot(self, segment: int, records: List[RecipeRecord], changes: tuple):
+        with self._checkpoint_lock:
+            wal.write_snapshot(self._data_dir, segment, [record.to_row() for record in records], changes)
+            wal.remove_before(self._data_dir, segment)
     
-    def get_all_recipes(self) -> List[Recipe]:
-        print(f"DEBUG: get_all_recipes called, storage has {len(self.recipes)} recipes")
-        result = list(self.recipes.values())
-        print(f"DEBUG: Converting to list returned {len(result)} recipes")
-        return result
+    def checkpoint(self):
+        """Write a snapshot of the current store and drop the log it covers"""
+        if self._wal is None:
+            return
+        with self._lock:
+            captured = self._capture()
+        self._write_snapshot(*captured)
     
+    def _swap(self, records: Dict[str, RecipeRecord], merge: bool = False):
+        """Replace the store with recipes, or upsert them over it, and make
+        the result durable with a snapshot.
+
+        A replacement is indexed before taking the write lock; a merge has
+        to be built inside it so no concurrent write is lost. The snapshot
+        is on disk before the lock is released: writes made after the swap
+        are logged to the segment that follows it, and recovery must find
+        them a snapshot to replay onto.
+        """
+        state = None if merge else _StoreState.build(records)
+        with self._lock:
+            if merge:
+                state = _StoreState.build({**self._state.records, **records})
+            else:
+                for recipe_id in self._state.records:
+                    if recipe_id not in records:
+                        self._changes.record(recipe_id, deleted=True)
+            for recipe_id in records:
+                self._changes.record(recipe_id)
+            # The old similarity index keeps answering (and following
+            # writes) until the rebuild for the new records is swapped in
+            state.similar = self._state.similar
+            self._state = state
+            self.generation += 1
+            if self._wal is not None:
+                self._write_snapshot(*self._capture())
+        self._rebuild_similar()
+        self._notify(None)
+
+    def _rebuild_similar(self):
+        """Rebuild the similarity index in a background thread.
+
+        Building takes seconds for a large catalog, so it runs off the write
+        lock from a copy of the records, then takes the lock to catch up
+        with writes made meanwhile and swaps the new index in. Requests
+        made while a build runs are folded into one more build.
+        """
+        with self._similar_lock:
+            self._similar_requested = True
+            if self._similar_builder is not None:
+                return
+            self._similar_builder = threading.Thread(
+                target=self._build_similar, name="recipe-similarity", daemon=True)
+            self._similar_builder.start()
+
+    def _build_similar(self):
+        while True:
+            with self._similar_lock:
+                if not self._similar_requested:
+                    self._similar_builder = None
+                    return
+                self._similar_requested = False
+            state = self._state
+            started = time.perf_counter()
+            index = SimilarityIndex.build(list(state.records.values()))
+            with self._lock:
+                # A state swapped out meanwhile has requested another build
+                swapped = self._state is state
+                if swapped:
+                    index.sync(state.records)
+                    state.similar = index
+                    self.similar_generation += 1
+            if swapped:
+                self._notify_similar()
+            logger.info("Built similarity index over %d recipes in %.3fs",
+                        len(index), time.perf_counter() - started)
+
+    def wait_for_similar(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a background similarity rebuild; False on timeout"""
+        builder = self._similar_builder
+        if builder is None:
+            return True
+        builder.join(timeout)
+        return not builder.is_alive()
+
+    def _compact_similar(self):
+        # Updates and deletes leave dead rows behind
+        if self._state.similar.stale:
+            self._rebuild_similar()
+    
+    def _snapshot_periodically(self, interval: float):
+        while not self._stopped.wait(interval):
+            if self._writes_since_snapshot >= self._snapshot_min_writes:
+                self.checkpoint()
+    
+    def close(self):
+        """Stop import workers and background snapshots, and flush the log"""
+        if self._import_pool is not None:
+            self._import_pool.close()
+        if self._wal is None:
+            return
+        self._stopped.set()
+        self._snapshotter.join()
+        self._wal.close()
+        self._wal = None
+    
+    @property
+    def records(self) -> Dict[str, RecipeRecord]:
+        return self._state.records
+
+    def clear(self):
+        self._swap({})
+
+    def get_all_recipes(self, projection: Optional[Projection] = None) -> List[Union[Recipe, bytes]]:
+        """Every recipe, or with a projection every recipe's JSON in that shape"""
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
+        return [convert(record) for record in self.records.values()]
+    
+    def snapshot(self) -> Iterator[Recipe]:
+        """Point-in-time stream of recipes for long-running reads like export.
+
+        The records are captured up front; writers replace records rather
+        than mutating them, so the stream never changes underneath the
+        caller. Recipes are materialized one at a time as it is consumed.
+        A generator, so it can be closed like the SQLite backend's stream.
+        """
+        return (record.to_recipe() for record in list(self.records.values()))
+
     def get_recipe(self, recipe_id: str) -> Optional[Recipe]:
-        return self.recipes.get(recipe_id)
+        record = self.records.get(recipe_id)
+        return record.to_recipe() if record is not None else None
+
+    def get_many(self, recipe_ids: Iterable[str],
+                 projection: Optional[Projection] = None) -> Dict[str, Union[Recipe, bytes]]:
+        """Recipes by id, for those of the ids that exist"""
+        records = map(self.records.get, recipe_ids)
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
+        return {record.id: convert(record) for record in records if record is not None}
+
+    def get_encoded_recipe(self, recipe_id: str) -> Optional[EncodedRecipe]:
+        """A recipe's cached JSON with its cache validators, without building the model"""
+        record = self.records.get(recipe_id)
+        if record is None:
+            return None
+        updated_offset = record.offsets[1] if record.offsets else None
+        return EncodedRecipe(record.id, record.version,
+                             from_micros(record.updated_at, updated_offset), record.to_json())
     
-    def search_recipes(self, query: str) -> List[Recipe]:
-        if not query:
-            return self.get_all_recipes()
-        
-        # Case-insensitive title search
-        query_lower = query.lower()
+    def search_recipes(self, query: str,
+                       projection: Optional[Projection] = None) -> List[Union[Recipe, bytes]]:
+        """Recipes matching every query term, most relevant first"""
+        if not query or not query.strip():
+            return self.get_all_recipes(projection)
+
+        state = self._state
+        hits = state.search_index.rank(query).hits
+        # A concurrent delete may remove a recipe after the index lookup
+        records = (state.records.get(recipe_id) for _, recipe_id in hits)
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
+        return [convert(record) for record in records if record is not None]
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Suggestion]:
+        """Typeahead suggestions for a partly typed search"""
+        return self._state.suggestions.suggest(prefix, limit)
+
+    def match_pantry(self, pantry: List[str], limit: int = DEFAULT_MATCHES,
+                     max_missing: Optional[int] = None, projection: Optional[Projection] = None,
+                     ) -> Tuple[List[Tuple[PantryMatch, Union[Recipe, bytes]]], int]:
+        """Recipes that can be cooked (or nearly) from a pantry, best first,
+        and how many recipes use any of it; see IngredientIndex.match"""
+        state = self._state
+        matches, total = state.ingredients.match(pantry, limit, max_missing)
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
         results = []
-        for recipe in self.recipes.values():
-            if query_lower in recipe.title.lower():
-                results.append(recipe)
+        for match in matches:
+            record = state.records.get(match.recipe_id)
+            if record is not None:
+                results.append((match, convert(record)))
+        return results, total
+
+    def similar_recipes(self, recipe_id: str, limit: int = DEFAULT_SIMILAR,
+                        projection: Optional[Projection] = None,
+                        ) -> Optional[List[Tuple[Union[Recipe, bytes], float]]]:
+        """The recipes most like one recipe with their cosine similarity,
+        best first; None if the recipe doesn't exist"""
+        state = self._state
+        record = state.records.get(recipe_id)
+        if record is None:
+            return None
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
+        results = []
+        # Ask for a few extra: until a rebuild after an import completes,
+        # the index can still hold recipes that are gone
+        for similar_id, score in state.similar.similar(record, limit + 8):
+            similar = state.records.get(similar_id)
+            if similar is not None:
+                results.append((convert(similar), score))
+                if len(results) == limit:
+                    break
         return results
+
+    @property
+    def change_seq(self) -> int:
+        """Sequence number of the latest write, where a change feed reader
+        that has everything up to now starts"""
+        return self._changes.seq
+
+    def get_changes(self, since: int = 0, limit: int = DEFAULT_CHANGES) -> ChangePage:
+        """Latest change of each recipe written after sequence number since,
+        oldest first. Raises ChangesExpired if since predates tombstones
+        that have been compacted away."""
+        changes, next_since, has_more = self._changes.since(since, limit)
+        records = self.records
+        page = []
+        for change in changes:
+            if change.deleted:
+                page.append((change, None))
+                continue
+            record = records.get(change.recipe_id)
+            # Deleted since the scan; its tombstone comes later in the log
+            if record is not None:
+                page.append((change, record.to_json()))
+        return ChangePage(page, next_since, has_more)
+
+    def get_page(self, limit: int, after: Optional[PageKey] = None,
+                 query: Optional[str] = None, filters: Optional[Dict[str, List[str]]] = None,
+                 match: str = "any", facets: bool = False,
+                 projection: Optional[Projection] = None) -> RecipePage:
+        """One page of recipes starting after the given key.
+
+        Without a query pages follow the listing order and keys are
+        (created_at, id); with one they follow relevance and keys are
+        (score, id). Facet filters narrow the result set; with facets=True
+        the page also carries facet counts for the whole result set, and with
+        a projection it holds each recipe's JSON in that shape instead of models.
+        Raises ValueError for unknown facets or match modes, or a key of the
+        wrong kind.
+        """
+        state = self._state
+        searched = bool(query and query.strip())
+        if after is not None and isinstance(after[0], datetime) == searched:
+            raise ValueError("Cursor does not belong to this listing")
+        filtered = state.facets.filter(filters, match) if filters else None
+
+        if searched:
+            ranked = state.search_index.rank(query, limit + 1, after=after, within=filtered)
+            ids = ranked.matches
+            hits = ranked.hits
+            page_ids = [recipe_id for _, recipe_id in hits[:limit]]
+            next_key = hits[limit - 1] if len(hits) > limit else None
+            total = len(ids)
+        else:
+            ids = filtered
+            after_key = (to_micros(after[0]), after[1]) if after is not None else None
+            if ids is None:
+                page_keys, has_more = self._walk_order(state.order, after_key, limit)
+                total = len(state.order)
+            else:
+                page_keys, has_more = self._page_keys(state, ids, after_key, limit)
+                total = len(ids)
+            page_ids = [recipe_id for _, recipe_id in page_keys]
+            next_key = None
+            if has_more:
+                micros, recipe_id = page_keys[-1]
+                next_key = (from_micros(micros), recipe_id)
+
+        records = map(state.records.get, page_ids)
+        convert = projection.from_record if projection else RecipeRecord.to_recipe
+        return RecipePage(
+            recipes=[convert(record) for record in records if record is not None],
+            next_key=next_key,
+            total=total,
+            facets=self._facet_counts(state, ids, searched, filters, match) if facets else None,
+        )
+
+    @staticmethod
+    def _facet_counts(state: _StoreState, ids: Optional[set], searched: bool,
+                      filters: Optional[Dict[str, List[str]]], match: str):
+        # Filters alone map straight onto bitmaps; search results have to be
+        # turned into one, which costs a lookup per match
+        if searched:
+            return state.facets.counts(state.facets.to_bits(ids))
+        return state.facets.counts(state.facets.filter_bits(filters or {}, match))
+
+    @staticmethod
+    def _walk_order(order: List[RecordKey], after_key: Optional[RecordKey], limit: int,
+                    ids: Optional[set] = None):
+        """Up to limit keys from the global order (those in ids, if given),
+        bisecting to the start so the cost doesn't grow with page depth"""
+        start = bisect_right(order, after_key) if after_key is not None else 0
+        if ids is None:
+            page_keys = order[start:start + limit]
+            return page_keys, start + limit < len(order)
+        page_keys = []
+        for i in range(start, len(order)):
+            key = order[i]
+            if key[1] in ids:
+                if len(page_keys) == limit:
+                    return page_keys, True
+                page_keys.append(key)
+        return page_keys, False
+
+    def _page_keys(self, state: _StoreState, ids: set, after_key: Optional[RecordKey], limit: int):
+        # Walking the global order skips about len(order) / len(ids) keys per
+        # hit; sorting costs len(ids) log len(ids). Walk when matches are dense.
+        if len(ids) * len(ids) > limit * len(state.order):
+            return self._walk_order(state.order, after_key, limit, ids)
+        matches = map(state.records.get, ids)
+        keys = sorted(record.sort_key for record in matches if record is not None)
+        start = bisect_right(keys, after_key) if after_key is not None else 0
+        return keys[start:start + limit], start + limit < len(keys)
     
+    @staticmethod
+    def _updated(old_record: RecipeRecord, recipe_data: RecipeUpdate) -> Recipe:
+        # Build a new recipe instead of mutating the stored record so
+        # readers and snapshots keep seeing a complete old version
+        updated_data = recipe_data.model_dump(exclude_none=True)
+        updated_data["updated_at"] = datetime.now()
+        updated_data["version"] = old_record.version + 1
+        return old_record.to_recipe().model_copy(update=updated_data)
+
     def create_recipe(self, recipe_data: RecipeCreate) -> Recipe:
         recipe = Recipe(**recipe_data.model_dump())
-        self.recipes[recipe.id] = recipe
+        record = RecipeRecord.from_recipe(recipe)
+        with self._lock:
+            self._state.put(record)
+            at = time.time()
+            self._changes.record(recipe.id, at=at)
+            self.generation += 1
+            position = self._log("put", record.to_row(), at)
+        self._commit(position)
+        self._notify({recipe.id})
         return recipe
     
-    def update_recipe(self, recipe_id: str, recipe_data: RecipeUpdate) -> Optional[Recipe]:
-        if recipe_id not in self.recipes:
-            return None
-        
-        recipe = self.recipes[recipe_id]
-        updated_data = recipe_data.model_dump()
-        for key, value in updated_data.items():
-            setattr(recipe, key, value)
-        recipe.updated_at = datetime.now()
-        
-        self.recipes[recipe_id] = recipe
+    def update_recipe(self, recipe_id: str, recipe_data: RecipeUpdate,
+                      expected_version: Optional[int] = None) -> Optional[Recipe]:
+        """Apply a partial update. Raises VersionConflict if expected_version
+        is given and the stored recipe has moved on."""
+        with self._lock:
+            old_record = self._state.records.get(recipe_id)
+            if old_record is None:
+                return None
+            if expected_version is not None and old_record.version != expected_version:
+                raise VersionConflict(recipe_id, old_record.version)
+            recipe = self._updated(old_record, recipe_data)
+            record = RecipeRecord.from_recipe(recipe)
+            self._state.put(record)
+            at = time.time()
+            self._changes.record(recipe_id, at=at)
+            self.generation += 1
+            position = self._log("put", record.to_row(), at)
+        self._commit(position)
+        self._compact_similar()
+        self._notify({recipe.id})
         return recipe
     
-    def delete_recipe(self, recipe_id: str) -> bool:
-        if recipe_id in self.recipes:
-            del self.recipes[recipe_id]
-            return True
-        return False
+    def delete_recipe(self, recipe_id: str, expected_version: Optional[int] = None) -> bool:
+        with self._lock:
+            record = self._state.records.get(recipe_id)
+            if record is None:
+                return False
+            if expected_version is not None and record.version != expected_version:
+                raise VersionConflict(recipe_id, record.version)
+            self._state.remove(recipe_id)
+            at = time.time()
+            self._changes.record(recipe_id, deleted=True, at=at)
+            self.generation += 1
+            position = self._log("delete", recipe_id, at)
+        self._commit(position)
+        self._compact_similar()
+        self._notify({recipe_id})
+        return True
+
+    def apply_batch(self, operations: List[BatchOperation]) -> List[BatchResult]:
+        """Apply validated batch operations under one hold of the write lock.
+
+        Operations are independent: one whose recipe is missing or at
+        another version is reported and the rest still apply. The batch is
+        logged as a single record and bumps the generation and notifies
+        caches once, however many recipes it touches.
+        """
+        results = []
+        logged = []
+        with self._lock:
+            state = self._state
+            at = time.time()
+            for operation in operations:
+                result, entry = self._apply(state, operation)
+                results.append(result)
+                if entry is not None:
+                    self._changes.record(result.id, deleted=entry[0] == "delete", at=at)
+                    logged.append(entry)
+            position = None
+            if logged:
+                self.generation += 1
+                position = self._log("batch", logged, at)
+        self._commit(position)
+        if logged:
+            self._compact_similar()
+            self._notify({result.id for result in results if result.status in BATCH_APPLIED})
+        return results
+
+    def _apply(self, state: _StoreState, operation: BatchOperation) -> Tuple[BatchResult, Optional[tuple]]:
+        """One batch operation; returns its result and log entry, if it changed anything"""
+        index, op, recipe_id = operation.index, operation.op, operation.recipe_id
+        if op == "create":
+            recipe = Recipe(**operation.data.model_dump())
+            record = RecipeRecord.from_recipe(recipe)
+            state.put(record)
+            return (BatchResult(index=index, op=op, id=recipe.id, status="created", version=recipe.version),
+                    ("put", record.to_row()))
+
+        old_record = state.records.get(recipe_id)
+        if old_record is None:
+            return BatchResult(index=index, op=op, id=recipe_id, status="not_found",
+                               error="Recipe not found"), None
+        expected = operation.expected_version
+        if expected is not None and old_record.version != expected:
+            return BatchResult(index=index, op=op, id=recipe_id, status="conflict",
+                               version=old_record.version,
+                               error="Recipe has been modified"), None
+        if op == "delete":
+            state.remove(recipe_id)
+            return BatchResult(index=index, op=op, id=recipe_id, status="deleted"), ("delete", recipe_id)
+        recipe = self._updated(old_record, operation.data)
+        record = RecipeRecord.from_recipe(recipe)
+        state.put(record)
+        return (BatchResult(index=index, op=op, id=recipe_id, status="updated", version=recipe.version),
+                ("put", record.to_row()))
     
-    def import_recipes(self, recipes_data: List[dict]) -> int:
-        # Replace all existing recipes
-        self.recipes.clear()
-        count = 0
+    def import_recipes(self, records: Iterable[Any], mode: str = "replace") -> ImportReport:
+        """Validate records in batches and swap the result in atomically.
+
+        "replace" swaps in exactly the imported recipes; "merge" upserts them
+        over the current ones. Invalid records are reported, not stored, and
+        the live store is untouched until every record has been processed.
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
         
-        for recipe_dict in recipes_data:
-            try:
-                # Handle datetime strings if they exist
-                if 'created_at' in recipe_dict:
-                    recipe_dict['created_at'] = datetime.fromisoformat(recipe_dict['created_at'])
-                if 'updated_at' in recipe_dict:
-                    recipe_dict['updated_at'] = datetime.fromisoformat(recipe_dict['updated_at'])
-                
-                recipe = Recipe(**recipe_dict)
-                self.recipes[recipe.id] = recipe
-                count += 1
-            except Exception:
-                # Skip invalid recipes
-                continue
+        imported: Dict[str, RecipeRecord] = {}
+        report = ImportReport(mode=mode, count=0)
+        # Validation runs without the write lock; only the merge and swap
+        # need to exclude other writers
+        for batch in validated_batches(records, report, self._import_pool):
+            for record in batch:
+                imported[record.id] = record
         
-        return count
+        # Imports are made durable by snapshotting the new dataset rather
+        # than logging every row
+        self._swap(imported, merge=mode == "merge")
+        return report
+
+    def count(self) -> int:
+        return len(self.records)
+
+    def memory_stats(self, sample_size: int = 1000) -> Dict[str, Any]:
+        """Estimated bytes per stored recipe, for sizing instances.
+
+        Record sizes are measured on a sample of records (shared strings
+        counted once), index sizes on the index containers themselves.
+        model_bytes_per_recipe is what the same sample would take as Recipe
+        models, for comparison.
+        """
+        state = self._state
+        count = len(state.records)
+        sample = list(islice(state.records.values(), sample_size))
+        if not sample:
+            return {"recipes": 0, "sampled": 0, "record_bytes_per_recipe": 0,
+                    "model_bytes_per_recipe": 0, "index_bytes_per_recipe": 0,
+                    "bytes_per_recipe": 0}
+
+        record_bytes = deep_sizeof(sample) / len(sample)
+        model_bytes = deep_sizeof([record.to_recipe() for record in sample]) / len(sample)
+        # The records dict, the ordered key list (its tuples and ints; the id
+        # strings are the records' own) and the search postings (small int
+        # impacts are shared objects)
+        key_bytes = sys.getsizeof(state.order[0]) + sys.getsizeof(state.order[0][0]) if state.order else 0
+        index_bytes = (
+            sys.getsizeof(state.records)
+            + sys.getsizeof(state.order) + key_bytes * len(state.order)
+            + sys.getsizeof(state.search_index.postings)
+            + sum(sys.getsizeof(token) + sys.getsizeof(docs)
+                  for token, docs in state.search_index.postings.items())
+            + state.similar.nbytes
+        )
+        return {
+            "recipes": count,
+            "sampled": len(sample),
+            "record_bytes_per_recipe": round(record_bytes),
+            "model_bytes_per_recipe": round(model_bytes),
+            "index_bytes_per_recipe": round(index_bytes / count),
+            "bytes_per_recipe": round(record_bytes + index_bytes / count),
+        }
+
+
+def create_storage():
+    """Build the storage backend selected by RECIPE_STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "memory":
+        return RecipeStorage(
+            data_dir=DATA_DIR,
+            fsync_policy=WAL_FSYNC_POLICY,
+            fsync_interval=WAL_FSYNC_INTERVAL,
+            snapshot_interval=SNAPSHOT_INTERVAL,
+            snapshot_min_writes=SNAPSHOT_MIN_WRITES,
+            change_retention=CHANGE_RETENTION,
+            import_workers=IMPORT_WORKERS,
+        )
+    if STORAGE_BACKEND == "sqlite":
+        from app.services.sqlite_storage import SQLiteRecipeStorage
+        return SQLiteRecipeStorage(SQLITE_PATH, pool_size=SQLITE_POOL_SIZE,
+                                   change_retention=CHANGE_RETENTION, import_workers=IMPORT_WORKERS)
+    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
 
 
 # Global storage instance (intentionally simple for refactoring)
-recipe_storage = RecipeStorage()
+recipe_storage = create_storage()
+
+# Recipe detail views, API and HTML alike; backs /api/recipes/popular.
+# Kept out of the store: views are not recipe data and are not persisted.
+recipe_views = ViewCounter(half_life=VIEW_HALF_LIFE, flush_interval=VIEW_FLUSH_INTERVAL)
@@ -0,0 +1,147 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from app.services.records import RecipeRecord
+from app.services.search_index import tokenize
+
+# Bounds for the limit parameter of /api/recipes/suggest
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 25
+
+# (what the user typed is matched against, kind, text shown)
+Entry = Tuple[str, str, str]
+
+
+class Suggestion(NamedTuple):
+    text: str
+    kind: str  # "title", "ingredient", "cuisine" or "tag"
+    count: int  # recipes it occurs in
+
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces, as typed prefixes are compared"""
+    return " ".join(tokenize(text))
+
+
+def record_terms(record: RecipeRecord) -> Iterator[Tuple[str, str]]:
+    """(kind, text) pairs a recipe contributes, each once"""
+    yield "title", record.title
+    yield "cuisine", record.cuisine
+    for tag in set(record.tags):
+        yield "tag", tag
+    for ingredient in record.ingredient_names:
+        yield "ingredient", ingredient
+
+
+def entry_keys(kind: str, text: str) -> List[str]:
+    """Keys a term is found under; titles also match from any word"""
+    words = tokenize(text)
+    if not words:
+        return []
+    if kind == "title":
+        return [" ".join(words[i:]) for i in range(len(words))]
+    return [" ".join(words)]
+
+
+class SuggestIndex:
+    """Typeahead over titles, normalized ingredients, cuisines and tags.
+
+    Terms are ranked by how many recipes they occur in. Entries live in one
+    sorted array per count, so a lookup walks the counts from the highest
+    down, bisecting each array to the typed prefix, and stops as soon as it
+    has enough suggestions. Most titles are unique and share the count-1
+    array, where only the first few matches are ever read.
+    """
+
+    def __init__(self):
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._tiers: Dict[int, List[Entry]] = {}
+        # Counts that have a tier, ascending
+        self._levels: List[int] = []
+
+    @classmethod
+    def build(cls, records: Iterable[RecipeRecord]) -> "SuggestIndex":
+        index = cls()
+        counts = index._counts
+        for record in records:
+            for term in record_terms(record):
+                counts[term] = counts.get(term, 0) + 1
+        # One sort per tier instead of an insort per entry
+        for (kind, text), count in counts.items():
+            tier = index._tiers.setdefault(count, [])
+            tier.extend((key, kind, text) for key in entry_keys(kind, text))
+        for tier in index._tiers.values():
+            tier.sort()
+        index._levels = sorted(index._tiers)
+        return index
+
+    def _move(self, kind: str, text: str, old: int, new: int):
+        entries = [(key, kind, text) for key in entry_keys(kind, text)]
+        if old > 0:
+            tier = self._tiers[old]
+            for entry in entries:
+                del tier[bisect_left(tier, entry)]
+            if not tier:
+                del self._tiers[old]
+                del self._levels[bisect_left(self._levels, old)]
+        if new > 0:
+            tier = self._tiers.get(new)
+            if tier is None:
+                tier = self._tiers[new] = []
+                insort(self._levels, new)
+            for entry in entries:
+                insort(tier, entry)
+
+    def _change(self, terms: Iterable[Tuple[str, str]], delta: int):
+        for term in terms:
+            old = self._counts.get(term, 0)
+            new = old + delta
+            if new > 0:
+                self._counts[term] = new
+            else:
+                self._counts.pop(term, None)
+            self._move(*term, old, new)
+
+    def add(self, record: RecipeRecord):
+        self._change(record_terms(record), 1)
+
+    def remove(self, record: RecipeRecord):
+        self._change(record_terms(record), -1)
+
+    def add_terms(self, terms: Iterable[Tuple[str, str]]):
+        """add() for a recipe's record_terms(), for owners that keep those
+        rather than the records"""
+        self._change(terms, 1)
+
+    def remove_terms(self, terms: Iterable[Tuple[str, str]]):
+        self._change(terms, -1)
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Suggestion]:
+        """Up to limit terms starting with prefix (or a title word starting
+        with it), most common first"""
+        key = normalize(prefix)
+        if not key:
+            return []
+        suggestions: List[Suggestion] = []
+        seen = set()
+        # Copies: a writer may add or drop tiers meanwhile
+        for count in reversed(list(self._levels)):
+            tier = self._tiers.get(count)
+            if tier is None:
+                continue
+            i = bisect_left(tier, (key,))
+            while True:
+                try:
+                    entry_key, kind, text = tier[i]
+                except IndexError:
+                    # Past the end, or the tier shrank under us
+                    break
+                if not entry_key.startswith(key):
+                    break
+                if (kind, text) not in seen:
+                    seen.add((kind, text))
+                    suggestions.append(Suggestion(text, kind, count))
+                    if len(suggestions) == limit:
+                        return suggestions
+                i += 1
+        return suggestions
@@ -0,0 +1,200 @@
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+FSYNC_POLICIES = ("always", "interval", "off")
+
+_HEADER = struct.Struct("<II")  # payload length, crc32
+
+
+def _segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"wal-{segment:08d}.log")
+
+
+def _snapshot_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"snapshot-{segment:08d}.bin")
+
+
+def _numbered(directory: str, prefix: str) -> List[int]:
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix + "-") and not name.endswith(".tmp"):
+            numbers.append(int(name[len(prefix) + 1:].split(".")[0]))
+    return sorted(numbers)
+
+
+class WriteAheadLog:
+    """Append-only, segmented log of storage mutations.
+
+    Each record is pickled and framed with its length and CRC so a torn
+    write at the tail is detected and ignored on replay. With the "always"
+    fsync policy, writers that arrive while another thread is in fsync are
+    covered by the next single fsync (group commit). "interval" fsyncs from
+    a background thread and "off" leaves flushing to the OS.
+    """
+
+    def __init__(self, directory: str, segment: int, fsync_policy: str = "always",
+                 fsync_interval: float = 0.05):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.segment = segment
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file = open(_segment_path(directory, segment), "ab")
+        self._written = 0
+        self._synced = 0
+        self._closed = threading.Event()
+        self._syncer = None
+        if fsync_policy == "interval":
+            self._syncer = threading.Thread(
+                target=self._sync_periodically, args=(fsync_interval,),
+                name="wal-fsync", daemon=True,
+            )
+            self._syncer.start()
+
+    def append(self, record: Any) -> int:
+        """Write a record and return its log position.
+
+        The record is handed to the OS but not necessarily on disk yet; call
+        commit() with the position before acknowledging the write.
+        """
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        frame = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._file.write(frame)
+            self._file.flush()
+            self._written += 1
+            return self._written
+
+    def commit(self, position: int):
+        """Make the record at position durable according to the fsync policy"""
+        if self.fsync_policy == "always":
+            self._sync_through(position)
+
+    def _sync_through(self, position: int):
+        with self._sync_lock:
+            if self._synced >= position:
+                # Another writer's fsync already covered this record
+                return
+            with self._lock:
+                target = self._written
+                # A private descriptor stays valid even if rotate() closes
+                # the file while we are in fsync
+                fileno = os.dup(self._file.fileno())
+            try:
+                os.fsync(fileno)
+            finally:
+                os.close(fileno)
+            self._synced = max(self._synced, target)
+
+    def _sync_periodically(self, interval: float):
+        while not self._closed.wait(interval):
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            position = self._written
+        if position:
+            self._sync_through(position)
+
+    def rotate(self) -> int:
+        """Start a new segment and return its number.
+
+        Every record appended before this call is in an older segment.
+        """
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self.segment += 1
+            self._file = open(_segment_path(self.directory, self.segment), "ab")
+            # Positions keep counting across segments; the old one is synced
+            self._synced = self._written
+        return self.segment
+
+    def close(self):
+        self._closed.set()
+        if self._syncer is not None:
+            self._syncer.join()
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def read_segment(path: str) -> Iterator[Any]:
+    """Yield records from a log segment, stopping at a torn or corrupt tail"""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield pickle.loads(payload)
+
+
+def write_snapshot(directory: str, segment: int, rows: List[tuple], changes: Any = None):
+    """Atomically write a snapshot covering every log segment before `segment`.
+
+    changes (the change log's state) is pickled after the rows, so
+    snapshots written before it existed still load.
+    """
+    path = _snapshot_path(directory, segment)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if changes is not None:
+            pickle.dump(changes, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def remove_before(directory: str, segment: int):
+    """Delete snapshots and log segments made obsolete by snapshot `segment`"""
+    for number in _numbered(directory, "snapshot"):
+        if number < segment:
+            os.remove(_snapshot_path(directory, number))
+    for number in _numbered(directory, "wal"):
+        if number < segment:
+            os.remove(_segment_path(directory, number))
+
+
+def recover(directory: str) -> Tuple[Optional[List[tuple]], List[Any], int, Any]:
+    """Load the newest snapshot and the log records written after it.
+
+    Returns (snapshot rows or None if there is no snapshot, log records
+    to replay in order, the next free segment number, the change log state
+    stored with the snapshot or None).
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshots = _numbered(directory, "snapshot")
+    segments = _numbered(directory, "wal")
+
+    rows = None
+    changes = None
+    start = 0
+    if snapshots:
+        start = snapshots[-1]
+        with open(_snapshot_path(directory, start), "rb") as f:
+            rows = pickle.load(f)
+            try:
+                changes = pickle.load(f)
+            except EOFError:
+                pass
+
+    records = []
+    for number in segments:
+        if number >= start:
+            records.extend(read_segment(_segment_path(directory, number)))
+
+    next_segment = max([start] + [number + 1 for number in segments])
+    return rows, records, next_segment, changes
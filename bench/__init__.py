@@ -0,0 +1 @@
+"""Benchmark harness for Recipe Explorer (python -m bench --help)"""
@@ -0,0 +1,55 @@
+"""Command line entry point: python -m bench --size 10000 --output results.json"""
+import argparse
+import asyncio
+import json
+import sys
+
+from bench.corpus import write_ndjson
+from bench.harness import SCENARIOS, compare, load, run_benchmark
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__)
+    parser.add_argument("--size", type=int, default=10_000, help="recipes in the corpus (1k to 1M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200, help="requests per read scenario")
+    parser.add_argument("--bulk-runs", type=int, default=3, help="runs of import and export")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight at once")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--write-corpus", metavar="PATH",
+                        help="only write the corpus as NDJSON to PATH and exit")
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        with open(args.write_corpus, "w", encoding="utf-8") as out:
+            write_ndjson(out, args.size, args.seed)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Imported here so --write-corpus doesn't build the app and its storage
+    from app.main import app
+
+    results = asyncio.run(run_benchmark(
+        app, args.size, seed=args.seed, requests=args.requests, bulk_runs=args.bulk_runs,
+        concurrency=args.concurrency, scenarios=scenarios,
+    ))
+    if args.baseline:
+        results["change_pct"] = compare(load(args.baseline), results)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            out.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Deterministic synthetic recipe corpus.
+
+Recipes are shaped like app.models.Recipe. Ingredients, cuisines and tags
+are drawn from Zipf distributions, so a few are everywhere and most are
+rare, like in a real catalog. The same (count, seed) always yields the
+same recipes, which keeps benchmark runs comparable between commits.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Any, Dict, Iterator, List, Sequence, TextIO
+
+ZIPF_EXPONENT = 1.1
+EPOCH = datetime(2020, 1, 1)
+
+INGREDIENTS = [
+    "salt", "olive oil", "garlic", "onion", "butter", "black pepper", "flour", "sugar",
+    "eggs", "milk", "water", "tomato", "lemon juice", "chicken breast", "parsley",
+    "carrot", "celery", "potato", "rice", "heavy cream", "soy sauce", "ginger", "cumin",
+    "paprika", "chili flakes", "basil", "thyme", "rosemary", "oregano", "bay leaf",
+    "vegetable stock", "chicken stock", "beef stock", "red wine", "white wine",
+    "vinegar", "honey", "brown sugar", "baking powder", "baking soda", "vanilla extract",
+    "cinnamon", "nutmeg", "coriander", "turmeric", "garam masala", "coconut milk",
+    "lime", "cilantro", "scallion", "shallot", "mushroom", "spinach", "kale", "cabbage",
+    "bell pepper", "zucchini", "eggplant", "cauliflower", "broccoli", "green beans",
+    "peas", "corn", "chickpeas", "black beans", "lentils", "kidney beans", "tofu",
+    "pork shoulder", "ground beef", "bacon", "sausage", "lamb", "shrimp", "salmon",
+    "cod", "tuna", "mussels", "squid", "cheddar", "parmesan", "mozzarella", "feta",
+    "ricotta", "cheese curds", "yogurt", "sour cream", "cream cheese", "pasta",
+    "spaghetti", "noodles", "bread crumbs", "tortillas", "pita", "puff pastry",
+    "walnuts", "almonds", "peanuts", "cashews", "sesame seeds", "sesame oil",
+    "fish sauce", "oyster sauce", "hoisin sauce", "miso", "tahini", "mustard",
+    "mayonnaise", "ketchup", "worcestershire sauce", "capers", "olives", "anchovies",
+    "pine nuts", "raisins", "dates", "apple", "pear", "banana", "strawberries",
+    "blueberries", "raspberries", "mango", "pineapple", "orange zest", "dark chocolate",
+    "cocoa powder", "maple syrup", "cornstarch", "potato starch", "rice vinegar",
+    "star anise", "cardamom", "cloves", "saffron", "fennel", "leek", "beetroot",
+    "radish", "cucumber", "avocado", "jalapeno", "chipotle", "smoked paprika",
+    "dill", "mint", "tarragon", "chives", "horseradish", "pickles", "sauerkraut",
+]
+
+CUISINES = [
+    "Italian", "Mexican", "Chinese", "Indian", "French", "Japanese", "Thai", "Spanish",
+    "Greek", "American", "Korean", "Vietnamese", "Turkish", "Lebanese", "Moroccan",
+    "Canadian", "Russian", "German", "British", "Brazilian", "Peruvian", "Ethiopian",
+    "Polish", "Hungarian", "Swedish", "Portuguese", "Filipino", "Indonesian",
+    "Malaysian", "Persian", "Georgian", "Jamaican", "Cuban", "Argentinian", "Irish",
+    "Nigerian", "Ukrainian", "Austrian", "Swiss", "Belgian",
+]
+
+TAGS = [
+    "dinner", "quick", "vegetarian", "easy", "comfort food", "healthy", "lunch",
+    "family", "weeknight", "gluten-free", "vegan", "spicy", "dessert", "breakfast",
+    "one-pot", "make-ahead", "baking", "grilling", "soup", "salad", "holiday",
+    "party", "budget", "high-protein", "low-carb", "dairy-free", "kid-friendly",
+    "slow cooker", "freezer-friendly", "brunch", "snack", "appetizer", "side dish",
+    "street food", "seafood", "meal prep", "summer", "winter", "autumn", "spring",
+    "picnic", "festive", "classic", "fusion", "raw", "fermented", "smoked", "pickled",
+    "no-bake", "stir-fry", "roast", "braise", "sandwich", "noodles", "rice bowl",
+]
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+DIFFICULTY_WEIGHTS = [5, 3, 1]
+
+DISHES = [
+    "Stew", "Soup", "Salad", "Curry", "Pie", "Tart", "Bake", "Roast", "Stir-Fry",
+    "Skillet", "Bowl", "Casserole", "Dumplings", "Noodles", "Risotto", "Tacos",
+    "Fritters", "Skewers", "Braise", "Gratin", "Flatbread", "Pancakes", "Cake",
+]
+STYLES = [
+    "Classic", "Smoky", "Crispy", "Creamy", "Spicy", "Rustic", "Golden", "Herbed",
+    "Slow-Cooked", "Grandma's", "Weeknight", "Charred", "Zesty", "Hearty", "Sticky",
+]
+AMOUNTS = ["1", "2", "3", "4", "1/2", "1/4", "3/4", "1 1/2", "200 g", "500 g", "1 kg"]
+UNITS = ["cups", "tablespoons", "teaspoons", "cloves", "pieces", "cans", "pinches", ""]
+PREPS = ["chopped", "diced", "minced", "sliced", "grated", "", "", ""]
+STEPS = [
+    "Prepare the {a} and {b}.",
+    "Heat a large pan over medium heat and add the {a}.",
+    "Stir in the {b} and cook for {n} minutes until fragrant.",
+    "Add the {a} and simmer for {n} minutes, stirring occasionally.",
+    "Season with {b} to taste.",
+    "Whisk the {a} with the {b} in a bowl until smooth.",
+    "Bake at 180°C for {n} minutes until golden.",
+    "Rest for {n} minutes, then serve topped with {b}.",
+]
+
+
+class ZipfSampler:
+    """Draws items with probability proportional to 1 / rank ** exponent"""
+
+    def __init__(self, items: Sequence[str], exponent: float = ZIPF_EXPONENT):
+        self.items = list(items)
+        self._cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(items) + 1)))
+
+    def one(self, rng: random.Random) -> str:
+        return rng.choices(self.items, cum_weights=self._cum_weights)[0]
+
+    def distinct(self, rng: random.Random, k: int) -> List[str]:
+        """k distinct items, still Zipf-weighted"""
+        chosen: List[str] = []
+        while len(chosen) < k:
+            for item in rng.choices(self.items, cum_weights=self._cum_weights, k=k):
+                if item not in chosen:
+                    chosen.append(item)
+                    if len(chosen) == k:
+                        break
+        return chosen
+
+
+ingredient_sampler = ZipfSampler(INGREDIENTS)
+cuisine_sampler = ZipfSampler(CUISINES)
+tag_sampler = ZipfSampler(TAGS)
+
+
+def recipe_id(index: int) -> str:
+    return f"bench-{index:07d}"
+
+
+def _ingredient_line(rng: random.Random, name: str) -> str:
+    parts = [rng.choice(AMOUNTS), rng.choice(UNITS), name, rng.choice(PREPS)]
+    return " ".join(part for part in parts if part)
+
+
+def make_recipe(rng: random.Random, index: int) -> Dict[str, Any]:
+    """One recipe as a JSON-ready dict, using only rng for randomness"""
+    names = ingredient_sampler.distinct(rng, rng.randint(4, 12))
+    cuisine = cuisine_sampler.one(rng)
+    title = f"{rng.choice(STYLES)} {names[0].title()} {rng.choice(DISHES)}"
+    steps = [
+        rng.choice(STEPS).format(a=rng.choice(names), b=rng.choice(names), n=rng.randint(2, 45))
+        for _ in range(rng.randint(3, 8))
+    ]
+    created_at = EPOCH + timedelta(seconds=index * 600 + rng.randint(0, 599))
+    updated_at = created_at + timedelta(days=rng.randint(0, 30))
+    return {
+        "id": recipe_id(index),
+        "title": title,
+        "description": f"A {cuisine.lower()} take on {title.lower()} with {names[1]} and {names[2]}.",
+        "ingredients": [_ingredient_line(rng, name) for name in names],
+        "instructions": steps,
+        "cuisine": cuisine,
+        "tags": tag_sampler.distinct(rng, rng.randint(1, 5)),
+        "difficulty": rng.choices(DIFFICULTIES, weights=DIFFICULTY_WEIGHTS)[0],
+        "created_at": created_at.isoformat(),
+        "updated_at": updated_at.isoformat(),
+    }
+
+
+def iter_recipes(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield count recipes; memory use doesn't grow with count"""
+    rng = random.Random(seed)
+    for index in range(count):
+        yield make_recipe(rng, index)
+
+
+def write_ndjson(out: TextIO, count: int, seed: int = 0):
+    for recipe in iter_recipes(count, seed):
+        out.write(json.dumps(recipe))
+        out.write("\n")
+
+
+def search_terms(count: int, seed: int = 0) -> List[str]:
+    """Search queries mixing common and rare terms, single words, pairs and prefixes"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(ingredient_sampler.one(rng).split()[0])
+        elif kind == 1:
+            queries.append(f"{ingredient_sampler.one(rng)} {cuisine_sampler.one(rng)}")
+        elif kind == 2:
+            queries.append(cuisine_sampler.one(rng).lower())
+        else:
+            queries.append(ingredient_sampler.one(rng)[:3])
+    return queries
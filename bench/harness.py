@@ -0,0 +1,209 @@
+"""Drives the real app through an in-process ASGI client and times it.
+
+Every scenario issues its requests (optionally several at a time) and
+reports throughput plus latency percentiles. Requests are built from the
+seeded corpus, so two runs with the same arguments do the same work.
+"""
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from bench.corpus import recipe_id, search_terms, write_ndjson
+
+SCENARIOS = ("import", "export", "list", "search", "suggest", "detail", "html_home", "html_detail")
+PAGE_SIZE = 24
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+async def measure(calls: List[Callable[[], Awaitable[httpx.Response]]],
+                  concurrency: int) -> Dict[str, Any]:
+    """Run the calls with at most `concurrency` in flight and summarize them"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def timed(call):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await call()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _memory_stats() -> Optional[Dict[str, Any]]:
+    """Bytes per recipe in the storage backend, where it can tell"""
+    from app.services.storage import recipe_storage
+    memory_stats = getattr(recipe_storage, "memory_stats", None)
+    return memory_stats() if memory_stats is not None else None
+
+
+async def _page_cursors(client: httpx.AsyncClient, pages: int) -> List[Optional[str]]:
+    """Walk the listing once (untimed) to collect cursors for `pages` pages"""
+    cursors: List[Optional[str]] = [None]
+    while len(cursors) < pages:
+        response = await client.get("/api/recipes", params={"limit": PAGE_SIZE, "cursor": cursors[-1]}
+                                    if cursors[-1] else {"limit": PAGE_SIZE})
+        next_cursor = response.json()["next_cursor"]
+        if next_cursor is None:
+            break
+        cursors.append(next_cursor)
+    # Wrap around for small corpora so every scenario issues the same count
+    return [cursors[i % len(cursors)] for i in range(pages)]
+
+
+async def run_benchmark(app, size: int, seed: int = 0, requests: int = 200, bulk_runs: int = 3,
+                        concurrency: int = 1, scenarios=SCENARIOS) -> Dict[str, Any]:
+    """Load a corpus of `size` recipes through the import endpoint and time each scenario"""
+    rng = random.Random(seed + 2)
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as corpus:
+            started = time.perf_counter()
+            write_ndjson(corpus, size, seed)
+            generate_seconds = time.perf_counter() - started
+
+            async def upload():
+                corpus.seek(0)
+                return await client.post(
+                    "/api/recipes/import",
+                    files={"file": ("corpus.ndjson", corpus.buffer, "application/x-ndjson")},
+                    data={"mode": "replace"},
+                )
+
+            # Always import once so the other scenarios have data; the
+            # timed runs (if any) come after
+            response = await upload()
+            response.raise_for_status()
+            memory = _memory_stats()
+            if "import" in scenarios:
+                # One at a time: concurrent replace-imports would just queue
+                results["import"] = await measure([upload] * bulk_runs, 1)
+
+        if "export" in scenarios:
+            results["export"] = await measure(
+                [lambda: client.get("/api/recipes/export", params={"format": "ndjson"})] * bulk_runs,
+                concurrency,
+            )
+
+        if "list" in scenarios:
+            cursors = await _page_cursors(client, requests)
+            results["list"] = await measure([
+                (lambda c=c: client.get("/api/recipes", params={"limit": PAGE_SIZE, "cursor": c}
+                                        if c else {"limit": PAGE_SIZE}))
+                for c in cursors
+            ], concurrency)
+
+        queries = search_terms(requests, seed)
+        ids = [recipe_id(rng.randrange(size)) for _ in range(requests)]
+
+        if "search" in scenarios:
+            results["search"] = await measure([
+                (lambda q=q: client.get("/api/recipes", params={"search": q, "limit": PAGE_SIZE}))
+                for q in queries
+            ], concurrency)
+
+        if "suggest" in scenarios:
+            # Every prefix of each query, as if typed one key at a time
+            prefixes = [q[:n] for q in queries for n in range(1, len(q) + 1)][:requests]
+            results["suggest"] = await measure([
+                (lambda p=p: client.get("/api/recipes/suggest", params={"prefix": p}))
+                for p in prefixes
+            ], concurrency)
+
+        if "detail" in scenarios:
+            results["detail"] = await measure([
+                (lambda i=i: client.get(f"/api/recipes/{i}")) for i in ids
+            ], concurrency)
+
+        if "html_home" in scenarios:
+            results["html_home"] = await measure([
+                (lambda q=q: client.get("/", params={"search": q})) for q in queries
+            ], concurrency)
+
+        if "html_detail" in scenarios:
+            results["html_detail"] = await measure([
+                (lambda i=i: client.get(f"/recipes/{i}")) for i in ids
+            ], concurrency)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage_backend": os.getenv("RECIPE_STORAGE_BACKEND", "memory"),
+            "size": size,
+            "seed": seed,
+            "requests": requests,
+            "bulk_runs": bulk_runs,
+            "concurrency": concurrency,
+            "generate_seconds": round(generate_seconds, 4),
+        },
+        "memory": memory,
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Percent change per scenario for p50/p95/p99 and throughput (positive p99 = slower)"""
+    changes = {}
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            metric: round((result[metric] - before[metric]) / before[metric] * 100, 1)
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+            if before.get(metric)
+        }
+    return changes
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -16,9 +16,9 @@ def client():
 @pytest.fixture
 def clean_storage():
     """Reset storage before and after each test"""
-    recipe_storage.recipes.clear()
+    recipe_storage.clear()
     yield
-    recipe_storage.recipes.clear()
+    recipe_storage.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,70 @@
+"""
+Tests for admission control lanes and load shedding.
+"""
+import asyncio
+
+from app.main import admission
+from app.services.admission import Lane
+
+
+def test_lane_queues_then_sheds():
+    """A full lane queues up to its queue size, sheds the rest and hands slots on in order"""
+    async def scenario():
+        lane = Lane("test", limit=1, queue_size=1, max_wait=5)
+        assert await lane.acquire() is None
+        waiter = asyncio.ensure_future(lane.acquire())
+        await asyncio.sleep(0)
+        assert lane.queued == 1
+
+        shed = await lane.acquire()
+        assert shed.reason == "queue_full" and shed.retry_after >= 1
+
+        lane.release(0.5)
+        assert await waiter is None
+        assert (lane.active, lane.queued, lane.admitted) == (1, 0, 2)
+        lane.release(0.5)
+        assert lane.active == 0
+        return lane
+
+    lane = asyncio.run(scenario())
+    assert lane.shed == {"queue_full": 1, "deadline": 0}
+    assert 0 < lane.service_time < 0.5
+
+
+def test_lane_sheds_requests_that_would_miss_their_deadline():
+    """Waiters give up after max_wait; slow lanes shed new arrivals up front"""
+    async def scenario():
+        lane = Lane("test", limit=1, queue_size=10, max_wait=0.01)
+        await lane.acquire()
+        assert (await lane.acquire()).reason == "deadline"
+        assert lane.queued == 0
+
+        lane.service_time = 1.0
+        shed = await lane.acquire()
+        assert (shed.reason, shed.retry_after) == ("deadline", 1)
+        return lane
+
+    assert asyncio.run(scenario()).shed["deadline"] == 2
+
+
+def test_busy_heavy_lane_sheds_without_blocking_point_reads(client):
+    """Contract test: a saturated lane answers 429 with Retry-After while other routes still serve"""
+    lane = admission.lanes["heavy"]
+    active, queue_size = lane.active, lane.queue_size
+    lane.active, lane.queue_size = lane.limit, 0
+    try:
+        response = client.get("/api/recipes/export")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.get("/health").status_code == 200
+        assert client.get("/api/recipes/poutine-canada-001").status_code in (200, 404)
+    finally:
+        lane.active, lane.queue_size = active, queue_size
+
+    assert client.get("/api/recipes/export").status_code == 200
+    body = client.get("/metrics").text
+    assert 'admission_shed_total{lane="heavy",reason="queue_full"}' in body
+    # Recorded under the route the lane rule matched, not with unmatched 404s
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/api/recipes/export",status="429"} 1') in body
+    assert 'admission_queue_depth{lane="search"} 0' in body
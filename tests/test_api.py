@@ -2,6 +2,11 @@
 Basic smoke and contract tests for Recipe Explorer API.
 These tests verify that endpoints exist and return expected status codes.
 """
+import json
+
+from app.routes.pages import page_cache
+from app.services.storage import recipe_storage
+
 
 def test_health_check(client):
     """Smoke test: API is running and responding"""
@@ -41,7 +46,12 @@ def test_create_and_get_recipe(client, clean_storage, sample_recipe_data):
     # Get recipe
     get_response = client.get(f"/api/recipes/{recipe['id']}")
     assert get_response.status_code == 200
-    assert get_response.json()["id"] == recipe["id"]
+    assert get_response.headers["content-type"] == "application/json"
+    assert get_response.json() == recipe
+    
+    # Lists are spliced from the same cached encoding
+    assert client.get("/api/recipes").json()["recipes"] == [recipe]
+    assert client.get("/api/recipes/search", params={"query": "test"}).json() == {"recipes": [recipe]}
 
 
 def test_recipe_not_found(client, clean_storage):
@@ -67,3 +77,401 @@ def test_recipe_pages_load(client, clean_storage, sample_recipe_data):
     # Test import page
     response = client.get("/import")
     assert response.status_code == 200
+
+
+def test_search_matches_all_terms(client, clean_storage, sample_recipe_data):
+    """Contract test: search matches title, cuisine and ingredient terms"""
+    client.post("/api/recipes", json=sample_recipe_data)
+    other = dict(sample_recipe_data, title="Other Dish", cuisine="Italian",
+                 ingredients=["2 ripe tomatoes"])
+    client.post("/api/recipes", json=other)
+
+    response = client.get("/api/recipes", params={"search": "italian tomato"})
+    assert [r["title"] for r in response.json()["recipes"]] == ["Other Dish"]
+
+    response = client.get("/api/recipes/search", params={"query": "ingredient test"})
+    assert [r["title"] for r in response.json()["recipes"]] == ["Test Recipe"]
+
+    response = client.get("/api/recipes/search", params={"query": "italian ingredient"})
+    assert response.json()["recipes"] == []
+
+
+def test_search_index_follows_updates_and_deletes(client, clean_storage, sample_recipe_data):
+    """Contract test: search reflects updates and deletes"""
+    recipe_id = client.post("/api/recipes", json=sample_recipe_data).json()["id"]
+
+    client.put(f"/api/recipes/{recipe_id}", json={"title": "Renamed Stew", "description": "Slow cooked"})
+    assert client.get("/api/recipes", params={"search": "stew"}).json()["recipes"]
+    assert not client.get("/api/recipes", params={"search": "test recipe"}).json()["recipes"]
+
+    client.delete(f"/api/recipes/{recipe_id}")
+    assert not client.get("/api/recipes", params={"search": "stew"}).json()["recipes"]
+
+
+def test_recipes_cursor_pagination(client, clean_storage, sample_recipe_data):
+    """Contract test: cursors walk every recipe exactly once"""
+    for i in range(5):
+        client.post("/api/recipes", json=dict(sample_recipe_data, title=f"Recipe {i}"))
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/api/recipes", params=params).json()
+        assert len(data["recipes"]) <= 2
+        assert data["total"] == 5
+        seen.extend(r["title"] for r in data["recipes"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert sorted(seen) == [f"Recipe {i}" for i in range(5)]
+
+    # Search pages follow relevance; a listing cursor doesn't fit them
+    listing_cursor = client.get("/api/recipes", params={"limit": 2}).json()["next_cursor"]
+    response = client.get("/api/recipes", params={"search": "recipe", "cursor": listing_cursor})
+    assert response.status_code == 400
+    first = client.get("/api/recipes", params={"search": "recipe", "limit": 3}).json()
+    rest = client.get("/api/recipes", params={"search": "recipe", "limit": 3,
+                                              "cursor": first["next_cursor"]}).json()
+    titles = [r["title"] for r in first["recipes"] + rest["recipes"]]
+    assert sorted(titles) == [f"Recipe {i}" for i in range(5)]
+
+
+def test_recipes_pagination_bounds(client, clean_storage):
+    """Contract test: page size is bounded and bad cursors are rejected"""
+    assert client.get("/api/recipes", params={"limit": 0}).status_code == 422
+    assert client.get("/api/recipes", params={"limit": 1000}).status_code == 422
+    assert client.get("/api/recipes", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_export_json_and_ndjson(client, clean_storage, sample_recipe_data):
+    """Contract test: export streams every recipe as JSON or NDJSON"""
+    for i in range(3):
+        client.post("/api/recipes", json=dict(sample_recipe_data, title=f"Recipe {i}"))
+
+    response = client.get("/api/recipes/export")
+    assert response.status_code == 200
+    assert sorted(r["title"] for r in response.json()) == ["Recipe 0", "Recipe 1", "Recipe 2"]
+
+    response = client.get("/api/recipes/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert len(lines) == 3
+    assert all(json.loads(line)["id"] for line in lines)
+
+
+def test_export_empty_store(client, clean_storage):
+    """Contract test: exporting an empty store yields an empty array"""
+    assert client.get("/api/recipes/export").json() == []
+
+
+def test_import_reports_rejected_rows(client, clean_storage, sample_recipe_data):
+    """Contract test: invalid rows are reported by index and skipped"""
+    records = [dict(sample_recipe_data, id="good-1"), {"title": "No fields"}, "not an object"]
+    response = client.post(
+        "/api/recipes/import",
+        files={"file": ("recipes.json", json.dumps(records), "application/json")},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 1
+    assert data["rejected_count"] == 2
+    assert [r["index"] for r in data["rejected"]] == [1, 2]
+    assert client.get("/api/recipes/good-1").status_code == 200
+
+
+def test_import_ndjson_merge(client, clean_storage, sample_recipe_data):
+    """Contract test: merge mode upserts NDJSON rows over existing recipes"""
+    existing = client.post("/api/recipes", json=sample_recipe_data).json()
+    lines = [
+        json.dumps(dict(sample_recipe_data, id=existing["id"], title="Updated")),
+        json.dumps(dict(sample_recipe_data, id="new-1")),
+    ]
+    response = client.post(
+        "/api/recipes/import",
+        data={"mode": "merge"},
+        files={"file": ("recipes.ndjson", "\n".join(lines), "application/x-ndjson")},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    assert client.get(f"/api/recipes/{existing['id']}").json()["title"] == "Updated"
+    assert client.get("/api/recipes").json()["total"] == 2
+
+
+def test_import_invalid_json_keeps_existing_recipes(client, clean_storage, sample_recipe_data):
+    """Contract test: a malformed upload leaves the store untouched"""
+    client.post("/api/recipes", json=sample_recipe_data)
+    for payload in ('[{"title": "broken"', "", " \n", "[] trailing"):
+        response = client.post(
+            "/api/recipes/import",
+            files={"file": ("recipes.json", payload, "application/json")},
+        )
+        assert response.status_code == 400
+        assert client.get("/api/recipes").json()["total"] == 1
+
+
+def test_update_with_stale_if_match_is_rejected(client, clean_storage, sample_recipe_data):
+    """Contract test: PUT with an outdated If-Match returns 412"""
+    created = client.post("/api/recipes", json=sample_recipe_data)
+    recipe_id = created.json()["id"]
+    etag = created.headers["etag"]
+    assert created.json()["version"] == 1
+
+    first = client.put(f"/api/recipes/{recipe_id}", json={"title": "First"},
+                       headers={"If-Match": etag})
+    assert first.status_code == 200
+    assert first.json()["version"] == 2
+    assert first.headers["etag"] != etag
+
+    stale = client.put(f"/api/recipes/{recipe_id}", json={"title": "Second"},
+                       headers={"If-Match": etag})
+    assert stale.status_code == 412
+    assert client.get(f"/api/recipes/{recipe_id}").json()["title"] == "First"
+
+
+def test_conditional_get_returns_304(client, clean_storage, sample_recipe_data):
+    """Contract test: matching validators return 304 without a body"""
+    recipe_id = client.post("/api/recipes", json=sample_recipe_data).json()["id"]
+
+    response = client.get(f"/api/recipes/{recipe_id}")
+    etag = response.headers["etag"]
+    assert "cache-control" in response.headers
+    assert response.headers["last-modified"].endswith("GMT")
+
+    cached = client.get(f"/api/recipes/{recipe_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    since = client.get(f"/api/recipes/{recipe_id}",
+                       headers={"If-Modified-Since": response.headers["last-modified"]})
+    assert since.status_code == 304
+
+    page_etag = client.get(f"/recipes/{recipe_id}").headers["etag"]
+    assert page_etag != etag
+    page = client.get(f"/recipes/{recipe_id}", headers={"If-None-Match": page_etag})
+    assert page.status_code == 304
+
+
+def test_list_etag_changes_after_write(client, clean_storage, sample_recipe_data):
+    """Contract test: list ETags follow the store generation"""
+    etag = client.get("/api/recipes").headers["etag"]
+    assert client.get("/api/recipes", headers={"If-None-Match": etag}).status_code == 304
+    page_etag = client.get("/").headers["etag"]
+    assert client.get("/", headers={"If-None-Match": page_etag}).status_code == 304
+
+    client.post("/api/recipes", json=sample_recipe_data)
+    response = client.get("/api/recipes", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_recipes_facet_filters(client, clean_storage, sample_recipe_data):
+    """Contract test: repeated facet filters and facet counts in the response"""
+    client.post("/api/recipes", json=dict(sample_recipe_data, cuisine="Thai", tags=["spicy", "quick"]))
+    client.post("/api/recipes", json=dict(sample_recipe_data, cuisine="Thai", tags=["quick"]))
+    client.post("/api/recipes", json=dict(sample_recipe_data, cuisine="Greek", tags=["spicy"]))
+
+    data = client.get("/api/recipes", params={"cuisine": ["Thai", "Greek"], "tag": "spicy"}).json()
+    assert data["total"] == 2
+    assert data["facets"]["cuisine"] == {"Greek": 1, "Thai": 1}
+
+    data = client.get("/api/recipes", params=[("tag", "spicy"), ("tag", "quick"), ("match", "all")]).json()
+    assert data["total"] == 1
+    assert data["facets"]["tag"] == {"quick": 1, "spicy": 1}
+
+    data = client.get("/api/recipes", params={"search": "test", "difficulty": "Hard"}).json()
+    assert data["total"] == 0
+    assert client.get("/api/recipes", params={"match": "some"}).status_code == 422
+
+
+def test_summary_view_and_sparse_fields(client, clean_storage, sample_recipe_data):
+    """Contract test: view=summary and fields= shape list and search results"""
+    recipe = client.post("/api/recipes", json=sample_recipe_data).json()
+
+    data = client.get("/api/recipes", params={"view": "summary"}).json()
+    assert data["total"] == 1
+    assert data["recipes"] == [{
+        "id": recipe["id"], "title": "Test Recipe", "description": "A test recipe",
+        "cuisine": "Test Cuisine", "difficulty": "Easy", "tags": ["test", "easy"],
+        "ingredient_count": 2, "step_count": 2,
+    }]
+
+    data = client.get("/api/recipes/search", params={"query": "test", "fields": "title,version"}).json()
+    assert data["recipes"] == [{"id": recipe["id"], "title": "Test Recipe", "version": 1}]
+
+    assert client.get("/api/recipes", params={"fields": "title,secret"}).status_code == 400
+    assert client.get("/api/recipes", params={"view": "summary", "fields": "title"}).status_code == 400
+    assert client.get("/api/recipes/search", params={"view": "tiny"}).status_code == 422
+
+
+def test_pantry_match_endpoint(client, clean_storage, sample_recipe_data):
+    """Contract test: pantry matching with coverage and missing ingredients"""
+    recipe = client.post("/api/recipes", json=dict(
+        sample_recipe_data, ingredients=["2 cloves garlic, minced", "3 ripe tomatoes", "Basil"])).json()
+    client.post("/api/recipes", json=dict(sample_recipe_data, ingredients=["1 cup rice"]))
+
+    response = client.post("/api/recipes/match", params={"view": "summary"},
+                           json={"ingredients": ["Garlic", "tomato"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    match = data["recipes"][0]
+    assert (match["id"], match["ingredient_count"]) == (recipe["id"], 3)
+    assert (match["matched_count"], match["missing_count"], match["missing"]) == (2, 1, ["basil"])
+    assert match["coverage"] == round(2 / 3, 4)
+
+    assert client.post("/api/recipes/match", json={"ingredients": []}).status_code == 422
+    too_many = {"ingredients": ["salt"] * 201}
+    assert client.post("/api/recipes/match", json=too_many).status_code == 413
+
+
+def test_similar_recipes_endpoint_and_detail_block(client, clean_storage, sample_recipe_data):
+    """Contract test: similar recipes with scores, and the detail page block"""
+    recipe = client.post("/api/recipes", json=dict(
+        sample_recipe_data, title="Garlic Pasta", ingredients=["Spaghetti", "Garlic"])).json()
+    other = client.post("/api/recipes", json=dict(
+        sample_recipe_data, title="Garlic Noodles", ingredients=["Noodles", "Garlic"])).json()
+
+    response = client.get(f"/api/recipes/{recipe['id']}/similar", params={"fields": "title"})
+    assert response.status_code == 200
+    (similar,) = response.json()["recipes"]
+    assert (similar["id"], similar["title"]) == (other["id"], "Garlic Noodles")
+    assert 0 < similar["score"] <= 1
+    assert client.get("/api/recipes/missing/similar").status_code == 404
+    assert client.get(f"/api/recipes/{recipe['id']}/similar", params={"limit": 0}).status_code == 422
+
+    page = client.get(f"/recipes/{recipe['id']}")
+    assert "You might also like" in page.text and "Garlic Noodles" in page.text
+    client.put(f"/api/recipes/{other['id']}", json={"title": "Garlic Ramen"})
+    page_after = client.get(f"/recipes/{recipe['id']}")
+    assert "Garlic Ramen" in page_after.text
+    assert page_after.headers["ETag"] != page.headers["ETag"]
+
+
+def test_detail_revalidation_skips_similarity_query(client, clean_storage, sample_recipe_data,
+                                                     monkeypatch):
+    """304s and page cache hits for a detail page don't rank similar recipes"""
+    recipe = client.post("/api/recipes", json=sample_recipe_data).json()
+    first = client.get(f"/recipes/{recipe['id']}")
+    calls = []
+    monkeypatch.setattr(recipe_storage, "similar_recipes",
+                        lambda *args, **kwargs: calls.append(args) or [])
+
+    revalidated = client.get(f"/recipes/{recipe['id']}",
+                             headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert client.get(f"/recipes/{recipe['id']}").text == first.text
+    assert calls == []
+
+    client.post("/api/recipes", json=sample_recipe_data)
+    assert client.get(f"/recipes/{recipe['id']}",
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+    assert len(calls) == 1
+
+
+def test_similarity_rebuild_revalidates_only_similar_recipes(client, clean_storage,
+                                                             sample_recipe_data):
+    """A rebuilt similarity index changes detail and /similar ETags and drops
+    cached detail pages, but leaves lists and other pages alone"""
+    recipe = client.post("/api/recipes", json=sample_recipe_data).json()
+    urls = ["/api/recipes", "/", f"/recipes/{recipe['id']}", f"/api/recipes/{recipe['id']}/similar"]
+    etags = [client.get(url).headers["ETag"] for url in urls]
+    cached = page_cache.stats()["entries"]
+    generation = recipe_storage.generation
+
+    recipe_storage._rebuild_similar()
+    assert recipe_storage.wait_for_similar(10)
+    assert recipe_storage.generation == generation
+    statuses = [client.get(url, headers={"If-None-Match": etag}).status_code
+                for url, etag in zip(urls, etags)]
+    assert statuses == [304, 304, 200, 200]
+    # The detail page was dropped and rendered again under its new ETag
+    assert page_cache.stats()["entries"] == cached
+
+
+def test_change_feed_endpoint(client, clean_storage, sample_recipe_data):
+    """Contract test: delta sync picks up after an export and sends tombstones"""
+    kept = client.post("/api/recipes", json=sample_recipe_data).json()
+    gone = client.post("/api/recipes", json=sample_recipe_data).json()
+    since = int(client.get("/api/recipes/export").headers["X-Change-Seq"])
+
+    client.put(f"/api/recipes/{kept['id']}", json={"title": "Edited"})
+    client.delete(f"/api/recipes/{gone['id']}")
+    response = client.get("/api/recipes/changes", params={"since": since})
+    assert response.status_code == 200
+    data = response.json()
+    upsert, delete = data["changes"]
+    assert (upsert["op"], upsert["id"], upsert["recipe"]["title"]) == ("upsert", kept["id"], "Edited")
+    assert delete == {"seq": data["next_since"], "op": "delete", "id": gone["id"]}
+    assert data["has_more"] is False
+
+    empty = client.get("/api/recipes/changes", params={"since": data["next_since"]})
+    assert empty.json()["changes"] == []
+    assert client.get("/api/recipes/changes", params={"since": -1}).status_code == 422
+
+
+def test_popular_recipes_endpoint(client, clean_storage, sample_recipe_data):
+    """Contract test: API and HTML detail views rank recipes; deleted ones drop out"""
+    from app.services.storage import recipe_views
+
+    first = client.post("/api/recipes", json=dict(sample_recipe_data, title="First")).json()
+    second = client.post("/api/recipes", json=dict(sample_recipe_data, title="Second")).json()
+    gone = client.post("/api/recipes", json=sample_recipe_data).json()
+    for _ in range(3):
+        client.get(f"/api/recipes/{second['id']}")
+    client.get(f"/recipes/{first['id']}")
+    client.get(f"/api/recipes/{first['id']}")
+    for _ in range(5):
+        client.get(f"/api/recipes/{gone['id']}")
+    client.delete(f"/api/recipes/{gone['id']}")
+    recipe_views.flush()
+
+    data = client.get("/api/recipes/popular", params={"limit": 2, "fields": "title"}).json()
+    ranked = [(recipe["title"], recipe["views"]) for recipe in data["recipes"]]
+    assert [title for title, _ in ranked] == ["Second", "First"]
+    assert ranked[0][1] > ranked[1][1] > 0
+    assert client.get("/api/recipes/popular", params={"limit": 51}).status_code == 422
+
+
+def test_suggest_endpoint(client, clean_storage, sample_recipe_data):
+    """Contract test: typeahead suggestions and their parameter bounds"""
+    client.post("/api/recipes", json=dict(sample_recipe_data, ingredients=["3 ripe tomatoes"]))
+
+    data = client.get("/api/recipes/suggest", params={"prefix": "Tom"}).json()
+    assert data["suggestions"] == [{"text": "tomato", "kind": "ingredient", "count": 1}]
+    assert client.get("/api/recipes/suggest", params={"prefix": ""}).status_code == 422
+    assert client.get("/api/recipes/suggest", params={"prefix": "t", "limit": 100}).status_code == 422
+
+
+def test_batch_applies_mixed_operations(client, clean_storage, sample_recipe_data):
+    """Contract test: one request creates, updates and deletes, with a result per operation"""
+    existing = client.post("/api/recipes", json=sample_recipe_data).json()
+    etag = client.get("/api/recipes").headers["ETag"]
+
+    response = client.post("/api/recipes/batch", json=[
+        {"op": "create", "recipe": dict(sample_recipe_data, title="Batch Made")},
+        {"op": "update", "id": existing["id"], "recipe": {"title": "Batch Edited"}, "version": 1},
+        {"op": "update", "id": existing["id"], "recipe": {"title": "Stale"}, "version": 1},
+        {"op": "delete", "id": "missing"},
+        {"op": "create", "recipe": {"title": "No fields"}},
+        {"op": "explode"},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == [
+        "created", "updated", "conflict", "not_found", "invalid", "invalid",
+    ]
+    assert (data["count"], data["failed_count"]) == (2, 4)
+    assert data["results"][1]["version"] == 2
+    assert data["results"][2]["version"] == 2
+
+    titles = {r["title"] for r in client.get("/api/recipes").json()["recipes"]}
+    assert titles == {"Batch Made", "Batch Edited"}
+    assert client.get("/api/recipes").headers["ETag"] != etag
+
+    too_many = [{"op": "delete", "id": "x"}] * 1001
+    assert client.post("/api/recipes/batch", json=too_many).status_code == 413
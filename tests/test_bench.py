@@ -0,0 +1,46 @@
+"""
+Tests for the benchmark corpus generator and harness.
+"""
+import asyncio
+from collections import Counter
+
+from app.main import app
+from app.models import Recipe
+from bench.corpus import INGREDIENTS, iter_recipes
+from bench.harness import percentile, run_benchmark
+
+
+def test_corpus_is_deterministic_and_valid():
+    """The same seed gives the same recipes, and each one is a valid Recipe"""
+    first = list(iter_recipes(50, seed=7))
+    assert first == list(iter_recipes(50, seed=7))
+    assert first != list(iter_recipes(50, seed=8))
+    for record in first:
+        Recipe(**record)
+    assert len({record["id"] for record in first}) == 50
+
+
+def test_corpus_ingredients_are_zipf_skewed():
+    """The top-ranked ingredient is far more common than the tail"""
+    counts = Counter()
+    for record in iter_recipes(500):
+        for name in INGREDIENTS:
+            counts[name] += any(name in line for line in record["ingredients"])
+    assert counts[INGREDIENTS[0]] > 10 * max(counts[INGREDIENTS[-1]], 1)
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_harness_runs_every_scenario(clean_storage):
+    """A tiny end-to-end run reports every scenario without errors"""
+    results = asyncio.run(run_benchmark(app, size=60, requests=5, bulk_runs=1))
+    assert results["meta"]["size"] == 60
+    for name, result in results["results"].items():
+        assert result["errors"] == 0, name
+        assert result["p99_ms"] >= result["p50_ms"]
+    assert set(results["results"]) >= {"list", "search", "suggest", "detail", "html_home", "import", "export"}
@@ -0,0 +1,43 @@
+"""
+Tests for request metrics and the /metrics endpoint.
+"""
+from app.services.metrics import Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Buckets are cumulative and end with +Inf, one series per label set"""
+    histogram = Histogram("demo_seconds", "Demo", (0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5.0, route="/a")
+
+    lines = list(histogram.render())
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/a"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    """Backslashes, quotes and newlines in label values can't break the exposition text"""
+    histogram = Histogram("demo_seconds", "Demo", (1.0,))
+    histogram.observe(0.5, route='/a\\b"c\nd')
+    assert 'demo_seconds_count{route="/a\\\\b\\"c\\nd"} 1' in list(histogram.render())
+
+
+def test_metrics_endpoint_reports_routes_and_storage(client, clean_storage, sample_recipe_data):
+    """Contract test: requests show up by route template with storage timings"""
+    recipe_id = client.post("/api/recipes", json=sample_recipe_data).json()["id"]
+    client.get(f"/api/recipes/{recipe_id}")
+    client.get("/api/recipes", params={"search": "test"})
+    client.get("/")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'route="/api/recipes/{recipe_id}"' in body
+    assert f'route="/api/recipes/{recipe_id}"' not in body
+    assert "http_response_size_bytes_count" in body
+    assert 'storage_operation_duration_seconds_count{operation="search"}' in body
+    assert "page_cache_requests_total" in body
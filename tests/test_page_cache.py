@@ -0,0 +1,53 @@
+"""
+Tests for the rendered page cache.
+"""
+from app.routes.pages import page_cache
+from app.services.page_cache import PageCache
+
+
+def test_lru_eviction_respects_byte_cap():
+    """Least recently used pages are evicted once the byte cap is exceeded"""
+    cache = PageCache(max_bytes=10)
+    cache.put(("a", None), b"12345")
+    cache.put(("b", None), b"12345")
+    assert cache.get(("a", None)) == b"12345"
+    cache.put(("c", None), b"12345")
+
+    assert cache.get(("b", None)) is None
+    assert cache.get(("a", None)) is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 10
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_invalidate_drops_lists_and_touched_details():
+    """A write drops list pages and the written recipe's detail pages only"""
+    cache = PageCache(max_bytes=1000)
+    cache.put(("home", None, ""), b"list")
+    cache.put(("detail", "r1", "v1"), b"one")
+    cache.put(("detail", "r2", "v1"), b"two")
+
+    cache.invalidate({"r1"})
+    assert cache.get(("home", None, "")) is None
+    assert cache.get(("detail", "r1", "v1")) is None
+    assert cache.get(("detail", "r2", "v1")) == b"two"
+
+    cache.put(("detail", "r3", "v1"), b"three", shows={"r2"})
+    cache.invalidate({"r2"})
+    assert cache.get(("detail", "r3", "v1")) is None
+    assert cache._pages == {} and cache.stats()["bytes"] == 0
+
+    cache.invalidate(None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_home_page_served_from_cache_until_write(client, clean_storage, sample_recipe_data):
+    """Repeat renders hit the cache; a create shows up on the next render"""
+    client.get("/")
+    hits = page_cache.hits
+    assert "Test Recipe" not in client.get("/").text
+    assert page_cache.hits == hits + 1
+
+    client.post("/api/recipes", json=sample_recipe_data)
+    assert "Test Recipe" in client.get("/").text
@@ -0,0 +1,64 @@
+"""
+Tests for sharded view counting and decayed popularity.
+"""
+import threading
+
+import pytest
+
+from app.services.popularity import ViewCounter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_views_from_many_threads_are_all_counted():
+    """Per-thread shards add up to every recorded view once flushed"""
+    counter = ViewCounter(flush_interval=60, clock=FakeClock())
+
+    def view():
+        for _ in range(1000):
+            counter.record("a")
+            counter.record("b")
+        counter.record("b")
+
+    threads = [threading.Thread(target=view) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(counter._shards) == 8
+    counter.flush()
+    assert counter.top(5) == [("b", 8008.0), ("a", 8000.0)]
+    # The threads have exited, so their drained shards are gone
+    assert counter._shards == []
+    counter.record("a")
+    counter.flush()
+    assert len(counter._shards) == 1 and counter.top(5) == [("b", 8008.0), ("a", 8001.0)]
+
+
+def test_older_views_decay_and_reads_flush_when_stale():
+    """A view counts half after a half-life; rankings refresh once the flush interval passes"""
+    clock = FakeClock()
+    counter = ViewCounter(half_life=100, flush_interval=10, clock=clock)
+    for _ in range(3):
+        counter.record("old")
+    assert counter.top() == [("old", 3.0)]
+
+    clock.now = 100
+    counter.record("new")
+    counter.record("new")
+    assert counter.top() == [("new", 2.0), ("old", 1.5)]
+    clock.now = 105
+    counter.record("old")
+    assert counter.top() == [("new", 2.0), ("old", 1.5)]  # Until the next flush
+
+    # Far past the rescaling point scores stay finite and decayed ones go
+    clock.now = 100 * 40
+    counter.flush()
+    assert counter.top() == [("old", pytest.approx(1.0))]
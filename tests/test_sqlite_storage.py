@@ -0,0 +1,339 @@
+"""
+Tests for the SQLite storage backend.
+"""
+import json
+import threading
+
+import pytest
+
+from app.models import RecipeCreate, RecipeUpdate
+from app.services.batch import validate_operations
+from app.services.projections import CARD, FULL, SUMMARY, FieldsProjection
+from app.services.sqlite_storage import SQLiteRecipeStorage
+from app.services.storage import RecipeStorage
+from bench.corpus import iter_recipes
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    storage = SQLiteRecipeStorage(str(tmp_path / "recipes.db"), pool_size=2)
+    yield storage
+    storage.close()
+
+
+def test_seed_data_and_crud(sqlite_storage, sample_recipe_data):
+    """The backend seeds an empty database and supports CRUD"""
+    assert sqlite_storage.count() == 3
+
+    recipe = sqlite_storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    assert sqlite_storage.get_recipe(recipe.id).title == "Test Recipe"
+
+    updated = sqlite_storage.update_recipe(recipe.id, RecipeUpdate(title="Renamed"))
+    assert updated.title == "Renamed"
+    assert updated.description == sample_recipe_data["description"]
+    assert sqlite_storage.get_recipe(recipe.id).title == "Renamed"
+    encoded = sqlite_storage.get_encoded_recipe(recipe.id)
+    assert encoded.body == updated.model_dump_json().encode()
+    assert (encoded.version, encoded.updated_at) == (2, updated.updated_at)
+    assert sqlite_storage.get_page(10, query="renamed", projection=FULL).recipes == [encoded.body]
+
+    assert [s.text for s in sqlite_storage.suggest("ren")] == ["Renamed"]
+    assert sqlite_storage.delete_recipe(recipe.id)
+    assert sqlite_storage.get_recipe(recipe.id) is None
+    assert not sqlite_storage.delete_recipe(recipe.id)
+    assert sqlite_storage.suggest("ren") == []
+
+
+def test_fts_search_and_pagination(sqlite_storage):
+    """Search matches token prefixes and pages follow the listing order"""
+    titles = {r.title for r in sqlite_storage.search_recipes("potato")}
+    assert titles == {"Classic Quebec Poutine", "Shuba (Herring Under a Fur Coat)"}
+    assert [r.id for r in sqlite_storage.search_recipes("chinese pork")] == ["guo-bao-rou-china-003"]
+
+    first = sqlite_storage.get_page(2)
+    assert first.total == 3 and len(first.recipes) == 2
+    second = sqlite_storage.get_page(2, after=first.next_key)
+    assert [r.id for r in second.recipes] == ["guo-bao-rou-china-003"]
+    assert second.next_key is None
+
+
+def test_import_is_atomic_and_persistent(tmp_path, sample_recipe_data):
+    """Replace imports commit as a whole and survive reopening the database"""
+    path = str(tmp_path / "recipes.db")
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    report = storage.import_recipes([dict(sample_recipe_data, id="a"), {"title": "bad"}])
+    assert (report.count, report.rejected_count) == (1, 1)
+    storage.close()
+
+    reopened = SQLiteRecipeStorage(path, pool_size=1)
+    assert [r.id for r in reopened.get_all_recipes()] == ["a"]
+    assert [r.id for r in reopened.snapshot()] == ["a"]
+    reopened.close()
+
+
+def test_snapshot_stream_releases_its_connection(sqlite_storage):
+    """An export stream gives its connection back when exhausted or closed,
+    even if it was never iterated"""
+    pool = sqlite_storage._pool
+    size = pool.qsize()
+    untouched = sqlite_storage.snapshot()
+    assert pool.qsize() == size - 1
+    untouched.close()
+    untouched.close()
+    assert pool.qsize() == size
+
+    partial = sqlite_storage.snapshot()
+    next(partial)
+    partial.close()
+    assert list(partial) == [] and pool.qsize() == size
+    assert len(list(sqlite_storage.snapshot())) == 3 and pool.qsize() == size
+
+
+def test_slow_import_does_not_block_writers(sqlite_storage, sample_recipe_data):
+    """The write lock is taken only once the upload has been validated"""
+    created = []
+
+    def upload():
+        yield from iter_recipes(20, seed=2)
+        # A writer arriving while the upload is still being read
+        writer = threading.Thread(target=lambda: created.append(
+            sqlite_storage.create_recipe(RecipeCreate(**sample_recipe_data))))
+        writer.start()
+        writer.join(2)
+        yield from iter_recipes(5, seed=4)
+
+    report = sqlite_storage.import_recipes(upload(), mode="merge")
+    assert len(created) == 1 and report.count == 25
+    assert sqlite_storage.get_recipe(created[0].id) is not None
+
+
+def test_facets_match_memory_backend(sqlite_storage):
+    """Facet filters and counts give the same answers as the memory backend"""
+    records = list(iter_recipes(200, seed=3))
+    memory = RecipeStorage()
+    memory.import_recipes(records)
+    sqlite_storage.import_recipes(records)
+
+    cases = [
+        ({"cuisine": ["Italian", "Mexican"]}, "any", None),
+        ({"tag": ["dinner", "quick"]}, "all", None),
+        ({"difficulty": ["Easy"], "tag": ["vegetarian"]}, "any", "garlic"),
+    ]
+    for filters, match, query in cases:
+        expected = memory.get_page(100, query=query, filters=filters, match=match, facets=True)
+        actual = sqlite_storage.get_page(100, query=query, filters=filters, match=match, facets=True)
+        assert actual.total == expected.total > 0
+        if query is None:
+            assert [r.id for r in actual.recipes] == [r.id for r in expected.recipes]
+        else:
+            # Both rank by BM25, but not to identical scores
+            assert {r.id for r in actual.recipes} == {r.id for r in expected.recipes}
+        assert actual.facets == expected.facets
+    assert sqlite_storage.suggest("ga") == memory.suggest("ga")
+    pantry = ["garlic", "onions", "2 tbsp olive oil", "salt"]
+    expected, expected_total = memory.match_pantry(pantry, 10, projection=SUMMARY)
+    actual, total = sqlite_storage.match_pantry(pantry, 10, projection=SUMMARY)
+    assert total == expected_total > 0
+    assert actual == expected
+
+
+def test_unfiltered_facet_counts_follow_writes(tmp_path, sample_recipe_data):
+    """Listing counts come from trigger-kept tables that track every write
+    and are filled in for databases created before them"""
+    records = list(iter_recipes(150, seed=5))
+    memory = RecipeStorage()
+    memory.import_recipes(records)
+    path = str(tmp_path / "recipes.db")
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    storage.import_recipes(records)
+
+    def assert_same():
+        expected = memory.get_page(10, facets=True)
+        actual = storage.get_page(10, facets=True)
+        assert (actual.total, actual.facets) == (expected.total, expected.facets)
+        assert storage.count() == memory.count()
+
+    assert_same()
+    for backend in (memory, storage):
+        created = backend.create_recipe(RecipeCreate(**dict(
+            sample_recipe_data, cuisine="Atlantean", tags=["lost", "lost", "dinner"])))
+        backend.update_recipe(records[0]["id"], RecipeUpdate(tags=["brand-new"], cuisine="Atlantean"))
+        backend.delete_recipe(records[1]["id"])
+        backend.delete_recipe(created.id)
+        backend.import_recipes(records[140:], mode="merge")
+    assert_same()
+    assert storage.get_page(1, facets=True).facets["cuisine"]["Atlantean"] == 1
+
+    with storage._connection() as conn:
+        conn.execute("DROP TABLE facet_counts")
+        for trigger in ("recipes_counted", "recipes_uncounted", "recipes_recounted"):
+            conn.execute(f"DROP TRIGGER {trigger}")
+        conn.execute("UPDATE meta SET value = 0 WHERE key = 'recipe_count'")
+    storage.close()
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    assert_same()
+    storage.clear()
+    assert (storage.count(), storage.get_page(1, facets=True).facets) == (
+        0, {"cuisine": {}, "difficulty": {}, "tag": {}})
+    storage.close()
+
+
+def test_in_process_indexes_follow_other_processes(tmp_path, sample_recipe_data):
+    """Each storage on a database file catches its indexes up with writes
+    committed through the others, and rolled-back writes never reach them"""
+    records = list(iter_recipes(61, seed=9))
+    soup = dict(records.pop(), title="Atlantean Garlic Soup", ingredients=["garlic", "onion"])
+    memory = RecipeStorage()
+    memory.import_recipes(records)
+    path = str(tmp_path / "recipes.db")
+    writer = SQLiteRecipeStorage(path, pool_size=1)
+    writer.import_recipes(records)
+    reader = SQLiteRecipeStorage(path, pool_size=1)
+    pantry = ["garlic", "onion", "olive oil", "salt", "butter"]
+
+    def assert_same(storage):
+        assert storage.suggest("ga") == memory.suggest("ga")
+        assert storage.suggest("atl") == memory.suggest("atl")
+        assert storage.match_pantry(pantry, 10, projection=SUMMARY) == \
+            memory.match_pantry(pantry, 10, projection=SUMMARY)
+        # Scores depend on the order rows reached the index, so compare
+        # which recipes are similar at all
+        assert memory.wait_for_similar(10)
+        for recipe_id in (records[5]["id"], soup["id"]):
+            assert similar_ids(storage, recipe_id) == similar_ids(memory, recipe_id)
+
+    def similar_ids(storage, recipe_id):
+        similar = storage.similar_recipes(recipe_id, len(records) + 1)
+        return similar if similar is None else {recipe.id for recipe, _ in similar}
+
+    assert_same(reader)
+    for first, second in ((memory, memory), (writer, reader)):
+        first.import_recipes([soup], mode="merge")
+        second.update_recipe(records[0]["id"], RecipeUpdate(ingredients=["garlic", "salt"]))
+        first.delete_recipe(records[1]["id"])
+        second.update_recipe(soup["id"], RecipeUpdate(tags=["atlantean"]))
+        first.import_recipes(records[50:], mode="merge")
+    assert_same(reader)
+    assert_same(writer)
+
+    with pytest.raises(RuntimeError):
+        with writer._transaction() as conn:
+            writer._create(conn, RecipeCreate(**dict(sample_recipe_data, title="Atlas Pie")))
+            raise RuntimeError("rolled back")
+    assert writer.suggest("atl") == memory.suggest("atl")
+
+    reader.import_recipes(records[:20])
+    memory.import_recipes(records[:20])
+    assert_same(writer)
+    reader.clear()
+    assert (writer.suggest("ga"), writer.match_pantry(pantry)) == ([], ([], 0))
+    writer.close()
+    reader.close()
+
+
+def test_ranked_search_pages_and_old_fts_table(tmp_path):
+    """An FTS table from an older schema is rebuilt over every field, and
+    ranked search cursors walk the results once"""
+    path = str(tmp_path / "recipes.db")
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    storage.import_recipes(iter_recipes(120, seed=5))
+    with storage._connection() as conn:
+        conn.execute("DROP TABLE recipes_fts")
+        conn.execute("CREATE VIRTUAL TABLE recipes_fts USING fts5 (title, cuisine, ingredients)")
+    storage.close()
+
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    every = storage.get_page(120, query="garlic")
+    assert every.total == len(storage.search_recipes("garlic")) > 5
+    walked = []
+    after = None
+    while True:
+        page = storage.get_page(5, after=after, query="garlic")
+        walked.extend(r.id for r in page.recipes)
+        after = page.next_key
+        if after is None:
+            break
+    assert walked == [r.id for r in every.recipes]
+    # Instructions are searchable after the rebuild
+    assert storage.search_recipes("simmer")
+    storage.close()
+
+
+def test_projections_match_memory_backend(tmp_path):
+    """Summaries come from a precomputed column, filled in for databases that
+    predate it, and every projection pages like the memory backend"""
+    records = list(iter_recipes(60, seed=4))
+    memory = RecipeStorage()
+    memory.import_recipes(records)
+    path = str(tmp_path / "recipes.db")
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    storage.import_recipes(records)
+    with storage._connection() as conn:
+        conn.execute("ALTER TABLE recipes DROP COLUMN summary")
+    storage.close()
+
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    for projection in (FULL, SUMMARY, FieldsProjection(["title", "created_at"])):
+        after = expected_after = None
+        while True:
+            page = storage.get_page(25, after=after, projection=projection)
+            expected = memory.get_page(25, after=expected_after, projection=projection)
+            assert [json.loads(r) for r in page.recipes] == [json.loads(r) for r in expected.recipes]
+            after, expected_after = page.next_key, expected.next_key
+            if after is None:
+                break
+        assert storage.search_recipes("garlic", projection=projection)
+    assert storage.get_all_recipes(SUMMARY) == memory.get_all_recipes(SUMMARY)
+    assert storage.get_all_recipes(CARD) == memory.get_all_recipes(CARD)
+    memory.wait_for_similar(timeout=5)
+    for record in records[:5]:
+        assert storage.similar_recipes(record["id"], 5) == memory.similar_recipes(record["id"], 5)
+    storage.close()
+
+
+def test_change_feed_matches_memory_backend(tmp_path, sample_recipe_data):
+    """Both backends number the same writes alike; databases from before the
+    feed get their recipes numbered on open"""
+    path = str(tmp_path / "recipes.db")
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    memory = RecipeStorage()
+    for backend in (storage, memory):
+        created = backend.create_recipe(RecipeCreate(**dict(sample_recipe_data, title="Kept")))
+        backend.update_recipe("poutine-canada-001", RecipeUpdate(title="Renamed"))
+        backend.delete_recipe("shuba-russia-002")
+        backend.import_recipes([dict(sample_recipe_data, id="imported")], mode="merge")
+
+    def feed(backend, since=0, limit=100):
+        page = backend.get_changes(since, limit)
+        changes = [(change.seq, change.recipe_id if recipe is None else json.loads(recipe)["title"])
+                   for change, recipe in page.changes]
+        return changes, page.next_since, page.has_more
+
+    assert feed(storage) == feed(memory)
+    assert feed(storage, 2, 2) == feed(memory, 2, 2)
+    assert storage.change_seq == memory.change_seq == 7
+
+    with storage._connection() as conn:
+        conn.execute("DROP INDEX idx_recipes_seq")
+        conn.execute("ALTER TABLE recipes DROP COLUMN seq")
+    storage.close()
+    storage = SQLiteRecipeStorage(path, pool_size=1)
+    changes, next_since, _ = feed(storage, 7)
+    assert len(changes) == 4 and next_since == 11
+    storage.close()
+
+
+def test_batch_in_one_transaction(sqlite_storage, sample_recipe_data):
+    """Batches apply independently inside one transaction and bump the generation once"""
+    generation = sqlite_storage.generation
+    operations, _ = validate_operations([
+        {"op": "create", "recipe": sample_recipe_data},
+        {"op": "delete", "id": "poutine-canada-001", "version": 7},
+        {"op": "delete", "id": "shuba-russia-002"},
+    ])
+    results = sqlite_storage.apply_batch(operations)
+    assert [r.status for r in results] == ["created", "conflict", "deleted"]
+    assert sqlite_storage.generation == generation + 1
+    assert sqlite_storage.count() == 3
+    assert sqlite_storage.search_recipes("test")[0].id == results[0].id
+
@@ -0,0 +1,504 @@
+"""
+Unit tests for the in-memory RecipeStorage service.
+"""
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from app.models import Recipe, RecipeCreate, RecipeUpdate
+from app.services.changes import ChangeLog
+from app.services.errors import ChangesExpired, VersionConflict
+from app.services.importer import ImportParseError, iter_records
+from app.services.projections import CARD, FULL, SUMMARY, parse_projection
+from app.services.records import RecipeRecord
+from app.services.search_index import SearchIndex
+from app.services.storage import RecipeStorage
+from bench.corpus import iter_recipes
+
+
+def test_snapshot_is_isolated_from_writes(sample_recipe_data):
+    """Snapshots keep the recipes as they were when taken"""
+    storage = RecipeStorage()
+    recipe = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    snapshot = storage.snapshot()
+
+    storage.update_recipe(recipe.id, RecipeUpdate(title="Changed"))
+    storage.delete_recipe("poutine-canada-001")
+
+    titles = {r.id: r.title for r in snapshot}
+    assert titles[recipe.id] == "Test Recipe"
+    assert "poutine-canada-001" in titles
+
+
+def test_iter_records_parses_array_across_chunks():
+    """The incremental parser handles values split over chunk boundaries"""
+    records = [{"n": 12345, "s": "x" * 20}, [1, 2], 678, "text"]
+    payload = json.dumps(records).encode()
+    assert list(iter_records(io.BytesIO(payload), chunk_size=3)) == records
+
+
+def test_iter_records_fails_fast_on_malformed_array():
+    """A syntax error is reported where it is, not after reading the whole upload"""
+    class Upload(io.BytesIO):
+        def read(self, size=-1):
+            self.reads = getattr(self, "reads", 0) + 1
+            return super().read(size)
+
+    payload = b'[{"a": 1}, {"a" 2}, ' + b", ".join([b'{"b": "' + b"x" * 50 + b'"}'] * 1000) + b"]"
+    upload = Upload(payload)
+    values = iter_records(upload, chunk_size=8)
+    assert next(values) == {"a": 1}
+    with pytest.raises(ImportParseError, match="Expecting ':' delimiter"):
+        next(values)
+    assert upload.reads < 10
+
+    # Only values cut off by a chunk boundary wait for more data
+    records = [1.5, -2e10, True, None, {"s": "\u00e9t\u00e9"}, "a\\b"]
+    payload = json.dumps(records).encode()
+    for chunk_size in (1, 2, 3):
+        assert list(iter_records(io.BytesIO(payload), chunk_size=chunk_size)) == records
+
+
+def test_iter_records_rejects_empty_upload_and_trailing_data():
+    """Nothing but whitespace may follow the array, and there must be something"""
+    for payload in (b"", b" \r\n\t", b'[{"a": 1}] trailing', b"[1] [2]"):
+        with pytest.raises(ImportParseError):
+            list(iter_records(io.BytesIO(payload), chunk_size=2))
+    assert list(iter_records(io.BytesIO(b'[{"a": 1}]  \n'), chunk_size=2)) == [{"a": 1}]
+
+
+def test_iter_records_parses_ndjson():
+    """NDJSON lines are parsed one by one and bad lines are yielded as errors"""
+    payload = b'{"a": 1}\n\nnot json\n{"b": 2}'
+    values = list(iter_records(io.BytesIO(payload), chunk_size=4))
+    assert values[0] == {"a": 1}
+    assert isinstance(values[1], ImportParseError)
+    assert values[2] == {"b": 2}
+
+
+def test_pool_validation_matches_inline(sample_recipe_data):
+    """Large imports validated in worker processes keep upload order and
+    report the same rejections as validating in the request thread"""
+    records = list(iter_recipes(1200, seed=6))
+    records[3] = dict(records[3], difficulty=None)
+    records[700] = "not a recipe"
+    records[1100] = ImportParseError("Invalid JSON on line 1101: Expecting value")
+    records.append(dict(records[0], title="Imported twice"))
+
+    inline = RecipeStorage()
+    expected = inline.import_recipes(records)
+    pooled = RecipeStorage(import_workers=2)
+    try:
+        report = pooled.import_recipes(records)
+    finally:
+        pooled.close()
+    assert report == expected
+    assert (report.count, report.rejected_count) == (1198, 3)
+    assert [rejection.index for rejection in report.rejected] == [3, 700, 1100]
+    assert pooled.get_recipe(records[0]["id"]).title == "Imported twice"
+    assert [record.to_row() for record in pooled.records.values()] == [
+        record.to_row() for record in inline.records.values()]
+    assert pooled.records[records[1]["id"]].cuisine is inline.records[records[1]["id"]].cuisine
+
+
+def test_concurrent_updates_are_serialized(sample_recipe_data):
+    """Concurrent writers each get their own version and readers never fail"""
+    storage = RecipeStorage()
+    recipe = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    errors = []
+
+    def write(n):
+        for i in range(50):
+            storage.update_recipe(recipe.id, RecipeUpdate(title=f"Writer {n} {i}"))
+
+    def read():
+        try:
+            for _ in range(200):
+                storage.get_all_recipes()
+                storage.get_page(10, query="writer")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    threads += [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert storage.get_recipe(recipe.id).version == 1 + 4 * 50
+
+
+def test_update_with_wrong_version_raises(sample_recipe_data):
+    """A conditional update against an old version is refused"""
+    storage = RecipeStorage()
+    recipe = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.update_recipe(recipe.id, RecipeUpdate(title="New"), expected_version=1)
+    with pytest.raises(VersionConflict):
+        storage.update_recipe(recipe.id, RecipeUpdate(title="Lost"), expected_version=1)
+
+
+def test_records_round_trip_recipes(sample_recipe_data):
+    """Recipes come back out of the compact store exactly as they went in"""
+    storage = RecipeStorage()
+    aware = dict(sample_recipe_data, id="aware", created_at="2024-03-01T10:00:00.123456+05:30",
+                 updated_at="2024-03-02T08:30:00")
+    storage.import_recipes([aware], mode="merge")
+    recipe = storage.get_recipe("aware")
+    assert recipe.model_dump_json() == Recipe(**aware).model_dump_json()
+    assert isinstance(recipe.ingredients, list)
+
+    seeded = storage.get_recipe("poutine-canada-001")
+    record = storage.records["poutine-canada-001"]
+    assert record.to_recipe() == seeded
+    assert RecipeRecord.from_row(record.to_row()).to_recipe() == seeded
+
+    page = storage.get_page(2)
+    assert [r.id for r in storage.get_page(10, after=page.next_key).recipes][0] == "guo-bao-rou-china-003"
+
+
+def test_repeated_strings_are_shared(sample_recipe_data):
+    """Cuisine, tags and ingredient lines are one object across recipes"""
+    storage = RecipeStorage()
+    storage.import_recipes([dict(sample_recipe_data, id=str(i)) for i in range(3)])
+    first, second = storage.records["0"], storage.records["1"]
+    assert first.cuisine is second.cuisine
+    assert first.tags[0] is second.tags[0]
+    assert first.ingredients[0] is second.ingredients[0]
+
+    stats = storage.memory_stats()
+    assert stats["recipes"] == 3
+    assert 0 < stats["record_bytes_per_recipe"] < stats["model_bytes_per_recipe"]
+
+
+def test_derived_fields_are_computed_on_write(sample_recipe_data):
+    """Snippets, ingredient names and counts are worked out when a record is
+    built and kept in step with updates; cards read them as they are"""
+    storage = RecipeStorage()
+    data = dict(sample_recipe_data, id="derived", description="x" * 150,
+                ingredients=["2 cups Tomatoes, diced", "salt to taste", "1 cup"])
+    storage.import_recipes([data], mode="merge")
+    record = storage.records["derived"]
+    assert record.snippet == "x" * 100 + "..."
+    assert record.ingredient_names == {"tomato", "salt", "cup"}
+    assert RecipeRecord.from_row(record.to_row()).ingredient_names == record.ingredient_names
+
+    card = storage.get_many(["derived"], CARD)["derived"]
+    assert card.description is record.snippet
+    assert card._asdict() == dict(json.loads(record.to_summary_json()), tags=record.tags)
+
+    storage.update_recipe("derived", RecipeUpdate(description="short", ingredients=["1 onion"]))
+    record = storage.records["derived"]
+    assert (record.snippet, record.ingredient_names, record.ingredient_count) == ("short", {"onion"}, 1)
+    matches, _ = storage.match_pantry(["onion"], 10)
+    assert "derived" in [match.recipe_id for match, _ in matches]
+
+
+def test_facet_filters_and_counts():
+    """Filters combine with search, and counts cover the whole result set"""
+    storage = RecipeStorage()
+    records = list(iter_recipes(300, seed=1))
+    storage.import_recipes(records)
+
+    page = storage.get_page(5, filters={"cuisine": ["Italian", "Chinese"]}, facets=True)
+    expected = [r for r in records if r["cuisine"] in ("Italian", "Chinese")]
+    assert page.total == len(expected)
+    assert sum(page.facets["cuisine"].values()) == page.total
+    assert set(page.facets["cuisine"]) == {"Italian", "Chinese"}
+
+    both = storage.get_page(300, filters={"tag": ["dinner", "quick"]}, match="all")
+    assert {r.id for r in both.recipes} == {
+        r["id"] for r in records if {"dinner", "quick"} <= set(r["tags"])
+    }
+
+    with pytest.raises(ValueError):
+        storage.get_page(5, filters={"colour": ["red"]})
+
+
+def test_dense_and_sparse_result_pages_agree():
+    """Walking the listing order and sorting the matches page identically"""
+    storage = RecipeStorage()
+    storage.import_recipes(iter_recipes(400, seed=2))
+    for filters in ({"difficulty": ["Easy"]}, {"cuisine": ["Swiss", "Belgian", "Irish"]}):
+        every = storage.get_page(400, filters=filters)
+        walked = []
+        after = None
+        while True:
+            page = storage.get_page(7, after=after, filters=filters)
+            walked.extend(r.id for r in page.recipes)
+            after = page.next_key
+            if after is None:
+                break
+        assert walked == [r.id for r in every.recipes]
+        assert len(walked) == every.total
+
+
+def test_search_ranks_all_fields_and_tolerates_typos(sample_recipe_data):
+    """Every text field is searched, title hits rank first, typos still match"""
+    storage = RecipeStorage()
+    storage.clear()
+    storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Weeknight Supper", description="Saffron rice on the side")))
+    storage.create_recipe(RecipeCreate(**dict(sample_recipe_data, title="Saffron Rice")))
+    storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Herring Salad", instructions=["Marinate overnight."])))
+
+    assert [r.title for r in storage.search_recipes("saffron")] == ["Saffron Rice", "Weeknight Supper"]
+    assert [r.title for r in storage.search_recipes("marinate")] == ["Herring Salad"]
+    assert [r.title for r in storage.search_recipes("herings")] == ["Herring Salad"]
+    assert [r.title for r in storage.search_recipes("saffon rice")] == ["Saffron Rice", "Weeknight Supper"]
+    assert storage.search_recipes("zzzz") == []
+
+
+def test_ranked_search_pages_follow_scores():
+    """Search cursors walk the ranked results exactly once, with and without filters"""
+    storage = RecipeStorage()
+    storage.import_recipes(iter_recipes(300, seed=4))
+    for query, filters in (("garlic", None), ("garlic onion", None), ("garlic", {"difficulty": ["Easy"]})):
+        every = storage.get_page(300, query=query, filters=filters)
+        walked = []
+        after = None
+        while True:
+            page = storage.get_page(7, after=after, query=query, filters=filters)
+            assert page.total == every.total
+            walked.extend(r.id for r in page.recipes)
+            after = page.next_key
+            if after is None:
+                break
+        assert walked == [r.id for r in every.recipes]
+        assert len(walked) == every.total > 7
+
+    listing_key = storage.get_page(1).next_key
+    with pytest.raises(ValueError):
+        storage.get_page(5, after=listing_key, query="garlic")
+
+
+def test_search_reads_postings_in_place_while_writers_run():
+    """Queries share the live postings and rerun any read a write overlapped"""
+    records = [RecipeRecord.from_recipe(Recipe(**data)) for data in iter_recipes(300, seed=3)]
+    index = SearchIndex.build(records[:200])
+    expected = index.rank("garlic", 10)
+    assert isinstance(expected.matches, list)
+
+    index._writes += 1  # a write in progress: straight to private copies
+    assert index.rank("garlic", 10) == expected
+    index._writes += 1
+
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            for record in records[200:]:
+                index.add(record)
+            for record in records[200:]:
+                index.remove(record)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(200):
+            ranked = index.rank("garlic oil", 5)
+            assert len(set(ranked.matches)) == len(ranked.matches)
+            assert {recipe_id for _, recipe_id in ranked.hits} <= set(ranked.matches)
+            index.rank("garlic", 5, after=expected.hits[2])
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_search_fallback_expands_terms_on_a_copied_vocabulary():
+    """The last run of a query doesn't read the live vocabulary, which a
+    writer may be shifting"""
+    records = [RecipeRecord.from_recipe(Recipe(**data)) for data in iter_recipes(100, seed=3)]
+    index = SearchIndex.build(records)
+    expected = index.rank("gar", 10)
+
+    class Shrinking(list):
+        def __getitem__(self, i):
+            # A writer deleting a word, shifting the rest, before each read
+            del self[0]
+            return super().__getitem__(i)
+
+    index._vocabulary = Shrinking(index._vocabulary)
+    index._writes += 1  # a write in progress: straight to private copies
+    assert index.rank("gar", 10) == expected
+
+
+def test_suggestions_rank_by_frequency_and_follow_writes(sample_recipe_data):
+    """Suggestions are ranked by recipe count and kept up to date by writes"""
+    storage = RecipeStorage()
+    storage.clear()
+    for title in ("Garlic Bread", "Garden Salad"):
+        storage.create_recipe(RecipeCreate(**dict(
+            sample_recipe_data, title=title, ingredients=["2 cloves garlic, minced", "1 cup rice"])))
+
+    assert [(s.text, s.kind, s.count) for s in storage.suggest("gar")] == [
+        ("garlic", "ingredient", 2), ("Garden Salad", "title", 1), ("Garlic Bread", "title", 1),
+    ]
+    # Titles match from any word
+    assert [s.text for s in storage.suggest("sal")] == ["Garden Salad"]
+
+    bread = storage.search_recipes("bread")[0]
+    storage.update_recipe(bread.id, RecipeUpdate(title="Toast"))
+    storage.delete_recipe(storage.search_recipes("garden")[0].id)
+    assert [(s.text, s.count) for s in storage.suggest("gar")] == [("garlic", 1)]
+    assert [s.text for s in storage.suggest("t", limit=2)] == ["test", "Test Cuisine"]
+
+
+def test_encoded_recipes_are_cached_per_version(sample_recipe_data):
+    """Records keep their JSON, and an update stores a fresh encoding"""
+    storage = RecipeStorage()
+    recipe = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    encoded = storage.get_encoded_recipe(recipe.id)
+    assert encoded.body == recipe.model_dump_json().encode()
+    assert (encoded.version, encoded.updated_at) == (recipe.version, recipe.updated_at)
+    assert storage.get_encoded_recipe(recipe.id).body is encoded.body
+
+    updated = storage.update_recipe(recipe.id, RecipeUpdate(title="Renamed"))
+    body = storage.get_encoded_recipe(recipe.id).body
+    assert body == updated.model_dump_json().encode()
+    assert json.loads(body)["version"] == 2
+    assert storage.get_page(10, query="renamed", projection=FULL).recipes == [body]
+    assert storage.search_recipes("renamed", projection=FULL) == [body]
+    assert storage.get_encoded_recipe("missing") is None
+
+
+def test_summary_and_field_projections(sample_recipe_data):
+    """Summaries carry counts and a short description; fields= keeps the id"""
+    storage = RecipeStorage()
+    long = dict(sample_recipe_data, description="x" * 150)
+    recipe = storage.create_recipe(RecipeCreate(**long))
+    summary = json.loads(storage.get_all_recipes(SUMMARY)[-1])
+    assert summary == {
+        "id": recipe.id, "title": "Test Recipe", "description": "x" * 100 + "...",
+        "cuisine": "Test Cuisine", "difficulty": "Easy", "tags": ["test", "easy"],
+        "ingredient_count": 2, "step_count": 2,
+    }
+    full = storage.get_all_recipes(FULL)[-1]
+    assert len(storage.get_all_recipes(SUMMARY)[-1]) < len(full)
+
+    fields = parse_projection("full", "tags, title")
+    assert json.loads(storage.get_page(1, query="test", projection=fields).recipes[0]) == {
+        "id": recipe.id, "title": "Test Recipe", "tags": ["test", "easy"]}
+    with pytest.raises(ValueError):
+        parse_projection("full", "title,calories")
+    with pytest.raises(ValueError):
+        parse_projection("summary", "title")
+
+
+def test_pantry_matches_rank_by_coverage(sample_recipe_data):
+    """Pantry items match normalized ingredients and follow writes"""
+    storage = RecipeStorage()
+    storage.clear()
+    fries = storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Fries",
+        ingredients=["4 large russet potatoes, cut into fries", "1 tsp salt", "Oil for frying"])))
+    omelette = storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Omelette", ingredients=["3 eggs", "Salt to taste"])))
+    storage.create_recipe(RecipeCreate(**dict(sample_recipe_data, ingredients=["1 cup rice"])))
+
+    matches, total = storage.match_pantry(["Potatoes", "salt", "2 tbsp oil"])
+    assert total == 2
+    (first, recipe), (second, _) = matches
+    assert (recipe.id, first.matched, first.missing, first.coverage) == (fries.id, 3, (), 1.0)
+    assert (second.recipe_id, second.missing) == (omelette.id, ("egg",))
+
+    assert storage.match_pantry(["salt"], max_missing=1)[0][0][0].recipe_id == omelette.id
+    storage.update_recipe(omelette.id, RecipeUpdate(ingredients=["2 eggs"]))
+    assert [m.recipe_id for m, _ in storage.match_pantry(["eggs"])[0]] == [omelette.id]
+    storage.delete_recipe(omelette.id)
+    assert storage.match_pantry(["eggs"]) == ([], 0)
+
+
+def test_similar_recipes_follow_writes_and_imports(sample_recipe_data):
+    """Similar recipes share features, track writes and are rebuilt after imports"""
+    storage = RecipeStorage()
+    storage.clear()
+    pasta = storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Pasta", cuisine="Italian", tags=["dinner"],
+        ingredients=["200 g spaghetti", "2 cloves garlic", "Olive oil"])))
+    aglio = storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Aglio e Olio", cuisine="Italian", tags=["dinner"],
+        ingredients=["200 g spaghetti", "4 cloves garlic", "Olive oil", "Chili flakes"])))
+    rice = storage.create_recipe(RecipeCreate(**dict(
+        sample_recipe_data, title="Rice", cuisine="Japanese", tags=["side"],
+        ingredients=["1 cup rice"])))
+
+    similar = storage.similar_recipes(pasta.id)
+    assert [recipe.id for recipe, _ in similar] == [aglio.id]
+    assert 0.5 < similar[0][1] <= 1.0
+    assert storage.similar_recipes("missing") is None
+
+    storage.update_recipe(rice.id, RecipeUpdate(cuisine="Italian", ingredients=["Spaghetti"]))
+    assert [recipe.id for recipe, _ in storage.similar_recipes(pasta.id)] == [aglio.id, rice.id]
+    storage.delete_recipe(aglio.id)
+    assert [recipe.id for recipe, _ in storage.similar_recipes(pasta.id)] == [rice.id]
+
+    storage.import_recipes([dict(sample_recipe_data, id=f"import-{n}", title=f"Import {n}",
+                                 ingredients=["Spaghetti", "Garlic"]) for n in range(3)])
+    assert storage.wait_for_similar(timeout=5)
+    found = storage.similar_recipes("import-0", limit=5, projection=SUMMARY)
+    assert [json.loads(body)["id"] for body, _ in found] == ["import-1", "import-2"]
+
+
+def test_similarity_index_compacts_dead_rows(sample_recipe_data):
+    """Replaced rows stop counting as soon as they die and go away on compaction"""
+    storage = RecipeStorage()
+    storage.clear()
+    first = storage.create_recipe(RecipeCreate(**dict(sample_recipe_data, ingredients=["Garlic"])))
+    second = storage.create_recipe(RecipeCreate(**dict(sample_recipe_data, ingredients=["Garlic"])))
+    for n in range(150):
+        storage.update_recipe(second.id, RecipeUpdate(description=f"Edit {n}"))
+    assert [recipe.id for recipe, _ in storage.similar_recipes(first.id)] == [second.id]
+    index = storage._state.similar
+    assert len(index) == 2 and not index.stale
+    assert len(index._ids) < 150
+
+
+def _feed(storage, since=0, limit=100):
+    page = storage.get_changes(since, limit)
+    return [(change.recipe_id, recipe is None) for change, recipe in page.changes], page
+
+
+def test_change_feed_keeps_latest_change_per_recipe(sample_recipe_data):
+    """The feed sends each recipe's latest write once, deletes as tombstones"""
+    storage = RecipeStorage()
+    start = storage.change_seq
+    kept = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    gone = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.update_recipe(kept.id, RecipeUpdate(title="Edited"))
+    storage.delete_recipe(gone.id)
+
+    changes, page = _feed(storage, start)
+    assert changes == [(kept.id, False), (gone.id, True)]
+    assert (page.next_since, page.has_more) == (storage.change_seq, False)
+    assert json.loads(page.changes[0][1])["title"] == "Edited"
+    assert _feed(storage, page.next_since)[0] == []
+
+    first, page = _feed(storage, 0, limit=2)
+    assert page.has_more and len(first) == 2
+    rest, page = _feed(storage, page.next_since)
+    assert not page.has_more and first + rest == _feed(storage)[0]
+
+    before = storage.change_seq
+    storage.import_recipes([dict(sample_recipe_data, id="imported")])
+    changes, _ = _feed(storage, before)
+    assert changes[-2:] == [(kept.id, True), ("imported", False)]
+
+
+def test_change_log_expires_old_tombstones():
+    """Tombstones past the retention window raise the floor for old readers"""
+    log = ChangeLog(retention=60)
+    log.record("a")
+    log.record("b", deleted=True)
+    log.record("c", deleted=True, at=time.time() - 120)
+
+    assert log.floor == 3
+    assert [change.recipe_id for change in log.since(0, 10)[0]] == ["a", "b"]
+    assert log.since(3, 10) == ([], 3, False)
+    with pytest.raises(ChangesExpired):
+        log.since(1, 10)
@@ -0,0 +1,128 @@
+"""
+Tests for write-ahead logging and snapshots in the in-memory store.
+"""
+import os
+import threading
+
+from app.models import RecipeCreate, RecipeUpdate
+from app.services import wal
+from app.services.batch import validate_operations
+from app.services.storage import RecipeStorage
+
+
+def test_recovers_from_log_after_restart(tmp_path, sample_recipe_data):
+    """Writes acknowledged before a restart are replayed from the log"""
+    storage = RecipeStorage(data_dir=str(tmp_path))
+    created = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.update_recipe(created.id, RecipeUpdate(title="Updated"))
+    storage.delete_recipe("poutine-canada-001")
+    storage.close()
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.get_recipe(created.id).title == "Updated"
+    assert reopened.get_recipe("poutine-canada-001") is None
+    assert reopened.count() == 3
+    assert reopened.search_recipes("updated")[0].id == created.id
+    assert reopened.recovery_seconds is not None
+    reopened.close()
+
+
+def test_checkpoint_compacts_log(tmp_path, sample_recipe_data):
+    """A checkpoint leaves one snapshot and a fresh log segment"""
+    storage = RecipeStorage(data_dir=str(tmp_path))
+    storage.import_recipes([dict(sample_recipe_data, id="a"), dict(sample_recipe_data, id="b")])
+    storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.checkpoint()
+    storage.delete_recipe("a")
+    storage.close()
+
+    names = sorted(os.listdir(tmp_path))
+    assert len([n for n in names if n.startswith("snapshot-")]) == 1
+    assert len([n for n in names if n.startswith("wal-")]) == 1
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.get_recipe("a") is None
+    assert reopened.get_recipe("b") is not None
+    assert reopened.count() == 2
+    reopened.close()
+
+
+def test_torn_log_tail_is_ignored(tmp_path, sample_recipe_data):
+    """A partially written final record doesn't stop recovery"""
+    storage = RecipeStorage(data_dir=str(tmp_path), fsync_policy="off")
+    storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.close()
+
+    segment = max(n for n in os.listdir(tmp_path) if n.startswith("wal-"))
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b"\x40\x00\x00\x00garbage")
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.count() == 4
+    reopened.close()
+
+
+def test_batch_is_logged_and_replayed(tmp_path, sample_recipe_data):
+    """A batch goes to the log as one record and is replayed whole"""
+    storage = RecipeStorage(data_dir=str(tmp_path))
+    operations, rejected = validate_operations([
+        {"op": "create", "recipe": sample_recipe_data},
+        {"op": "update", "id": "poutine-canada-001", "recipe": {"title": "Renamed"}},
+        {"op": "delete", "id": "shuba-russia-002"},
+    ])
+    assert not rejected
+    results = storage.apply_batch(operations)
+    storage.close()
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.get_recipe(results[0].id).title == sample_recipe_data["title"]
+    assert reopened.get_recipe("poutine-canada-001").title == "Renamed"
+    assert reopened.get_recipe("shuba-russia-002") is None
+    reopened.close()
+
+
+def test_change_feed_survives_restart(tmp_path, sample_recipe_data):
+    """Snapshots keep the change log and replaying the log renumbers writes
+    the same way, as of the time they were made"""
+    storage = RecipeStorage(data_dir=str(tmp_path))
+    created = storage.create_recipe(RecipeCreate(**sample_recipe_data))
+    storage.checkpoint()
+    storage.update_recipe(created.id, RecipeUpdate(title="Updated"))
+    storage.delete_recipe("poutine-canada-001")
+    expected = storage.get_changes(2).changes
+    storage.close()
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.get_changes(2).changes == expected
+    assert [change.seq for change, _ in expected] == [3, 5, 6]
+    reopened.close()
+
+
+def test_import_snapshot_precedes_later_writes(tmp_path, sample_recipe_data, monkeypatch):
+    """Writes after an import wait for its snapshot, so recovery never
+    replays them onto the dataset it replaced"""
+    storage = RecipeStorage(data_dir=str(tmp_path))
+    write_snapshot = wal.write_snapshot
+    writers = []
+
+    def snapshot_with_writer(*args, **kwargs):
+        writer = threading.Thread(target=storage.create_recipe,
+                                  args=(RecipeCreate(**sample_recipe_data),))
+        writer.start()
+        writer.join(0.2)
+        writers.append(writer)
+        # Still waiting for the write lock the import holds
+        assert writer.is_alive()
+        write_snapshot(*args, **kwargs)
+
+    monkeypatch.setattr(wal, "write_snapshot", snapshot_with_writer)
+    storage.import_recipes([dict(sample_recipe_data, id="a")])
+    monkeypatch.undo()
+    writers[0].join()
+    assert storage.count() == 2
+    storage.close()
+
+    reopened = RecipeStorage(data_dir=str(tmp_path))
+    assert reopened.count() == 2 and reopened.get_recipe("a") is not None
+    reopened.close()
+